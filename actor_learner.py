@@ -0,0 +1,291 @@
+# actor_learner.py
+# アクター / ラーナー分割の Q学習
+#
+# train_rl.worker は各プロセスが「行動を選ぶ（アクター）」と「Qテーブルを更新する（ラーナー）」を兼ね、
+# 1つの Manager.dict をロック付きで取り合う。ここでは役割を分ける。
+# - アクター: 手元のQテーブルのコピー（読み取り専用）で GameEnv を動かし、1エピソード分の遷移をまとめてラーナーへ送る
+# - ラーナー: Qテーブル（q_kernel.StateIndex）を1つだけ持ち、届いた遷移を td_update でまとめて反映する。
+#   返信のときに、そのアクターが前回受け取ってから sync_every 回以上更新があれば、変わった行だけ（差分）を返す
+# 通信は multiprocessing.connection（TCPソケット）なので、アクターは別マシンからでも接続できる。
+# 送信 → 返信待ちの1往復ずつにしているので、双方が送信でブロックして詰まることはない。
+#
+# 受け取ったメッセージは pickle から復元するので、認証キーを知っている相手はラーナー・アクター上で任意のコードを実行できる。
+# - 認証キーは固定値を持たない。--serve / --connect では --authkey か環境変数 NAV_RL_AUTHKEY で必ず指定する
+#   （同じマシンだけで動かす run_local は実行ごとに乱数のキーを作る）
+# - 待ち受けは localhost（既定）か、信頼できるネットワーク内のアドレスだけにする。インターネットに公開しない
+#   python actor_learner.py --actors 16 --episodes 200                                      # 同じマシンでラーナー + アクター16個
+#   NAV_RL_AUTHKEY=... python actor_learner.py --serve --actors 32 --host 192.168.0.10      # ラーナーだけ起動（アクターの接続を待つ）
+#   NAV_RL_AUTHKEY=... python actor_learner.py --connect 192.168.0.10:6000 --actor-id 0     # 別マシンからアクターとして参加
+import argparse
+import contextlib
+import multiprocessing as mp
+import os
+import random
+import time
+from multiprocessing.connection import Client, Listener, wait
+
+import numpy as np
+
+from curriculum import REWARD_PARAMS
+from episode_stats import EpisodeStats
+from q_kernel import StateIndex, td_update
+from rl_env import GameEnv
+from kinematics import ActionTable
+from train_rl import ACTION_SET, QAgent, improved_reward, save_q_table
+
+DEFAULT_ADDRESS = ("localhost", 6000)
+AUTHKEY_ENV = "NAV_RL_AUTHKEY"  # 認証キーを渡す環境変数（--authkey を省略したとき）
+
+
+def _check_authkey(authkey):
+    # 認証キーは呼び出し側が必ず渡す（既定値は持たない）
+    if not authkey:
+        raise ValueError(f"認証キー（authkey）を指定してください（--authkey または環境変数 {AUTHKEY_ENV}）")
+    return authkey.encode() if isinstance(authkey, str) else bytes(authkey)
+
+
+def _connect(address, authkey, timeout=60.0):
+    # ラーナーがまだ待ち受けを始めていなければ少し待ってから繋ぎ直す
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return Client(address, authkey=authkey)
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def actor(actor_id, address, episodes, max_steps=200, reward_params=None, action_set=ACTION_SET,
+          mode="Step_1", mode_weights=None, lidar=None, authkey=None):
+    """
+    - ラーナーに接続し、最初にQテーブル全体を受け取ってから episodes エピソード走らせる
+    - reward_params: improved_reward の係数（None なら curriculum.REWARD_PARAMS。ほかの学習と同じ報酬にする）
+    - authkey: ラーナーと同じ認証キー（必須）
+    - 1エピソードごとに ("batch", 丸めた状態, 行動, 報酬, 丸めた次状態, done, エピソード記録) を送り、
+      返信（"ack" または差分 "delta"）を待つ
+    - 状態の丸め（QAgent.to_key と同じ）はアクター側で行い、ラーナーの負荷を減らす
+    """
+    authkey = _check_authkey(authkey)
+    random.seed(actor_id)
+    np.random.seed(actor_id)
+    if reward_params is None:
+        reward_params = REWARD_PARAMS
+
+    def reward_fn(env, state, done):
+        return improved_reward(env, state, done, **reward_params)
+
+    conn = _connect(address, authkey)
+    local_q = {}
+    agent = QAgent(action_set, local_q, contextlib.nullcontext())
+    env = GameEnv(reward_fn=reward_fn, action_table=ActionTable(action_set), mode=mode,
+                  mode_weights=mode_weights, lidar=lidar)
+    try:
+        _apply_message(local_q, conn.recv())
+        goal_count = 0
+        for ep in range(episodes):
+            ep_start = time.time()
+            state = env.reset()
+            states, actions, rewards, next_states, dones = [], [], [], [], []
+            outcome = "timeout"
+            for step in range(max_steps):
+                action = agent.select_action_index(state, eval_mode=False, episode=ep)
+                next_state, reward, done, info = env.step(action)
+                states.append(state.copy())
+                actions.append(action)
+                rewards.append(reward)
+                next_states.append(next_state.copy())
+                dones.append(done)
+                state = next_state
+                if done:
+                    outcome = "goal" if env.game.check_goal() else "collision"
+                    goal_count += outcome == "goal"
+                    break
+            record = (actor_id, ep, float(sum(rewards)), len(rewards), outcome, time.time() - ep_start)
+            conn.send((
+                "batch",
+                np.round(np.asarray(states, dtype=np.float64), 1),
+                np.asarray(actions, dtype=np.int64),
+                np.asarray(rewards, dtype=np.float64),
+                np.round(np.asarray(next_states, dtype=np.float64), 1),
+                np.asarray(dones, dtype=bool),
+                record,
+            ))
+            _apply_message(local_q, conn.recv())
+        conn.send(("done", actor_id, goal_count))
+    finally:
+        conn.close()
+
+
+def _apply_message(local_q, msg):
+    # ラーナーからの返信を手元のQテーブルに反映
+    if msg[0] == "delta":
+        _, keys, rows = msg
+        local_q.update(zip(keys, rows))
+
+
+def _local_actor(actor_id, address, episodes, kwargs):
+    # mp.Process から呼ぶ用（Ctrl+C はラーナー側で処理するので、アクターは黙って終わる）
+    try:
+        actor(actor_id, address, episodes, **kwargs)
+    except (KeyboardInterrupt, EOFError, ConnectionError):
+        pass
+
+
+class Learner:
+    """
+    - Qテーブル本体（StateIndex）と、行ごとの最終更新番号を持つ
+    - apply(): 遷移をまとめて反映、delta_for(): あるアクターが前回同期してから変わった行
+    """
+    def __init__(self, n_actions, alpha=0.1, gamma=0.99, sync_every=1, q_table=None):
+        self.index = StateIndex(n_actions)
+        self.alpha = alpha
+        self.gamma = gamma
+        self.sync_every = sync_every
+        self.version = 0  # 反映したバッチ数
+        self.row_version = np.zeros(len(self.index._q), dtype=np.int64)
+        self.synced = {}  # アクターID -> 最後に差分を送った時点の version
+        if q_table:
+            keys = list(q_table.keys())
+            ids = self.index.lookup(keys)
+            self.index.q[ids] = [q_table[k] for k in keys]
+            self._grow()
+
+    def _grow(self):
+        if len(self.row_version) < len(self.index._q):
+            grown = np.zeros(len(self.index._q), dtype=np.int64)
+            grown[:len(self.row_version)] = self.row_version
+            self.row_version = grown
+
+    def apply(self, states, actions, rewards, next_states, dones):
+        s = self.index.lookup([tuple(row) for row in states])
+        s2 = self.index.lookup([tuple(row) for row in next_states])
+        self._grow()
+        discounts = self.gamma * (1.0 - dones.astype(np.float64))
+        td = td_update(self.index.q, s, actions, rewards, s2, discounts, alpha=self.alpha)
+        self.version += 1
+        self.row_version[np.unique(s)] = self.version
+        return td
+
+    def snapshot(self, actor_id):
+        # 接続直後のアクターに全行を送る
+        self.synced[actor_id] = self.version
+        return ("delta", list(self.index.keys), self.index.q.copy())
+
+    def delta_for(self, actor_id):
+        last = self.synced.get(actor_id, 0)
+        if self.version - last < self.sync_every:
+            return ("ack",)
+        n = len(self.index)
+        sids = np.flatnonzero(self.row_version[:n] > last)
+        self.synced[actor_id] = self.version
+        return ("delta", [self.index.keys[i] for i in sids], self.index.q[sids].copy())
+
+    def q_table(self):
+        # save_q_table / QAgent で使える普通の辞書（値は list）
+        return {key: row.tolist() for key, row in zip(self.index.keys, self.index.q)}
+
+
+def serve(n_actors, address=DEFAULT_ADDRESS, authkey=None, alpha=0.1, gamma=0.99, sync_every=1,
+          q_table=None, action_set=ACTION_SET, save_path=None, report_every=10.0):
+    """
+    - n_actors 個のアクターの接続を待ち、全員が "done" を送るまで遷移を受け取って学習する
+    - authkey: 認証キー（必須）。address は localhost か信頼できるネットワーク内のアドレスにする
+    - 戻り値: (Qテーブルの辞書, EpisodeStats)
+    """
+    authkey = _check_authkey(authkey)
+    learner = Learner(len(action_set), alpha=alpha, gamma=gamma, sync_every=sync_every, q_table=q_table)
+    stats = EpisodeStats()
+    conns = {}
+    with Listener(address, authkey=authkey) as listener:
+        print(f"[learner] {listener.address} で {n_actors} 個のアクターを待っています")
+        for actor_id in range(n_actors):
+            conn = listener.accept()
+            conn.send(learner.snapshot(actor_id))
+            conns[conn] = actor_id
+
+    goal_count_total = 0
+    last_report = time.time()
+    try:
+        while conns:
+            for conn in wait(list(conns), timeout=1.0):
+                actor_id = conns[conn]
+                try:
+                    msg = conn.recv()
+                except EOFError:
+                    # アクターが途中で落ちた（別マシンの切断など）
+                    print(f"[learner] actor {actor_id} との接続が切れました")
+                    del conns[conn]
+                    continue
+                if msg[0] == "batch":
+                    _, states, actions, rewards, next_states, dones, record = msg
+                    learner.apply(states, actions, rewards, next_states, dones)
+                    stats.add(record)
+                    conn.send(learner.delta_for(actor_id))
+                elif msg[0] == "done":
+                    goal_count_total += msg[2]
+                    conn.close()
+                    del conns[conn]
+            if time.time() - last_report >= report_every:
+                print(f"[learner] {stats.summary()} 状態数={len(learner.index)}")
+                last_report = time.time()
+    except KeyboardInterrupt:
+        print("\n[Ctrl+C] 中断されました。ここまでのQテーブルを保存します。")
+    finally:
+        for conn in conns:
+            conn.close()
+        q_table = learner.q_table()
+        if save_path:
+            save_q_table(q_table, save_path)
+    print(f"[learner] {stats.summary()} 状態数={len(learner.index)} ゴール合計={goal_count_total}")
+    return q_table, stats
+
+
+def run_local(n_actors=16, episodes=100, address=DEFAULT_ADDRESS, save_path=None, sync_every=1, authkey=None,
+              **actor_kwargs):
+    # 同じマシンでラーナー（このプロセス）とアクター（子プロセス）をまとめて起動する
+    # 認証キーを渡さなければ、この実行だけで使う乱数のキーを作ってアクターにも渡す
+    actor_kwargs["authkey"] = _check_authkey(authkey) if authkey else os.urandom(32)
+    procs = [
+        mp.Process(target=_local_actor, args=(i, address, episodes, actor_kwargs))
+        for i in range(n_actors)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        return serve(n_actors, address, authkey=actor_kwargs["authkey"], sync_every=sync_every, save_path=save_path,
+                     action_set=actor_kwargs.get("action_set", ACTION_SET))
+    finally:
+        for p in procs:
+            p.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="アクター/ラーナー分割のQ学習")
+    parser.add_argument("--actors", type=int, default=mp.cpu_count(), help="アクター数")
+    parser.add_argument("--episodes", type=int, default=100, help="アクター1つあたりのエピソード数")
+    parser.add_argument("--max-steps", type=int, default=200)
+    parser.add_argument("--mode", default="Step_1")
+    parser.add_argument("--host", default=DEFAULT_ADDRESS[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1])
+    parser.add_argument("--sync-every", type=int, default=1, help="何バッチごとに差分を返すか")
+    parser.add_argument("--save", default="q_tables/actor_learner.pkl")
+    parser.add_argument("--serve", action="store_true", help="ラーナーだけ起動する")
+    parser.add_argument("--connect", default=None, help="host:port のラーナーにアクターとして接続する")
+    parser.add_argument("--actor-id", type=int, default=0)
+    parser.add_argument("--authkey", default=None,
+                        help=f"接続の認証キー（省略時は環境変数 {AUTHKEY_ENV}）。--serve / --connect では必須")
+    args = parser.parse_args()
+    authkey = args.authkey or os.environ.get(AUTHKEY_ENV)
+    if (args.serve or args.connect) and not authkey:
+        parser.error(f"--serve / --connect には --authkey か環境変数 {AUTHKEY_ENV} で認証キーを指定してください")
+
+    if args.connect:
+        host, port = args.connect.rsplit(":", 1)
+        actor(args.actor_id, (host, int(port)), args.episodes, max_steps=args.max_steps, mode=args.mode,
+              reward_params=REWARD_PARAMS, authkey=authkey)
+    elif args.serve:
+        serve(args.actors, (args.host, args.port), authkey=authkey, sync_every=args.sync_every, save_path=args.save)
+    else:
+        run_local(args.actors, args.episodes, (args.host, args.port), save_path=args.save, authkey=authkey,
+                  sync_every=args.sync_every, max_steps=args.max_steps, mode=args.mode, reward_params=REWARD_PARAMS)
@@ -0,0 +1,166 @@
+# ann_index.py
+# 訪問済みの状態の近傍探索（LSH）で、Qテーブルにない状態の Q値を近い状態から補う
+#
+# QAgent は丸めたキーがテーブルになければランダム行動になる。ここでは学習で更新した状態を
+# 次元を落とした特徴（ゴール距離・方向差・LiDAR のセクター平均）にして LSH の索引に順に追加しておき、
+# 未知の状態では近い k 個の訪問済み状態の Q値を距離で重み付けした平均を使う。
+# - 索引は p-stable LSH（ランダム射影 a·x + b を幅 w で区切ったバケット）を n_tables 個。追加は O(n_tables)
+# - 検索はバケットごとに新しい方から max_candidates // n_tables 個までしか見ないので、状態数が増えても数十µsで終わる
+# - キーは QAgent.to_key と同じ丸めの int16（値×10）で持ち、引くときだけタプルに戻す（タプルを溜めるより1桁小さい）
+#   agent = QAgent(ACTION_SET, shared_q_table, lock, fallback=NeighborFallback(k=5))
+#   # 以降 agent.update で状態が索引に入り、select_action_index の未知の状態で近傍の Q値が使われる
+import numpy as np
+
+KEY_SCALE = 10  # QAgent.to_key の丸め（小数1桁）に合わせた倍率
+
+
+class LSHIndex:
+    """
+    - dim 次元のベクトルを順に追加して、近いものを k 個探す（近似）
+    - n_tables 個のハッシュ表それぞれで n_projections 本のランダム射影を bucket_width 幅で区切ったものがバケットのキー
+    - 検索の候補は全表のバケットの和集合（表ごとに新しい方から max_candidates // n_tables 個まで）で、候補の中は正確な距離で並べる
+    """
+    def __init__(self, dim, n_tables=8, n_projections=4, bucket_width=0.5, max_candidates=64, capacity=4096, seed=0):
+        rng = np.random.default_rng(seed)
+        self.dim = dim
+        self.n_tables = n_tables
+        self.n_projections = n_projections
+        self.bucket_width = bucket_width
+        self.per_table = max(1, max_candidates // n_tables)
+        self.projections = rng.normal(size=(n_tables * n_projections, dim)).astype(np.float32)
+        self.offsets = rng.uniform(0, bucket_width, size=n_tables * n_projections).astype(np.float32)
+        self.buckets = [{} for _ in range(n_tables)]
+        self._points = np.zeros((capacity, dim), dtype=np.float32)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def points(self):
+        return self._points[:self.n]
+
+    def _hash(self, x):
+        # 表ごとのバケットのキー（bytes）
+        h = np.floor((self.projections @ x + self.offsets) / self.bucket_width).astype(np.int32)
+        return [row.tobytes() for row in h.reshape(self.n_tables, self.n_projections)]
+
+    def add(self, x):
+        # 戻り値: 追加した点の番号（0, 1, 2, ...）
+        if self.n == len(self._points):
+            points = np.zeros((2 * len(self._points), self.dim), dtype=np.float32)
+            points[:self.n] = self._points
+            self._points = points
+        i = self.n
+        self._points[i] = x
+        self.n += 1
+        for bucket, h in zip(self.buckets, self._hash(self._points[i])):
+            bucket.setdefault(h, []).append(i)
+        return i
+
+    def query(self, x, k=5):
+        """
+        - x に近い（と思われる）点を最大 k 個
+        - 戻り値: (点の番号, ユークリッド距離)。距離の近い順
+        """
+        x = np.asarray(x, dtype=np.float32)
+        candidates = []
+        for bucket, h in zip(self.buckets, self._hash(x)):
+            ids = bucket.get(h)
+            if ids:
+                candidates.extend(ids[-self.per_table:])
+        if not candidates:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids = np.fromiter(set(candidates), dtype=np.int64)
+        diff = self._points[ids] - x
+        dist = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        if len(ids) > k:
+            top = np.argpartition(dist, k)[:k]
+            ids, dist = ids[top], dist[top]
+        order = np.argsort(dist)
+        return ids[order], dist[order]
+
+
+class NeighborFallback:
+    """
+    - QAgent の fallback（Qテーブルにない状態の Q値を返すもの）。QAgent からは次の2つだけを呼ぶ
+      add(key): 更新した状態のキーを索引に入れる（同じキーは1回だけ）
+      q_values(agent, state): 近い k 個の訪問済み状態のうち、距離が max_distance 以内でテーブルにあるものの
+      Q値を 1 / (距離 + eps) で重み付けした平均。見つからなければ None
+    - 特徴: [ゴール距離, 方向差, LiDAR の sectors 個のセクター平均 × lidar_weight]（状態ベクトルの並びは rl_env.GameEnv.get_state）
+    - n_queries / n_hits: 問い合わせ回数 / Q値を返せた回数
+    """
+    def __init__(self, k=5, max_distance=0.3, sectors=16, lidar_weight=1.0, eps=1e-3, **index_kwargs):
+        self.k = k
+        self.max_distance = max_distance
+        self.sectors = sectors
+        self.lidar_weight = lidar_weight
+        self.eps = eps
+        self.index = LSHIndex(2 + sectors, **index_kwargs)
+        self._sectors = {}
+        self.ids = {}  # 丸めたキーの bytes -> 索引の点の番号
+        self._codes = None  # 点の番号 -> 丸めたキー（int16、値×10）
+        self.n_queries = 0
+        self.n_hits = 0
+
+    def features(self, state):
+        state = np.asarray(state, dtype=np.float32)
+        lidar = state[2:]
+        sectors = self._sectors.get(len(lidar))
+        if sectors is None:
+            # セクターの区切りと、平均に掛ける係数（ビーム数ごとに1回だけ作る）
+            starts = np.linspace(0, len(lidar), self.sectors, endpoint=False).astype(np.int64)
+            counts = np.diff(np.r_[starts, len(lidar)])
+            sectors = self._sectors[len(lidar)] = (starts, (self.lidar_weight / np.maximum(counts, 1)).astype(np.float32))
+        starts, scale = sectors
+        out = np.empty(2 + self.sectors, dtype=np.float32)
+        out[:2] = state[:2]
+        np.multiply(np.add.reduceat(lidar, starts), scale, out=out[2:])
+        return out
+
+    def add(self, key):
+        code = np.rint(np.asarray(key, dtype=np.float64) * KEY_SCALE).astype(np.int16)
+        b = code.tobytes()
+        if b in self.ids:
+            return
+        i = self.index.add(self.features(code.astype(np.float64) / KEY_SCALE))
+        self.ids[b] = i
+        if self._codes is None:
+            self._codes = np.zeros((1024, len(code)), dtype=np.int16)
+        elif i == len(self._codes):
+            codes = np.zeros((2 * len(self._codes), self._codes.shape[1]), dtype=np.int16)
+            codes[:i] = self._codes
+            self._codes = codes
+        self._codes[i] = code
+
+    def key_of(self, i):
+        # 点の番号 → QAgent.to_key と同じタプル（np.round(x, 1) は rint(x * 10) / 10 なので一致する）
+        return tuple(self._codes[i].astype(np.float64) / KEY_SCALE)
+
+    def q_values(self, agent, state):
+        self.n_queries += 1
+        ids, dist = self.index.query(self.features(state), self.k)
+        near = dist <= self.max_distance
+        ids, dist = ids[near], dist[near]
+        if len(ids) == 0:
+            return None
+        keys = [self.key_of(i) for i in ids]
+        with agent.lock:
+            rows = [agent.q_table.get(key) for key in keys]
+        found = [j for j, row in enumerate(rows) if row is not None]
+        if not found:
+            return None
+        w = 1.0 / (dist[found] + self.eps)
+        q = np.asarray([rows[j] for j in found], dtype=np.float64)
+        self.n_hits += 1
+        return w @ q / w.sum()
+
+    def nbytes(self):
+        # 索引の点・キーの配列（確保済みの分）
+        codes = 0 if self._codes is None else self._codes.nbytes
+        return self.index._points.nbytes + codes
+
+    def summary(self):
+        rate = self.n_hits / self.n_queries if self.n_queries else 0.0
+        return (f"近傍補完: 索引={len(self.index)} 問い合わせ={self.n_queries} 補完={self.n_hits} ({rate:.1%}) "
+                f"メモリ={self.nbytes() / 1e6:.1f}MB")
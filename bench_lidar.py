@@ -0,0 +1,82 @@
+# bench_lidar.py
+# LiDARのビーム本数・サンプリング間隔ごとのコスト計測（カリキュラム初期に低ビーム設定を選ぶ目安）
+#
+# 同じマップ・同じ姿勢の列で get_lidar_distances と GameEnv.step の時間を測り、既定（91本）との比を表示する。
+#   python bench_lidar.py --mode Step_2 --beams 91 46 31 19 11 7 --calls 300
+import argparse
+import random
+import time
+
+import numpy as np
+
+from game_simulator import GAME_WIDTH, GAME_HEIGHT, LIDAR_SAMPLE_STEP, LidarConfig
+from rl_env import GameEnv
+
+
+def make_poses(n, seed=0, margin=50):
+    # 計測に使う姿勢の列（全設定で同じものを使う）
+    rng = random.Random(seed)
+    return [
+        (rng.uniform(margin, GAME_WIDTH - margin), rng.uniform(margin, GAME_HEIGHT - margin), rng.uniform(0, 360))
+        for _ in range(n)
+    ]
+
+
+def bench_config(cfg, mode, poses, steps, seed=0):
+    """
+    - 戻り値: (LiDAR 1回あたり[ms], env.step 1回あたり[ms])
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    env = GameEnv(mode=mode, lidar=cfg)
+    env.reset()
+    game = env.game
+    robot = game.robot
+    out = np.zeros(cfg.n_beams, dtype=np.float32)
+
+    start = time.perf_counter()
+    for x, y, angle in poses:
+        robot.x, robot.y, robot.angle = x, y, angle
+        game.get_lidar_distances(out=out)
+    lidar_ms = (time.perf_counter() - start) / len(poses) * 1000
+
+    env.reset()
+    n = 0
+    start = time.perf_counter()
+    while n < steps:
+        _, _, done, _ = env.step(random.randrange(len(env.action_table)))
+        n += 1
+        if done:
+            env.reset()
+    step_ms = (time.perf_counter() - start) / steps * 1000
+    return lidar_ms, step_ms
+
+
+def run_bench(mode="Step_2", beams=(91, 46, 31, 19, 11, 7), sample_steps=(LIDAR_SAMPLE_STEP,), calls=300, steps=300, seed=0):
+    poses = make_poses(calls, seed)
+    rows = []
+    for sample_step in sample_steps:
+        for n_beams in beams:
+            cfg = LidarConfig(n_beams=n_beams, sample_step=sample_step)
+            lidar_ms, step_ms = bench_config(cfg, mode, poses, steps, seed)
+            rows.append((n_beams, sample_step, lidar_ms, step_ms))
+
+    base = rows[0][2]
+    print(f"mode={mode}, 姿勢={calls}, ステップ={steps}")
+    print(f"{'beams':>6}{'間隔[px]':>10}{'LiDAR[ms]':>12}{'step[ms]':>12}{'比':>8}")
+    for n_beams, sample_step, lidar_ms, step_ms in rows:
+        print(f"{n_beams:>6}{sample_step:>10}{lidar_ms:>12.3f}{step_ms:>12.3f}{lidar_ms / base:>8.2f}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LiDARのビーム本数ごとのコスト計測")
+    parser.add_argument("--mode", default="Step_2")
+    parser.add_argument("--beams", nargs="+", type=int, default=[91, 46, 31, 19, 11, 7])
+    parser.add_argument("--sample-steps", nargs="+", type=int, default=[LIDAR_SAMPLE_STEP])
+    parser.add_argument("--calls", type=int, default=300, help="LiDAR単体の計測回数")
+    parser.add_argument("--steps", type=int, default=300, help="env.step の計測回数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run_bench(args.mode, args.beams, args.sample_steps, args.calls, args.steps, args.seed)
@@ -0,0 +1,134 @@
+# curriculum.py
+# Step_0 → Step_8 のカリキュラム学習（Qテーブルを引き継いだまま自動で次のStepへ進む）
+#
+# - 各ステージは grid_search と同じく worker を N_PROCS 並列で走らせ、共有Qテーブルを更新する
+# - 共有Qテーブル（Manager.dict）はカリキュラム全体で1つ。ステージが変わっても作り直さない
+# - ラウンドごとに evaluate.py で貪欲方策の成功率を測り、しきい値を超えたら次のステージへ
+# - 過去のステージのマップも一定割合で混ぜて、前の Step を忘れないようにする
+#   python curriculum.py
+import multiprocessing as mp
+import os
+import signal
+import sys
+
+from episode_stats import EpisodeStats, collect
+from evaluate import evaluate, print_report
+from train_rl import ACTION_SET, worker, save_q_table
+
+STEPS = [f"Step_{i}" for i in range(9)]
+
+# 報酬係数（grid_search の現在のベスト）
+REWARD_PARAMS = dict(
+    angle_bonus=30, angle_penalty=-35, step_penalty=-0.05,
+    forward_bonus=0, backward_penalty=0, obstacle_avoid_bonus=0,
+    goal_reward=100, goal_margin=30,
+)
+
+
+def stage_modes(stage, replay_ratio=0.2):
+    """
+    - ステージ stage で使うモードと比率
+    - 現在のStepを (1 - replay_ratio)、それ以前のStepを合計 replay_ratio で均等に混ぜる
+    """
+    if stage == 0 or replay_ratio <= 0:
+        return [STEPS[stage]], None
+    modes = STEPS[:stage + 1]
+    weights = [replay_ratio / stage] * stage + [1.0 - replay_ratio]
+    return modes, weights
+
+
+def run_round(shared_q_table, lock, modes, weights, episodes_per_proc, max_steps, n_procs, seed_base, episode_offset, lidar=None):
+    # 1ラウンド分の worker を並列実行し、ゴール回数の合計を返す
+    stats_queue = mp.Queue()
+    stats = EpisodeStats()
+    procs = []
+    for j in range(n_procs):
+        p = mp.Process(
+            target=worker,
+            args=(
+                seed_base + j, ACTION_SET, episodes_per_proc, max_steps, stats_queue,
+                lock, shared_q_table,
+                REWARD_PARAMS["angle_bonus"], REWARD_PARAMS["angle_penalty"], REWARD_PARAMS["step_penalty"],
+                REWARD_PARAMS["forward_bonus"], REWARD_PARAMS["backward_penalty"], REWARD_PARAMS["obstacle_avoid_bonus"],
+                REWARD_PARAMS["goal_reward"], REWARD_PARAMS["goal_margin"],
+            ),
+            kwargs=dict(mode=modes, mode_weights=weights, episode_offset=episode_offset, lidar=lidar),
+        )
+        procs.append(p)
+        p.start()
+    goal_count_total = collect(stats_queue, n_procs, stats, procs=procs)
+    for p in procs:
+        p.join()
+    print(f"[train] {stats.summary()}")
+    return goal_count_total
+
+
+def run_curriculum(
+    start_stage=0, end_stage=8, success_threshold=0.6, max_rounds_per_stage=20,
+    n_procs=13, episodes_per_round=130, max_steps=200, eval_scenarios=50,
+    replay_ratio=0.2, checkpoint_dir="q_tables/curriculum", lidar=None,
+):
+    """
+    - start_stage～end_stage を順番に学習
+    - 各ラウンドの後、現在のStepを eval_scenarios 個の固定シナリオで評価し、
+      成功率が success_threshold 以上なら次のStepへ
+    - max_rounds_per_stage ラウンドで届かなければ警告を出して次へ進む（無人で最後まで回す）
+    - lidar: LidarConfig（学習・評価とも同じ設定を使う）。ビーム数が違うと状態が別物になり
+      Qテーブルを引き継げないので、カリキュラムの途中では変えない
+    - 戻り値: (Qテーブル, ステージごとの評価結果のリスト)
+    """
+    episodes_per_proc = episodes_per_round // n_procs
+
+    manager = mp.Manager()
+    shared_q_table = manager.dict()
+    lock = manager.Lock()
+    history = []
+    main_pid = os.getpid()
+
+    # Ctrl+Cハンドラ（ここまでのQテーブルを保存して終了、ワーカーは何もせず終了）
+    def signal_handler(sig, frame):
+        if os.getpid() != main_pid:
+            sys.exit(0)
+        print("\n[Ctrl+C] 中断されました。ここまでのQテーブルを保存します。")
+        save_q_table(shared_q_table, os.path.join(checkpoint_dir, "interrupted.pkl"))
+        sys.exit(0)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    total_rounds = 0
+    for stage in range(start_stage, end_stage + 1):
+        modes, weights = stage_modes(stage, replay_ratio)
+        print(f"\n===== {STEPS[stage]} 開始（モード: {modes}, 比率: {weights}）=====")
+        for rnd in range(max_rounds_per_stage):
+            goal_count = run_round(
+                shared_q_table, lock, modes, weights, episodes_per_proc, max_steps, n_procs,
+                seed_base=total_rounds * n_procs,
+                episode_offset=rnd * episodes_per_proc, lidar=lidar,
+            )
+            total_rounds += 1
+
+            report = evaluate(
+                shared_q_table, modes=(STEPS[stage],), n_scenarios=eval_scenarios,
+                max_steps=max_steps, n_procs=n_procs, lidar=lidar,
+            )
+            success_rate = report[STEPS[stage]]["success_rate"]
+            print(
+                f"[{STEPS[stage]} round {rnd+1}] 学習中の成功回数: {goal_count} / {episodes_per_proc * n_procs}, "
+                f"評価成功率: {success_rate:.2%}, Qテーブル状態数: {len(shared_q_table)}"
+            )
+            if success_rate >= success_threshold:
+                break
+        else:
+            print(f"⚠ {STEPS[stage]} は {max_rounds_per_stage} ラウンドで成功率 {success_threshold:.0%} に届きませんでした。次へ進みます。")
+
+        print_report(report)
+        history.append((STEPS[stage], rnd + 1, report[STEPS[stage]]))
+        save_q_table(shared_q_table, os.path.join(checkpoint_dir, f"{STEPS[stage]}.pkl"))
+
+    print("\n==== カリキュラム結果 ====")
+    for step, rounds, r in history:
+        print(f"{step}: {rounds}ラウンド, 評価成功率={r['success_rate']:.2%}")
+    return shared_q_table.copy(), history
+
+
+if __name__ == "__main__":
+    run_curriculum()
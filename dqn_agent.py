@@ -0,0 +1,264 @@
+# dqn_agent.py
+# 関数近似（MLP）による Q関数。表形式の QAgent の代わりに使える DQN エージェント
+#
+# QAgent は丸めた状態ベクトル（93次元）をそのままキーにするので、似た状態でも別々に学習が必要で、
+# 状態数に比例してメモリも訪問回数も増える。ここでは同じ状態ベクトルを MLP に入れて全行動の Q値を一度に出す。
+# - select_action / select_action_index / update は QAgent と同じ呼び方（evaluate.run_scenario にもそのまま渡せる）
+# - select_action_indices: ベクトル環境の全状態をまとめて1回の forward で行動選択
+# - update: 遷移を内部の ReplayBuffer に入れ、train_every 回ごとにミニバッチで学習
+# - update_batch: 渡された遷移のミニバッチで1回学習（外部のリプレイバッファ用、TD誤差を返す）
+#   python dqn_agent.py --envs 8 --steps 200000 --mode Step_1
+import argparse
+import copy
+import functools
+import os
+import random
+import time
+
+import numpy as np
+import torch
+from torch import nn
+
+from episode_stats import EpisodeStats
+from kinematics import ACTION_SET
+from nav_gym import make_vector_env
+from replay_buffer import ReplayBuffer
+from rl_env import OBS_DIM
+from train_rl import improved_reward
+
+
+class QNetwork(nn.Module):
+    def __init__(self, obs_dim, n_actions, hidden=(128, 128)):
+        super().__init__()
+        layers = []
+        last = obs_dim
+        for h in hidden:
+            layers += [nn.Linear(last, h), nn.ReLU()]
+            last = h
+        layers.append(nn.Linear(last, n_actions))
+        self.net = nn.Sequential(*layers)
+
+    def forward(self, x):
+        return self.net(x)
+
+
+class DQNAgent:
+    def __init__(self, action_set=ACTION_SET, obs_dim=OBS_DIM, hidden=(128, 128), lr=1e-3, gamma=0.99,
+                 batch_size=64, replay_capacity=100_000, train_every=1, target_update=1000,
+                 double=True, prioritized=False, num_threads=None, seed=0):
+        """
+        - hidden: 隠れ層のユニット数
+        - target_update: 何回の学習ごとにターゲットネットワークを同期するか
+        - double: Double DQN（行動の選択はオンライン、評価はターゲット）
+        - prioritized: 内部のリプレイバッファから優先度付きでサンプリング
+        - num_threads: torch の CPU スレッド数（並列ワーカーと併用するときは1にする）
+        """
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        torch.manual_seed(seed)
+        self.action_set = action_set
+        self.n_actions = len(action_set)
+        self.action_index = {a: i for i, a in enumerate(action_set)}
+        self.gamma = gamma
+        self.batch_size = batch_size
+        self.train_every = train_every
+        self.target_update = target_update
+        self.double = double
+        self.prioritized = prioritized
+
+        self.q_net = QNetwork(obs_dim, self.n_actions, hidden)
+        self.target_net = copy.deepcopy(self.q_net)
+        self.target_net.requires_grad_(False)
+        self.optimizer = torch.optim.Adam(self.q_net.parameters(), lr=lr)
+        self.replay = ReplayBuffer(replay_capacity, lidar_dim=obs_dim - 2)
+        self.n_updates = 0
+        self.n_steps = 0
+
+    @staticmethod
+    def epsilon(episode):
+        # 探索率（QAgent と同じスケジュール）
+        return max(0.02, 0.5 * (0.99 ** episode))
+
+    def to_action_index(self, action):
+        if isinstance(action, (int, np.integer)):
+            return int(action)
+        return self.action_index[action]
+
+    @torch.no_grad()
+    def q_values(self, states):
+        # (N, obs_dim) → (N, n_actions)
+        x = torch.as_tensor(np.asarray(states, dtype=np.float32))
+        return self.q_net(x).numpy()
+
+    def select_action(self, state, eval_mode=False, episode=0):
+        return self.action_set[self.select_action_index(state, eval_mode=eval_mode, episode=episode)]
+
+    def select_action_index(self, state, eval_mode=False, episode=0):
+        if not eval_mode and random.random() < self.epsilon(episode):
+            return random.randrange(self.n_actions)
+        return int(self.q_values(np.asarray(state)[None])[0].argmax())
+
+    def select_action_indices(self, states, eval_mode=False, episodes=0):
+        """
+        - 複数の状態の行動をまとめて選ぶ（forward は1回）
+        - episodes: 環境ごとのエピソード番号（配列またはスカラー）。探索率に使う
+        """
+        greedy = self.q_values(states).argmax(axis=1)
+        if eval_mode:
+            return greedy
+        n = len(greedy)
+        eps = np.maximum(0.02, 0.5 * (0.99 ** np.broadcast_to(np.asarray(episodes, dtype=np.float64), (n,))))
+        explore = np.random.random(n) < eps
+        greedy[explore] = np.random.randint(0, self.n_actions, explore.sum())
+        return greedy
+
+    def update(self, state, action, reward, next_state, alpha=None, gamma=None, done=False):
+        """
+        - 遷移を内部のリプレイバッファに入れ、train_every 回ごとにミニバッチで1回学習
+        - alpha は QAgent との互換用（学習率は lr で指定）
+        - 戻り値: 学習した場合はそのミニバッチの損失、しなかった場合は None
+        """
+        self.replay.add(state, self.to_action_index(action), reward, next_state, done)
+        return self._maybe_train(1, gamma)
+
+    def update_many(self, states, action_idx, rewards, next_states, dones, gamma=None):
+        # ベクトル環境の1ステップ分（N遷移）をまとめて内部のバッファに入れて学習
+        self.replay.add_batch(states, action_idx, rewards, next_states, dones)
+        return self._maybe_train(len(states), gamma)
+
+    def _maybe_train(self, n_new, gamma):
+        prev = self.n_steps
+        self.n_steps += n_new
+        if len(self.replay) < self.batch_size:
+            return None
+        loss = None
+        for _ in range(self.n_steps // self.train_every - prev // self.train_every):
+            s, a, r, s2, d, idx, w = self.replay.sample(self.batch_size, prioritized=self.prioritized)
+            td, loss = self._train_step(s, a, r, s2, d, w, gamma)
+            if self.prioritized:
+                self.replay.update_priorities(idx, td)
+        return loss
+
+    def update_batch(self, states, action_idx, rewards, next_states, dones=None,
+                     alpha=None, gamma=None, discounts=None, weights=None):
+        """
+        - 渡された遷移で1回学習する（QAgent.update_batch と同じ引数）
+        - discounts を渡すと gamma * (1 - done) の代わりに使う（nステップ収益用）
+        - 戻り値: 各遷移のTD誤差（優先度の更新用）
+        """
+        n = len(states)
+        dones = np.zeros(n, dtype=bool) if dones is None else np.asarray(dones)
+        td, _ = self._train_step(states, action_idx, rewards, next_states, dones, weights, gamma, discounts)
+        return td
+
+    def _train_step(self, states, actions, rewards, next_states, dones, weights=None, gamma=None, discounts=None):
+        gamma = self.gamma if gamma is None else gamma
+        s = torch.as_tensor(np.asarray(states, dtype=np.float32))
+        s2 = torch.as_tensor(np.asarray(next_states, dtype=np.float32))
+        a = torch.as_tensor(np.asarray(actions, dtype=np.int64))
+        r = torch.as_tensor(np.asarray(rewards, dtype=np.float32))
+        if discounts is None:
+            disc = gamma * (1.0 - torch.as_tensor(np.asarray(dones, dtype=np.float32)))
+        else:
+            disc = torch.as_tensor(np.asarray(discounts, dtype=np.float32))
+
+        q = self.q_net(s).gather(1, a[:, None]).squeeze(1)
+        with torch.no_grad():
+            if self.double:
+                best = self.q_net(s2).argmax(dim=1, keepdim=True)
+                next_q = self.target_net(s2).gather(1, best).squeeze(1)
+            else:
+                next_q = self.target_net(s2).max(dim=1).values
+            target = r + disc * next_q
+        td = target - q
+        loss = nn.functional.smooth_l1_loss(q, target, reduction="none")
+        if weights is not None:
+            loss = loss * torch.as_tensor(np.asarray(weights, dtype=np.float32))
+        loss = loss.mean()
+
+        self.optimizer.zero_grad()
+        loss.backward()
+        nn.utils.clip_grad_norm_(self.q_net.parameters(), 10.0)
+        self.optimizer.step()
+
+        self.n_updates += 1
+        if self.n_updates % self.target_update == 0:
+            self.target_net.load_state_dict(self.q_net.state_dict())
+        return td.detach().numpy(), loss.item()
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        torch.save({"q_net": self.q_net.state_dict(), "action_set": self.action_set}, path)
+
+    def load(self, path):
+        data = torch.load(path)
+        self.q_net.load_state_dict(data["q_net"])
+        self.target_net.load_state_dict(data["q_net"])
+
+
+def train_dqn(num_envs=8, total_steps=200_000, mode="Step_1", max_steps=200, reward_params=None,
+              asynchronous=False, save_path="q_tables/dqn.pt", seed=0, report_every=10.0, **agent_kwargs):
+    """
+    - nav_gym のベクトル環境（num_envs 個）を DQNAgent で学習
+    - 行動選択は全環境まとめて1回の forward、学習は内部のリプレイバッファからミニバッチ
+    - ゴール・衝突は done（ブートストラップなし）、max_steps の打ち切りは最後の観測でブートストラップ
+    - 戻り値: (DQNAgent, EpisodeStats)
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    reward_fn = functools.partial(improved_reward, **(reward_params or {}))
+    envs = make_vector_env(num_envs, asynchronous=asynchronous, mode=mode, max_steps=max_steps, reward_fn=reward_fn)
+    agent = DQNAgent(obs_dim=envs.single_observation_space.shape[0], seed=seed, **agent_kwargs)
+    stats = EpisodeStats()
+    episode = np.zeros(num_envs, dtype=np.int64)
+    ep_reward = np.zeros(num_envs)
+    ep_steps = np.zeros(num_envs, dtype=np.int64)
+    ep_start = np.full(num_envs, time.time())
+    last_report = time.time()
+    try:
+        obs, _ = envs.reset(seed=seed)
+        for _ in range(total_steps // num_envs):
+            actions = agent.select_action_indices(obs, episodes=episode)
+            next_obs, rewards, terminated, truncated, infos = envs.step(actions)
+            ep_reward += rewards
+            ep_steps += 1
+
+            targets = next_obs
+            if "final_obs" in infos:
+                targets = next_obs.copy()
+                final_info = infos.get("final_info", infos)
+                for i in np.flatnonzero(infos["_final_obs"]):
+                    targets[i] = infos["final_obs"][i]
+                    outcome = final_info["outcome"][i]
+                    stats.add((i, int(episode[i]), float(ep_reward[i]), int(ep_steps[i]), outcome, time.time() - ep_start[i]))
+                    episode[i] += 1
+                    ep_reward[i] = 0.0
+                    ep_steps[i] = 0
+                    ep_start[i] = time.time()
+            agent.update_many(obs, actions, rewards, targets, terminated)
+            obs = next_obs
+            if time.time() - last_report >= report_every:
+                print(f"[dqn] {stats.summary()} updates={agent.n_updates}")
+                last_report = time.time()
+    finally:
+        envs.close()
+    if save_path:
+        agent.save(save_path)
+    print(f"[dqn] {stats.summary()} updates={agent.n_updates}")
+    return agent, stats
+
+
+if __name__ == "__main__":
+    from curriculum import REWARD_PARAMS
+
+    parser = argparse.ArgumentParser(description="DQN（MLP）エージェントの学習")
+    parser.add_argument("--envs", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=200_000)
+    parser.add_argument("--mode", default="Step_1")
+    parser.add_argument("--max-steps", type=int, default=200)
+    parser.add_argument("--async", dest="asynchronous", action="store_true", help="サブプロセスのベクトル環境を使う")
+    parser.add_argument("--save", default="q_tables/dqn.pt")
+    args = parser.parse_args()
+
+    train_dqn(args.envs, args.steps, mode=args.mode, max_steps=args.max_steps, reward_params=REWARD_PARAMS,
+              asynchronous=args.asynchronous, save_path=args.save)
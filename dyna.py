@@ -0,0 +1,133 @@
+# dyna.py
+# Dyna-Q / 優先度付きスイーピング（QAgent に被せて使う計画更新）
+#
+# GameEnv.step は LiDAR のせいで重いが、Qテーブルの更新は軽い。
+# 実際に観測した遷移 (状態キー, 行動) → (報酬, 次状態キー, 終了) をモデルとして覚えておき、
+# 実ステップの合間にモデルから planning_steps 回分の遷移を取り出して追加で更新する。
+# - prioritized=True: TD誤差の大きい (状態, 行動) から順に更新し、その前にいた (状態, 行動) にも優先度を伝える（優先度付きスイーピング）
+# - prioritized=False: モデルから一様にランダムに選ぶ（素の Dyna-Q）
+# 計画更新は QAgent.update_keys でまとめて1回（ロック1回）で反映する。
+import heapq
+import itertools
+import random
+
+import numpy as np
+
+import profiler
+from profiler import profiled
+
+
+class DynaModel:
+    """
+    - (状態キー, 行動) → (報酬, 次状態キー, 終了) の決定的モデル（最後に観測した結果で上書き）
+    - 次状態キー → そこへ遷移した (状態キー, 行動) の集合（優先度の逆伝播用）。集合が空になったキーは消す
+    - capacity を超えたら古く登録されたものから捨てる
+    """
+    def __init__(self, capacity=200_000):
+        self.capacity = capacity
+        self.transitions = {}
+        self.predecessors = {}
+
+    def __len__(self):
+        return len(self.transitions)
+
+    def add(self, key, action, reward, next_key, done):
+        sa = (key, action)
+        if sa in self.transitions:
+            # 入れ直して「最近」の扱いにする。次状態が変わっていれば前の次状態からのリンクも外す
+            _, prev_next, _ = self.transitions.pop(sa)
+            if prev_next != next_key:
+                self._unlink(prev_next, sa)
+        self.transitions[sa] = (reward, next_key, done)
+        self.predecessors.setdefault(next_key, set()).add(sa)
+        if len(self.transitions) > self.capacity:
+            old_sa = next(iter(self.transitions))
+            _, old_next, _ = self.transitions.pop(old_sa)
+            self._unlink(old_next, old_sa)
+
+    def _unlink(self, next_key, sa):
+        preds = self.predecessors.get(next_key)
+        if preds is not None:
+            preds.discard(sa)
+            if not preds:
+                del self.predecessors[next_key]
+
+    def sample(self, n):
+        # 一様にランダムな (状態キー, 行動) を n 個
+        return random.sample(list(self.transitions), min(n, len(self.transitions)))
+
+
+class DynaQAgent:
+    """
+    - agent（QAgent）をそのまま包み、update のたびにモデル更新と計画更新を行う
+    - select_action などそれ以外のメソッドは agent にそのまま委ねる
+    """
+    def __init__(self, agent, planning_steps=10, prioritized=True, theta=1e-3, model_capacity=200_000):
+        self.agent = agent
+        self.planning_steps = planning_steps
+        self.prioritized = prioritized
+        self.theta = theta  # これより小さい優先度はキューに入れない
+        self.model = DynaModel(model_capacity)
+        self.queue = []  # (-優先度, 通し番号, (状態キー, 行動))
+        self.queued = {}  # (状態キー, 行動) -> キューに入っている最大の優先度
+        self._counter = itertools.count()
+        self.n_planning_updates = 0
+
+    def __getattr__(self, name):
+        return getattr(self.agent, name)
+
+    def _push(self, sa, priority):
+        if priority <= self.theta or priority <= self.queued.get(sa, 0.0):
+            return
+        self.queued[sa] = priority
+        heapq.heappush(self.queue, (-priority, next(self._counter), sa))
+
+    def _pop(self, n):
+        out = []
+        while self.queue and len(out) < n:
+            neg_p, _, sa = heapq.heappop(self.queue)
+            # 古い（より小さい優先度で入れた）エントリは飛ばす
+            if self.queued.get(sa) != -neg_p:
+                continue
+            del self.queued[sa]
+            if sa in self.model.transitions:
+                out.append(sa)
+        return out
+
+    def update(self, state, action, reward, next_state, alpha=0.1, gamma=0.99, done=False):
+        """
+        - 実際の遷移で QAgent.update → モデルに記録 → planning_steps 回の計画更新
+        - 戻り値: 実遷移のTD誤差（QAgent.update と同じ）
+        """
+        td = self.agent.update(state, action, reward, next_state, alpha=alpha, gamma=gamma, done=done)
+        key = self.agent.to_key(state)
+        a = self.agent.to_action_index(action)
+        self.model.add(key, a, reward, self.agent.to_key(next_state), done)
+        if self.prioritized:
+            self._push((key, a), abs(td))
+        self.plan(self.planning_steps, alpha=alpha, gamma=gamma)
+        return td
+
+    @profiled("DynaQAgent.plan")
+    def plan(self, n, alpha=0.1, gamma=0.99):
+        """
+        - モデルから最大 n 個の (状態, 行動) を選び、まとめて1回で更新する
+        - 優先度付きの場合、更新した状態へ遷移してくる (状態, 行動) に gamma * |TD誤差| の優先度を付ける
+        """
+        if n <= 0 or len(self.model) == 0:
+            return None
+        batch = self._pop(n) if self.prioritized else self.model.sample(n)
+        if not batch:
+            return None
+        keys, actions = zip(*batch)
+        rewards, next_keys, dones = zip(*(self.model.transitions[sa] for sa in batch))
+        discounts = gamma * (1.0 - np.asarray(dones, dtype=np.float64))
+        td = self.agent.update_keys(list(keys), np.asarray(actions), np.asarray(rewards, dtype=np.float64),
+                                    list(next_keys), discounts, alpha=alpha)
+        self.n_planning_updates += len(batch)
+        profiler.count("dyna_planning_updates", len(batch))
+        if self.prioritized:
+            for key, err in zip(keys, np.abs(td)):
+                for pred in self.model.predecessors.get(key, ()):
+                    self._push(pred, gamma * err)
+        return td
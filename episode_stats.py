@@ -0,0 +1,146 @@
+# episode_stats.py
+# ワーカーから1エピソードごとの記録を受け取り、成功率やスループットをその場で集計する
+#
+# worker は各エピソードの終わりに小さなタプルをキュー（パイプ）に流し、最後に終了通知を送る。
+#   エピソード記録: (seed, ep, 報酬合計, ステップ数, 結果, 所要時間[s])
+#   終了通知:       (seed, None, ゴール回数, 0, "done", 0.0)
+# メインプロセスは collect() で受け取りながら集計し、条件を満たしたら stop_event で途中終了させる。
+import collections
+import json
+import os
+import queue
+import time
+
+OUTCOMES = ("goal", "collision", "timeout", "stuck")  # stuck: stuck_detector による打ち切り
+
+
+class EpisodeStats:
+    def __init__(self, window=100):
+        self.window = window
+        self.recent = collections.deque(maxlen=window)  # 直近の結果
+        self.outcome_counts = dict.fromkeys(OUTCOMES, 0)
+        self.episodes = 0
+        self.steps = 0
+        self.reward_sum = 0.0
+        self.per_worker = {}  # seed -> [エピソード数, ゴール数]
+        self.start_time = time.time()
+
+    def add(self, record):
+        seed, ep, reward, steps, outcome, wall = record
+        self.episodes += 1
+        self.steps += steps
+        self.reward_sum += reward
+        self.outcome_counts[outcome] += 1
+        self.recent.append(outcome == "goal")
+        w = self.per_worker.setdefault(seed, [0, 0])
+        w[0] += 1
+        w[1] += outcome == "goal"
+
+    @property
+    def goal_count(self):
+        return self.outcome_counts["goal"]
+
+    def success_rate(self):
+        return self.goal_count / self.episodes if self.episodes else 0.0
+
+    def rolling_success_rate(self):
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    def throughput(self):
+        # (エピソード/秒, ステップ/秒)
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        return self.episodes / elapsed, self.steps / elapsed
+
+    def summary(self):
+        eps, sps = self.throughput()
+        return (
+            f"episodes={self.episodes} 成功率={self.success_rate():.2%} "
+            f"直近{len(self.recent)}={self.rolling_success_rate():.2%} "
+            f"衝突={self.outcome_counts['collision']} 時間切れ={self.outcome_counts['timeout']} 停滞={self.outcome_counts['stuck']} "
+            f"{eps:.2f} ep/s {sps:.1f} step/s"
+        )
+
+    def to_dict(self):
+        eps, sps = self.throughput()
+        return {
+            "episodes": self.episodes,
+            "steps": self.steps,
+            "outcomes": dict(self.outcome_counts),
+            "success_rate": self.success_rate(),
+            "rolling_success_rate": self.rolling_success_rate(),
+            "mean_reward": self.reward_sum / self.episodes if self.episodes else 0.0,
+            "episodes_per_sec": eps,
+            "steps_per_sec": sps,
+            "per_worker": {str(k): v for k, v in self.per_worker.items()},
+        }
+
+
+def early_stop_rule(min_episodes=50, success_above=None, success_below=None):
+    """
+    - 直近の成功率で途中終了を判定する関数を作る
+    - min_episodes 未満では判定しない
+    - success_above: これ以上なら十分（打ち切り）、success_below: これ未満なら見込みなし（打ち切り）
+    """
+    def rule(stats):
+        if stats.episodes < min_episodes:
+            return False
+        rate = stats.rolling_success_rate()
+        if success_above is not None and rate >= success_above:
+            return True
+        if success_below is not None and rate < success_below:
+            return True
+        return False
+    return rule
+
+
+def collect(stats_queue, n_workers, stats, stop_event=None, early_stop=None, report_every=10.0, procs=None):
+    """
+    - n_workers 個の終了通知が届くまで記録を受け取り stats に集計する
+    - early_stop(stats) が True になったら stop_event をセット（ワーカーは次のエピソードの前で止まる）
+    - procs: ワーカーのプロセス。渡すと、全プロセスが終了してキューが空になった時点で
+      終了通知が揃っていなくても抜ける（例外で落ちたワーカーは終了通知を送らないので、待ち続けないように）
+    - 戻り値: ワーカーごとのゴール回数の合計（従来の q_table_queue の集計と同じ値）
+    """
+    finished = 0
+    goal_count_total = 0
+    last_report = time.time()
+    exited = False  # 全プロセスが終了済み（以降キューが空になったら抜ける）
+    while finished < n_workers:
+        try:
+            record = stats_queue.get(timeout=1.0)
+        except queue.Empty:
+            record = None
+            if exited:
+                exitcodes = [p.exitcode for p in procs]
+                print(f"[collect] 終了通知が {n_workers - finished} 件届かないまま全ワーカーが終了しました（exitcode={exitcodes}）")
+                break
+        if record is not None:
+            if record[4] == "done":
+                finished += 1
+                goal_count_total += record[2]
+            else:
+                stats.add(record)
+                if (stop_event is not None and early_stop is not None
+                        and not stop_event.is_set() and early_stop(stats)):
+                    print(f"[early stop] {stats.summary()}")
+                    stop_event.set()
+        if time.time() - last_report >= report_every:
+            print(f"[progress] {stats.summary()}")
+            last_report = time.time()
+        if procs is not None and not exited:
+            # 終了したプロセスの記録はキューに書き込み済みなので、判定の後にもう1回空になるまで受け取る
+            exited = not any(p.is_alive() for p in procs)
+    return goal_count_total
+
+
+def save_results(path, results, current=None):
+    """
+    - 途中経過を含む結果をJSONで保存（Ctrl+C で止めたときも使う）
+    - results: [(params, score), ...]（grid_search の score は成功率）、current: 実行中の組み合わせ {"params":..., "stats": EpisodeStats}
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = {"results": [{"params": list(params), "score": score} for params, score in results]}
+    if current is not None:
+        data["current"] = {"params": list(current["params"]), "stats": current["stats"].to_dict()}
+    with open(path, "w") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,148 @@
+# evaluate.py
+# 学習済みQテーブルの評価（探索なし・固定シードのシナリオ）
+#
+# 学習中の成功回数は ε-greedy の探索込みの値なので、方策そのものの性能とは言えない。
+# ここでは保存済みのQテーブルを読み込み、eval_mode=True（貪欲方策）で
+# 固定シードのシナリオ集合を Step ごとにプロセスプールで並列に走らせる。
+#   python evaluate.py q_tables/combo_0.pkl --modes Step_0 Step_1 --episodes 100
+import argparse
+import contextlib
+import math
+import multiprocessing as mp
+import random
+import time
+
+import numpy as np
+
+from kinematics import ActionTable
+from rl_env import GameEnv
+from train_rl import ACTION_SET, QAgent, load_q_table
+
+# 学習用のシード（0～N_PROCS-1 など）と重ならないよう、評価用シナリオは別の範囲から取る
+EVAL_SEED_BASE = 1_000_000
+
+_eval_agent = None
+
+
+def make_scenarios(modes, n_scenarios, base_seed=EVAL_SEED_BASE):
+    # (mode, seed) の固定リスト。同じ引数なら毎回同じマップ・同じ初期配置になる
+    return [(mode, base_seed + i) for mode in modes for i in range(n_scenarios)]
+
+
+_eval_lidar = None
+_eval_action_table = None
+
+
+def _init_eval_worker(q_table, action_set, lidar):
+    # プロセスごとに1回だけQテーブルを受け取る（タスクごとに送らない）
+    # 環境の運動学もエージェントと同じ行動セットの表にする（行動インデックスの意味を揃える）
+    global _eval_agent, _eval_lidar, _eval_action_table
+    _eval_agent = QAgent(action_set, q_table, contextlib.nullcontext())
+    _eval_lidar = lidar
+    _eval_action_table = ActionTable(action_set)
+
+
+def run_scenario(agent, mode, seed, max_steps, lidar=None, action_table=None):
+    """
+    - 1シナリオを貪欲方策で実行
+    - action_table: 環境の運動学（None なら agent.action_set から作る）
+    - 戻り値: (mode, 結果["goal"|"collision"|"timeout"], ステップ数, 移動距離[px])
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    if action_table is None:
+        action_table = ActionTable(agent.action_set)
+    env = GameEnv(mode=mode, lidar=lidar, action_table=action_table)
+    state = env.reset()
+    robot = env.game.robot
+    path_length = 0.0
+    outcome = "timeout"
+    steps = 0
+    for steps in range(1, max_steps + 1):
+        x, y = robot.x, robot.y
+        action = agent.select_action_index(state, eval_mode=True)
+        state, reward, done, info = env.step(action)
+        path_length += math.hypot(robot.x - x, robot.y - y)
+        if done:
+            outcome = "goal" if env.game.check_goal() else "collision"
+            break
+    return mode, outcome, steps, path_length
+
+
+def _run_task(args):
+    # 戻り値: run_scenario の結果 + そのシナリオの所要時間[s]（モードごとの steps/s 用）
+    mode, seed, max_steps = args
+    start = time.perf_counter()
+    row = run_scenario(_eval_agent, mode, seed, max_steps, _eval_lidar, _eval_action_table)
+    return row + (time.perf_counter() - start,)
+
+
+def evaluate(q_table, modes=("Step_1",), n_scenarios=100, max_steps=200,
+             n_procs=None, base_seed=EVAL_SEED_BASE, action_set=ACTION_SET, lidar=None):
+    """
+    - q_table: Qテーブル（辞書）または保存先パス
+    - lidar: 学習時と同じ LidarConfig（None なら既定）
+    - action_set: 学習時と同じ行動セット（エージェントと環境の運動学の両方に使う）
+    - 戻り値: {mode: {"episodes", "success_rate", "collision_rate", "timeout_rate",
+                      "mean_steps", "mean_path_length", "steps_per_sec"}}
+      steps_per_sec はそのモードのシナリオだけの、1プロセスあたりのスループット（ステップ数 / シナリオの所要時間の合計）
+    """
+    if isinstance(q_table, str):
+        q_table = load_q_table(q_table)
+    # Manager.dict の場合も copy() なら1回の通信で普通の辞書になる
+    q_table = q_table.copy()
+    tasks = [(mode, seed, max_steps) for mode, seed in make_scenarios(modes, n_scenarios, base_seed)]
+
+    # pygame(SDL) が SIGTERM を横取りするので、Pool.terminate ではなく close/join で終わらせる
+    pool = mp.Pool(n_procs, initializer=_init_eval_worker, initargs=(q_table, action_set, lidar))
+    try:
+        rows = pool.map(_run_task, tasks, chunksize=max(1, len(tasks) // (4 * (n_procs or mp.cpu_count()))))
+    finally:
+        pool.close()
+        pool.join()
+
+    report = {}
+    for mode in modes:
+        mode_rows = [r for r in rows if r[0] == mode]
+        n = len(mode_rows)
+        outcomes = [r[1] for r in mode_rows]
+        report[mode] = {
+            "episodes": n,
+            "success_rate": outcomes.count("goal") / n,
+            "collision_rate": outcomes.count("collision") / n,
+            "timeout_rate": outcomes.count("timeout") / n,
+            "mean_steps": float(np.mean([r[2] for r in mode_rows])),
+            "mean_path_length": float(np.mean([r[3] for r in mode_rows])),
+            "steps_per_sec": _steps_per_sec(mode_rows),
+        }
+    return report
+
+
+def _steps_per_sec(rows):
+    elapsed = sum(r[4] for r in rows)
+    return sum(r[2] for r in rows) / elapsed if elapsed > 0 else 0.0
+
+
+def print_report(report):
+    print(f"{'mode':<8}{'成功率':>8}{'衝突率':>8}{'時間切れ':>8}{'平均step':>10}{'平均距離':>10}{'steps/s':>10}")
+    for mode, r in report.items():
+        print(
+            f"{mode:<8}{r['success_rate']:>8.2%}{r['collision_rate']:>8.2%}{r['timeout_rate']:>8.2%}"
+            f"{r['mean_steps']:>10.1f}{r['mean_path_length']:>10.1f}{r['steps_per_sec']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="学習済みQテーブルを貪欲方策で評価")
+    parser.add_argument("q_table", help="save_q_table で保存したQテーブル（.pkl）")
+    parser.add_argument("--modes", nargs="+", default=["Step_0", "Step_1", "Step_2"])
+    parser.add_argument("--episodes", type=int, default=100, help="Stepごとのシナリオ数")
+    parser.add_argument("--max-steps", type=int, default=200)
+    parser.add_argument("--procs", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=EVAL_SEED_BASE)
+    args = parser.parse_args()
+
+    print_report(evaluate(
+        args.q_table, modes=args.modes, n_scenarios=args.episodes,
+        max_steps=args.max_steps, n_procs=args.procs, base_seed=args.seed,
+    ))
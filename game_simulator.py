@@ -1,10 +1,14 @@
 import pygame
 import random
 import math
+import time
 import numpy as np
+from profiler import profiled
 ""
 WIDTH, HEIGHT = 1000, 800
-FPS = 120
+FPS = 120  # シミュレーションの刻み（手動操作時）
+RENDER_FPS = 60  # 描画の上限（シミュレーションとは別）
+LOG_INTERVAL = 0.5  # 手動操作時のログ出力間隔[s]
 ROBOT_RADIUS = 15
 WHEEL_BASE = 30
 
@@ -19,6 +23,50 @@ LIDAR_ANGLE_MIN = -90
 LIDAR_ANGLE_MAX = 90
 LIDAR_RESOLUTION = ((LIDAR_ANGLE_MAX - LIDAR_ANGLE_MIN) // LIDAR_STEP) + 1
 LIDAR_MAX_DISTANCE = 300  # 最大検出距離
+LIDAR_SAMPLE_STEP = 2  # レイ上のサンプリング間隔[px]
+
+
+class LidarConfig:
+    """
+    - LiDARの設定（環境ごと）。レイキャスト・状態ベクトル・描画のすべてがこれに従う
+    - n_beams: ビーム本数（angle_min～angle_max を等間隔に分割、両端を含む）
+    - max_distance: 最大検出距離[px]、sample_step: レイ上のサンプリング間隔[px]
+    - noise_std: 距離に加えるガウスノイズの標準偏差[px]、dropout: ビームが返ってこない確率（最大距離を返す）
+    - 既定値は従来の定数と同じ（91本、±90度、300px、2px間隔、ノイズなし）
+    """
+    def __init__(self, n_beams=LIDAR_RESOLUTION, angle_min=LIDAR_ANGLE_MIN, angle_max=LIDAR_ANGLE_MAX,
+                 max_distance=LIDAR_MAX_DISTANCE, sample_step=LIDAR_SAMPLE_STEP, noise_std=0.0, dropout=0.0):
+        if n_beams < 1:
+            raise ValueError("n_beams は1以上にしてください")
+        self.n_beams = n_beams
+        self.angle_min = angle_min
+        self.angle_max = angle_max
+        self.max_distance = max_distance
+        self.sample_step = sample_step
+        self.noise_std = noise_std
+        self.dropout = dropout
+        if n_beams == 1:
+            self.angles = [(angle_min + angle_max) / 2]
+        else:
+            span = (angle_max - angle_min) / (n_beams - 1)
+            self.angles = [angle_min + i * span for i in range(n_beams)]
+
+    def __repr__(self):
+        return (f"LidarConfig(n_beams={self.n_beams}, fov=({self.angle_min}, {self.angle_max}), "
+                f"max_distance={self.max_distance}, sample_step={self.sample_step}, "
+                f"noise_std={self.noise_std}, dropout={self.dropout})")
+
+    def apply_noise(self, distances):
+        # ノイズ・ドロップアウトを配列にその場で適用（どちらも0なら乱数を消費しない）
+        if self.noise_std > 0:
+            distances += np.random.normal(0.0, self.noise_std, len(distances))
+            np.clip(distances, 0, self.max_distance, out=distances)
+        if self.dropout > 0:
+            distances[np.random.random(len(distances)) < self.dropout] = self.max_distance
+        return distances
+
+
+DEFAULT_LIDAR = LidarConfig()
 
 
 GAME_WIDTH = 1000
@@ -28,6 +76,9 @@ WIDTH = GAME_WIDTH + LIDAR_WIDTH
 HEIGHT = GAME_HEIGHT
 
 class Obstacle:
+    # スナップショットに入れる属性（rect・visible・color 以外。サブクラスで足す）
+    STATE_FIELDS = ()
+
     def __init__(self, x, y, w, h, color=WALL_COLOR):
         self.rect = pygame.Rect(x, y, w, h)
         self.visible = True
@@ -43,6 +94,8 @@ class Obstacle:
         # pygame.display.flip()
 
 class SlowBouncingObstacle(Obstacle):
+    STATE_FIELDS = ("vx", "vy")
+
     def __init__(self, x, y, w, h):
         super().__init__(x, y, w, h, color=(180, 120, 60))
         # 速度はゆっくり
@@ -59,6 +112,8 @@ class SlowBouncingObstacle(Obstacle):
             self.vy *= -1
 
 class AppearingObstacle(Obstacle):
+    STATE_FIELDS = ("timer", "show_time", "hide_time")
+
     def __init__(self, x, y, w, h):
         super().__init__(x, y, w, h, color=(120, 80, 200))
         self.visible = True
@@ -80,6 +135,8 @@ class AppearingObstacle(Obstacle):
             self.show_time = random.randint(60, 150)
 
 class CircularObstacle(Obstacle):
+    STATE_FIELDS = ("center_x", "center_y", "radius", "angle", "speed")
+
     def __init__(self, x, y, w, h):
         super().__init__(x, y, w, h, color=(60, 180, 120))
         self.center_x = x + w // 2
@@ -95,6 +152,8 @@ class CircularObstacle(Obstacle):
 
 
 class BlinkingObstacle(Obstacle):
+    STATE_FIELDS = ("blink_timer", "counter")
+
     def __init__(self, x, y, w, h, color=WALL_COLOR):
         super().__init__(x, y, w, h, color)
         self.blink_timer = random.randint(200, 500)
@@ -116,10 +175,14 @@ class Robot:
     def update(self, v_left, v_right):
         v = (v_left + v_right) / 2
         omega = (v_right - v_left) / WHEEL_BASE
+        self.move(v, math.degrees(omega))
+
+    def move(self, v, omega_deg):
+        # 並進速度 v と角速度 omega_deg[deg] で1ステップ進める（kinematics.ActionTable から表引きで呼ばれる）
         rad = math.radians(self.angle)
         self.x += v * math.cos(rad)
         self.y += v * math.sin(rad)
-        self.angle += math.degrees(omega)
+        self.angle += omega_deg
 
     def draw(self, screen):
         rad = math.radians(self.angle)
@@ -136,10 +199,95 @@ class Robot:
     def get_rect(self):
         return pygame.Rect(self.x - ROBOT_RADIUS, self.y - ROBOT_RADIUS, ROBOT_RADIUS * 2, ROBOT_RADIUS * 2)
 
+# スナップショットの障害物の種類（行の先頭の番号）と、Game が障害物を持つリスト
+OBSTACLE_KINDS = (Obstacle, SlowBouncingObstacle, AppearingObstacle, CircularObstacle, BlinkingObstacle)
+OBSTACLE_LISTS = ("wall_obstacles", "blinking_doors", "obstacles", "dynamic_obstacles")
+# 1行 = [種類, リスト, x, y, w, h, visible, R, G, B, STATE_FIELDS...]
+SNAPSHOT_WIDTH = 10 + max(len(cls.STATE_FIELDS) for cls in OBSTACLE_KINDS)
+
+
+class GameSnapshot:
+    """
+    - Game の世界の状態をまとめたもの（Game.snapshot で作り、Game.restore で戻す）
+    - pose: [ロボット x, y, angle, ゴール x, y, angle, step_count]
+    - obstacles: 障害物1つを1行にした (N, SNAPSHOT_WIDTH) の float64 配列（位置・表示状態・タイマー・円運動の角度など）
+    - rng: (random の状態, np.random の状態)。None なら乱数は戻さない
+    - 配列は障害物30個で約3.5KB、乱数の状態を含めて pickle すると約10KB。そのまま他のプロセスに送れる
+    """
+    __slots__ = ("mode", "pose", "obstacles", "rng")
+
+    def __init__(self, mode, pose, obstacles, rng=None):
+        self.mode = mode
+        self.pose = pose
+        self.obstacles = obstacles
+        self.rng = rng
+
+    @property
+    def nbytes(self):
+        return self.pose.nbytes + self.obstacles.nbytes
+
+    def __repr__(self):
+        return f"GameSnapshot(mode={self.mode!r}, obstacles={len(self.obstacles)}, rng={self.rng is not None})"
+
+
+# restore で実数のまま戻す属性（それ以外のタイマー・速度の向きなどは整数に戻す）
+_FLOAT_FIELDS = {"angle", "speed"}
+
+
+class GoalGeometry:
+    """
+    - ロボットとゴールの位置関係（1ステップに1回だけ計算して、終了判定・報酬・状態で共有する）
+    - distance: ゴールまでの距離[px]
+    - goal_direction: ゴールの方向（真上0度・時計回り、0～360の実数）
+    - bearing_diff: ゴール方向とロボットの向きの差（-180～180）
+    - heading_error: ロボットの向きとゴールの向き（goal_angle）の差（整数化して比較、0～180）
+    """
+    __slots__ = ("distance", "goal_direction", "bearing_diff", "heading_error")
+
+    def __init__(self, x, y, angle, goal_x, goal_y, goal_angle):
+        dx = goal_x - x
+        dy = goal_y - y
+        self.distance = math.hypot(dx, dy)
+        self.goal_direction = math.degrees(math.atan2(dx, -dy)) % 360
+        self.bearing_diff = (self.goal_direction - angle + 180) % 360 - 180
+        robot_angle = int(angle) % 360
+        goal_angle = int(goal_angle) % 360
+        self.heading_error = abs((robot_angle - goal_angle + 180) % 360 - 180)
+
+
+def draw_goal_marker(screen, goal_x, goal_y, goal_angle):
+    # ゴールの円と向きの矢印（Game.draw と viewer.py の再生で共用）
+    pygame.draw.circle(screen, GOAL_COLOR, (goal_x, goal_y), 10)
+    length = 30  # 矢印の長さ
+    rad = math.radians(goal_angle)
+    end_x = int(goal_x + length * math.cos(rad))
+    end_y = int(goal_y + length * math.sin(rad))
+    pygame.draw.line(screen, (255, 0, 0), (goal_x, goal_y), (end_x, end_y), 4)
+    # 矢印の先端
+    head_length = 8
+    left_rad = rad + math.radians(150)
+    right_rad = rad - math.radians(150)
+    left = (int(end_x + head_length * math.cos(left_rad)), int(end_y + head_length * math.sin(left_rad)))
+    right = (int(end_x + head_length * math.cos(right_rad)), int(end_y + head_length * math.sin(right_rad)))
+    pygame.draw.polygon(screen, (255, 0, 0), [(end_x, end_y), left, right])
+
+
+def draw_lidar_rays(screen, x, y, angle, beam_angles, distances):
+    # LiDARのビームを線で描く（Game.draw と viewer.py の再生で共用）
+    px = int(x)
+    py = int(y)
+    for delta_angle, dist in zip(beam_angles, distances):
+        rad = math.radians(angle + delta_angle)
+        pygame.draw.line(screen, (0,200,100), (px, py), (int(px + dist * math.cos(rad)), int(py + dist * math.sin(rad))), 1)
+    pygame.draw.circle(screen, (60,60,255), (px, py), 4)
+
+
 class Game:
-    def __init__(self, obstacle_count=10, mode="normal"):
+    @profiled("Game.__init__")
+    def __init__(self, obstacle_count=10, mode="normal", lidar=None):
         pygame.init()
         self.mode = mode
+        self.lidar_config = lidar if lidar is not None else DEFAULT_LIDAR
         self.lidar_log_counter = 0 
         self.step_count = 0
         pygame.font.init()
@@ -524,34 +672,100 @@ class Game:
         self.dynamic_obstacles = []
 
 
-    def get_lidar_distances(self):
-        distances = []
+    def snapshot(self, include_rng=True):
+        """
+        - 今の世界の状態（ロボット・ゴール・全障害物とそのタイマー、include_rng なら乱数の状態）を GameSnapshot にする
+        - 壁の配置も障害物の行に含まれるので、restore 先はどのモードの Game でもよい
+        """
+        pose = np.array([self.robot.x, self.robot.y, self.robot.angle,
+                         self.goal_x, self.goal_y, self.goal_angle, self.step_count], dtype=np.float64)
+        rows = []
+        for list_id, name in enumerate(OBSTACLE_LISTS):
+            for obs in getattr(self, name):
+                row = [OBSTACLE_KINDS.index(type(obs)), list_id, obs.rect.x, obs.rect.y, obs.rect.w, obs.rect.h, obs.visible,
+                       *obs.color]
+                row += [getattr(obs, f) for f in obs.STATE_FIELDS]
+                rows.append(row + [0.0] * (SNAPSHOT_WIDTH - len(row)))
+        obstacles = np.array(rows, dtype=np.float64).reshape(-1, SNAPSHOT_WIDTH)
+        rng = (random.getstate(), np.random.get_state()) if include_rng else None
+        return GameSnapshot(self.mode, pose, obstacles, rng)
+
+    def restore(self, snapshot):
+        """
+        - snapshot の状態に戻す（マップを作り直さない。障害物は __init__ を通さずに作るので乱数も使わない）
+        - snapshot.rng があれば random / np.random の状態も戻す（以降の障害物の動き・LiDARのノイズが同じになる）
+        """
+        self.mode = snapshot.mode
+        rx, ry, rangle, gx, gy, gangle, step_count = snapshot.pose.tolist()
+        self.robot.x, self.robot.y, self.robot.angle = rx, ry, rangle
+        self.goal_x, self.goal_y, self.goal_angle = int(gx), int(gy), int(gangle)
+        self.step_count = int(step_count)
+        lists = {name: [] for name in OBSTACLE_LISTS}
+        for row in snapshot.obstacles.tolist():
+            cls = OBSTACLE_KINDS[int(row[0])]
+            obs = cls.__new__(cls)
+            obs.rect = pygame.Rect(int(row[2]), int(row[3]), int(row[4]), int(row[5]))
+            obs.visible = bool(row[6])
+            obs.color = tuple(int(c) for c in row[7:10])
+            for f, value in zip(cls.STATE_FIELDS, row[10:]):
+                setattr(obs, f, value if f in _FLOAT_FIELDS else int(value))
+            lists[OBSTACLE_LISTS[int(row[1])]].append(obs)
+        for name, obstacles in lists.items():
+            setattr(self, name, obstacles)
+        if snapshot.rng is not None:
+            random.setstate(snapshot.rng[0])
+            np.random.set_state(snapshot.rng[1])
+        self.goal_direction = self.calc_goal_direction()
+
+    @profiled("Game.get_lidar_distances")
+    def get_lidar_distances(self, out=None):
+        """
+        - 各ビームの障害物までの距離[px]（当たらなければ max_distance）。本数・範囲は self.lidar_config に従う
+        - out に長さ n_beams の配列を渡すとそこへ直接書き込んで返す（リストを作らない）
+        """
+        cfg = self.lidar_config
+        max_distance = cfg.max_distance
+        distances = [] if out is None else out
         px, py = self.robot.x, self.robot.y
         base_angle = self.robot.angle  # ロボットの角度（0度が正面）
+        # 1回の呼び出しの間は障害物の表示状態が変わらないので、リストの連結と判定用Rectは1回だけ作る
+        obstacles = [obs for obs in self.wall_obstacles + self.blinking_doors + self.obstacles + self.dynamic_obstacles if obs.visible]
+        point_rect = pygame.Rect(0, 0, 2, 2)
 
-        for delta_angle in range(LIDAR_ANGLE_MIN, LIDAR_ANGLE_MAX+1, LIDAR_STEP):
+        for i, delta_angle in enumerate(cfg.angles):
             angle = base_angle + delta_angle
             rad = math.radians(angle)
-            for dist in range(1, LIDAR_MAX_DISTANCE, 2):  # 2px間隔でサンプリング
-                x = int(px + dist * math.cos(rad))
-                y = int(py + dist * math.sin(rad))
-                point_rect = pygame.Rect(x, y, 2, 2)
+            for dist in range(1, max_distance, cfg.sample_step):  # sample_step 間隔でサンプリング
+                point_rect.x = int(px + dist * math.cos(rad))
+                point_rect.y = int(py + dist * math.sin(rad))
                 collision = False
-                for obs in self.wall_obstacles + self.blinking_doors + self.obstacles + self.dynamic_obstacles:
-                    if obs.visible and obs.rect.colliderect(point_rect):
+                for obs in obstacles:
+                    if obs.rect.colliderect(point_rect):
                         collision = True
                         break
                 if collision:
                     break
-            distances.append(dist if collision else LIDAR_MAX_DISTANCE)
+            if out is None:
+                distances.append(dist if collision else max_distance)
+            else:
+                out[i] = dist if collision else max_distance
+        if out is not None:
+            cfg.apply_noise(out)
+        elif cfg.noise_std > 0 or cfg.dropout > 0:
+            distances = cfg.apply_noise(np.array(distances, dtype=float)).tolist()
         return distances
     
+    def geometry(self):
+        # 姿勢・ゴールが前回と同じなら計算済みの GoalGeometry を返す
+        key = (self.robot.x, self.robot.y, self.robot.angle, self.goal_x, self.goal_y, self.goal_angle)
+        if getattr(self, "_geometry_key", None) != key:
+            self._geometry = GoalGeometry(*key)
+            self._geometry_key = key
+        return self._geometry
+
     def calc_goal_direction(self):
         # ゴールの向きを0～359度で算出（真上0度、時計回り）
-        dx = self.goal_x - self.robot.x
-        dy = self.goal_y - self.robot.y
-        angle = math.degrees(math.atan2(dx, -dy)) % 360  # 真上0度に合わせるためdyとdxを逆
-        return int(angle)
+        return int(self.geometry().goal_direction)
 
 
 
@@ -768,6 +982,7 @@ class Game:
         elif keys[pygame.K_x]: v_left = -4
         return v_left, v_right
 
+    @profiled("Game.check_collision")
     def check_collision(self):
         rect = self.robot.get_rect()
         for obs in self.wall_obstacles + self.blinking_doors + self.obstacles + self.dynamic_obstacles:
@@ -777,50 +992,32 @@ class Game:
 
     def check_goal(self, margin=20):
         # marginは「許容する角度の幅」（デフォルト20度など）
-        robot_angle = int(self.robot.angle) % 360
-        goal_angle = int(self.goal_angle) % 360
-        angle_diff = abs((robot_angle - goal_angle + 180) % 360 - 180)
-        # 位置の距離
-        distance = math.hypot(self.goal_x - self.robot.x, self.goal_y - self.robot.y)
-        return distance < ROBOT_RADIUS + 10 and angle_diff <= margin
+        geom = self.geometry()
+        return geom.distance < ROBOT_RADIUS + 10 and geom.heading_error <= margin
 
     def draw_goal_with_direction(self):
-        # ゴールの円を描画
-        pygame.draw.circle(self.screen, GOAL_COLOR, (self.goal_x, self.goal_y), 10)
-        # ゴール向きの矢印を描画
-        length = 30  # 矢印の長さ
-        rad = math.radians(self.goal_angle)
-        end_x = int(self.goal_x + length * math.cos(rad))
-        end_y = int(self.goal_y + length * math.sin(rad))
-        pygame.draw.line(self.screen, (255, 0, 0), (self.goal_x, self.goal_y), (end_x, end_y), 4)
-        # 矢印の先端（三角形のようなものを描くなら下記）
-        head_length = 8
-        left_rad = rad + math.radians(150)
-        right_rad = rad - math.radians(150)
-        left = (int(end_x + head_length * math.cos(left_rad)), int(end_y + head_length * math.sin(left_rad)))
-        right = (int(end_x + head_length * math.cos(right_rad)), int(end_y + head_length * math.sin(right_rad)))
-        pygame.draw.polygon(self.screen, (255, 0, 0), [(end_x, end_y), left, right])
+        draw_goal_marker(self.screen, self.goal_x, self.goal_y, self.goal_angle)
 
     def draw_lidar(self, distances):
-        px = int(self.robot.x)
-        py = int(self.robot.y)
-        base_angle = self.robot.angle
-        for idx, delta_angle in enumerate(range(LIDAR_ANGLE_MIN, LIDAR_ANGLE_MAX+1, LIDAR_STEP)):
-            angle = base_angle + delta_angle
-            rad = math.radians(angle)
-            dist = distances[idx]
-            x = int(px + dist * math.cos(rad))
-            y = int(py + dist * math.sin(rad))
-            pygame.draw.line(self.screen, (0,200,100), (px, py), (x, y), 1)
-        pygame.draw.circle(self.screen, (60,60,255), (px, py), 4)
-    
-    def draw(self):
+        draw_lidar_rays(self.screen, self.robot.x, self.robot.y, self.robot.angle, self.lidar_config.angles, distances)
+
+    def update_world(self):
+        # 障害物を1刻み進める（点滅ドアもここで更新。描画の回数にはよらない）
+        for obs in self.dynamic_obstacles:
+            obs.update()
+        for door in self.blinking_doors:
+            door.update()
+
+    def draw(self, lidar_distances=None):
+        """
+        - 画面を描いて flip する（状態は変えない）
+        - lidar_distances を渡せばそれを描く（省略時はここで計算）
+        """
         # --- ゲーム画面エリア（左） ---
         self.screen.fill(WHITE, rect=pygame.Rect(0, 0, GAME_WIDTH, GAME_HEIGHT))
         for wall in self.wall_obstacles:
             wall.draw(self.screen)
         for door in self.blinking_doors:
-            door.update()
             door.draw(self.screen)
         for obs in self.obstacles + self.dynamic_obstacles:
             obs.draw(self.screen)
@@ -829,39 +1026,54 @@ class Game:
         step_text = self.font.render(f"Step: {self.step_count}", True, (0, 0, 0))
         self.screen.blit(step_text, (10, 10))
         # --- ライダー可視化エリア（右） ---
-        lidar_distances = self.get_lidar_distances()
+        if lidar_distances is None:
+            lidar_distances = self.get_lidar_distances()
         self.draw_lidar(lidar_distances)
 
         pygame.display.flip()
 
 
-    def run(self):
+    def run(self, sim_fps=FPS, render_fps=RENDER_FPS, log_interval=LOG_INTERVAL, recorder=None):
+        """
+        - 手動操作（キーボード）で動かす
+        - シミュレーションは sim_fps で刻み、描画は render_fps を上限に間引く
+        - LiDARは1刻みに1回だけ計算し、判定・ログ・描画で使い回す
+        - ログは log_interval 秒ごと（毎フレーム print するとそれだけでループが遅くなる）
+        - recorder（viewer.TrajectoryRecorder など）を渡すと毎刻みの状態を記録する
+        """
+        render_interval = 1.0 / render_fps
+        next_render = 0.0
+        last_log = 0.0
         while self.running:
-            self.clock.tick(FPS)
+            self.clock.tick(sim_fps)
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
             keys = pygame.key.get_pressed()
             v_left, v_right = self.get_tire_speed(keys)
             self.robot.update(v_left, v_right)
-            for obs in self.dynamic_obstacles:
-                obs.update()
-
-            # LIDAR取得と出力（ここを追加！）
+            self.update_world()
             lidar_distances = self.get_lidar_distances()
-            self.lidar_log_counter += 1
-            if self.lidar_log_counter % 50 == 0:
-                print(f"[LIDAR] {lidar_distances[:10]} ...（全{len(lidar_distances)}本）")  # 先頭10本＋総本数だけ表示
+            if recorder is not None:
+                recorder.record(self, (v_left, v_right), lidar_distances)
 
-            # ログ出力
-            self.log_status(v_left, v_right)
+            # ログ出力（間引き）
+            now = time.perf_counter()
+            if now - last_log >= log_interval:
+                self.log_status(v_left, v_right)
+                print(f"[LIDAR] {lidar_distances[:10]} ...（全{len(lidar_distances)}本）")  # 先頭10本＋総本数だけ表示
+                last_log = now
             if self.check_collision():
                 print("💥 衝突しました！")
                 self.running = False
             if self.check_goal():
                 print("🎉 ゴール達成！（向きも条件OK）")
                 self.running = False
-            self.draw()
+
+            # 描画（上限 render_fps）
+            if now >= next_render or not self.running:
+                self.draw(lidar_distances)
+                next_render = now + render_interval
         pygame.quit()
 
     # def get_state(self):
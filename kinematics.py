@@ -0,0 +1,82 @@
+# kinematics.py
+# 行動（左右の車輪速度の組）を整数インデックスで扱うための事前計算テーブル
+#
+# Robot.update は毎ステップ v・omega・math.radians を計算し直すが、行動は ACTION_SET の21通りしかない。
+# ここで (v, omega[deg]) を行動ごとに1回だけ計算しておき、運動学は「表引き + 積和」で済ませる。
+# 複数の環境をまとめて進める場合は step() に配列を渡せばよい。
+import math
+
+import numpy as np
+
+from game_simulator import WHEEL_BASE
+
+ACTION_SET = [
+    (4, 4), (2, 2), (0, 0), (-2, -2), (-4, -4),
+    (4, 2), (2, 4), (-4, -2), (-2, -4),
+    (4, 0), (0, 4), (-4, 0), (0, -4),
+    (2, 0), (0, 2), (-2, 0), (0, -2),
+    (2, -2), (-2, 2), (4, -4), (-4, 4),
+]
+
+
+class ActionTable:
+    def __init__(self, action_set=ACTION_SET, heading_bins=None):
+        """
+        - action_set: (v_left, v_right) のリスト。インデックスがそのまま行動ID
+        - heading_bins: 指定すると向きを 360/heading_bins 度刻みに量子化した sin/cos 表を使う
+          （None なら厳密な三角関数。Robot.update と同じ軌道になる）
+        """
+        self.action_set = list(action_set)
+        self.index = {a: i for i, a in enumerate(self.action_set)}
+        # Robot.update と同じ式・同じ順序で計算（浮動小数点の結果を一致させるため）
+        self.v_list = [(vl + vr) / 2 for vl, vr in self.action_set]
+        self.omega_list = [math.degrees((vr - vl) / WHEEL_BASE) for vl, vr in self.action_set]
+        self.v = np.array(self.v_list)
+        self.omega = np.array(self.omega_list)
+
+        self.heading_bins = heading_bins
+        if heading_bins is not None:
+            rad = np.arange(heading_bins) * (2 * math.pi / heading_bins)
+            self.cos_table = np.cos(rad)
+            self.sin_table = np.sin(rad)
+
+    def __len__(self):
+        return len(self.action_set)
+
+    def step(self, x, y, angle, action_idx):
+        """
+        - 全環境の姿勢をまとめて1ステップ進める（配列でもスカラーでも可）
+        - 戻り値: (x, y, angle)
+        """
+        action_idx = np.asarray(action_idx)
+        v = self.v[action_idx]
+        if self.heading_bins is None:
+            rad = np.radians(angle)
+            c, s = np.cos(rad), np.sin(rad)
+        else:
+            k = np.rint(np.asarray(angle) * (self.heading_bins / 360)).astype(np.int64) % self.heading_bins
+            c, s = self.cos_table[k], self.sin_table[k]
+        return x + v * c, y + v * s, angle + self.omega[action_idx]
+
+
+ACTION_TABLE = ActionTable(ACTION_SET)
+
+
+def validate_kinematics(table, action_seq, x=500.0, y=400.0, angle=0.0):
+    """
+    - 行動列を Robot.update（従来の計算）と table.step の両方で進め、軌道の最大誤差を返す
+    - 戻り値: (x,yの最大誤差[px], 向きの最大誤差[deg])
+    """
+    from game_simulator import Robot
+
+    robot = Robot(x, y)
+    robot.angle = angle
+    tx, ty, ta = float(x), float(y), float(angle)
+    max_pos_err = 0.0
+    max_angle_err = 0.0
+    for idx in action_seq:
+        robot.update(*table.action_set[idx])
+        tx, ty, ta = table.step(tx, ty, ta, idx)
+        max_pos_err = max(max_pos_err, abs(robot.x - tx), abs(robot.y - ty))
+        max_angle_err = max(max_angle_err, abs(robot.angle - ta))
+    return max_pos_err, max_angle_err
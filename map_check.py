@@ -0,0 +1,141 @@
+# map_check.py
+# 生成したマップが解けるか（ロボットがゴールまで行けるか）を占有グリッドで事前に確かめる
+#
+# Step_5〜Step_8 は壁・障害物・ロボット・ゴールを乱数で置くだけなので、
+# ROBOT_RADIUS のロボットが通れる経路がないマップも混ざり、そのエピソードは MAX_STEPS まで無駄になる。
+# - 静的な障害物（壁・静的障害物）をロボットの半径ぶん膨らませて、cell px 間隔のグリッドに塗る
+# - ロボットの位置からグリッド上で塗り広げ（NumPy のシフトでまとめて1マスずつ広げる）、ゴール判定の範囲に届くかを見る
+# - 動く障害物・点滅ドアは通れる時があるので数えない。画面の外（外周のドアから出た先）は通れるものとして margin px 分含める
+# - 壁だけのグリッドは同じ配置で使い回し（lru_cache）、判定結果もマップの配置ごとにキャッシュする
+#   checker = SolvabilityChecker()
+#   checker.check(game)      # True なら解ける
+#   checker.summary()        # 判定数・却下数・却下率
+import functools
+
+import numpy as np
+
+from game_simulator import HEIGHT, ROBOT_RADIUS, WIDTH
+
+GRID_CELL = 10  # グリッドの1マス[px]
+GRID_MARGIN = 40  # 画面の外側に含める幅[px]
+GOAL_REACH = ROBOT_RADIUS + 10  # Game.check_goal の距離条件
+
+
+def static_rects(game):
+    # 判定に使う静的な障害物の矩形 (x, y, w, h)
+    return tuple((o.rect.x, o.rect.y, o.rect.w, o.rect.h) for o in game.wall_obstacles + game.obstacles)
+
+
+def cell_centers(cell=GRID_CELL, margin=GRID_MARGIN):
+    # グリッドの各マスの中心座標（xs: 列, ys: 行）
+    xs = np.arange(-margin + cell / 2, WIDTH + margin, cell)
+    ys = np.arange(-margin + cell / 2, HEIGHT + margin, cell)
+    return xs, ys
+
+
+def to_cell(x, y, cell=GRID_CELL, margin=GRID_MARGIN):
+    # 座標[px] → (行, 列)
+    return int((y + margin) // cell), int((x + margin) // cell)
+
+
+@functools.lru_cache(maxsize=64)
+def occupancy_grid(rects, cell=GRID_CELL, margin=GRID_MARGIN, inflate=ROBOT_RADIUS):
+    """
+    - rects を inflate px 膨らませて塗った (行, 列) の bool 配列（True = ロボットの中心が入ると衝突）
+    - Robot.get_rect（一辺 2*ROBOT_RADIUS の正方形）と colliderect の判定に合わせ、境界ちょうどは衝突にしない
+    - 戻り値は書き換えないこと（キャッシュを共有している）
+    """
+    xs, ys = cell_centers(cell, margin)
+    blocked = np.zeros((len(ys), len(xs)), dtype=bool)
+    for x, y, w, h in rects:
+        # 開区間 (x - inflate, x + w + inflate) に中心が入るマス
+        c0 = np.searchsorted(xs, x - inflate, side="right")
+        c1 = np.searchsorted(xs, x + w + inflate, side="left")
+        r0 = np.searchsorted(ys, y - inflate, side="right")
+        r1 = np.searchsorted(ys, y + h + inflate, side="left")
+        blocked[r0:r1, c0:c1] = True
+    blocked.flags.writeable = False
+    return blocked
+
+
+def disk_mask(x, y, radius, cell=GRID_CELL, margin=GRID_MARGIN):
+    # 中心 (x, y) から radius px 未満にあるマス
+    xs, ys = cell_centers(cell, margin)
+    return (xs[None, :] - x) ** 2 + (ys[:, None] - y) ** 2 < radius ** 2
+
+
+def flood_fill(free, start, target=None, max_iters=None):
+    """
+    - free 上で start（bool 配列）から上下左右に塗り広げる。1回の反復で全フロンティアを1マス進める
+    - target を渡すと届いた時点で打ち切る
+    - 戻り値: (届いたマスの bool 配列, target に届いたか)
+    """
+    reached = start & free
+    frontier = reached.copy()
+    grown = np.empty_like(reached)
+    n = 0
+    while frontier.any():
+        if target is not None and (reached & target).any():
+            return reached, True
+        grown[:] = False
+        grown[1:] |= frontier[:-1]
+        grown[:-1] |= frontier[1:]
+        grown[:, 1:] |= frontier[:, :-1]
+        grown[:, :-1] |= frontier[:, 1:]
+        frontier = grown & free & ~reached
+        reached |= frontier
+        n += 1
+        if max_iters is not None and n >= max_iters:
+            break
+    return reached, target is not None and bool((reached & target).any())
+
+
+class SolvabilityChecker:
+    """
+    - check(game): ロボットの初期位置からゴール判定の範囲（GOAL_REACH px 以内）まで、静的な障害物を避けて行けるか
+    - 判定結果はマップの配置（障害物の矩形・ロボットとゴールのマス）ごとにキャッシュする（cache_size を超えたら古い順に捨てる）
+    - n_checked / n_rejected: 判定したマップ数 / 解けなかったマップ数
+    """
+    def __init__(self, cell=GRID_CELL, margin=GRID_MARGIN, cache_size=4096):
+        self.cell = cell
+        self.margin = margin
+        self.cache_size = cache_size
+        self.cache = {}
+        self.n_checked = 0
+        self.n_rejected = 0
+        self.cache_hits = 0
+
+    def is_solvable(self, game):
+        # 統計を数えずに判定だけ行う
+        if not game.wall_obstacles and not game.obstacles:
+            return True
+        rects = static_rects(game)
+        key = (rects, to_cell(game.robot.x, game.robot.y, self.cell, self.margin),
+               to_cell(game.goal_x, game.goal_y, self.cell, self.margin))
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache_hits += 1
+            return result
+        free = ~occupancy_grid(rects, self.cell, self.margin)
+        # スタートはロボットの位置から1マス以内の空きマス（グリッドの丸めで中心のマスが塞がって見える場合の保険）
+        start = disk_mask(game.robot.x, game.robot.y, self.cell, self.cell, self.margin)
+        target = disk_mask(game.goal_x, game.goal_y, GOAL_REACH, self.cell, self.margin) & free
+        result = bool(target.any()) and flood_fill(free, start, target)[1]
+        self.cache[key] = result
+        if len(self.cache) > self.cache_size:
+            del self.cache[next(iter(self.cache))]
+        return result
+
+    def check(self, game):
+        result = self.is_solvable(game)
+        self.n_checked += 1
+        self.n_rejected += not result
+        return result
+
+    @property
+    def rejected_fraction(self):
+        return self.n_rejected / self.n_checked if self.n_checked else 0.0
+
+    def summary(self):
+        return (f"マップ判定={self.n_checked} 却下={self.n_rejected} ({self.rejected_fraction:.2%}) "
+                f"キャッシュ命中={self.cache_hits}")
@@ -0,0 +1,179 @@
+# multi_reward.py
+# 1本のロールアウト（シミュレーション）から、複数の報酬設定のQテーブルをオフポリシーで同時に学習する
+#
+# grid_search は報酬係数を変えるたびに環境を丸ごと再シミュレーションするが、
+# 終了判定（ゴール/衝突）は報酬係数に依存しないため、遷移（状態・行動・次状態・報酬特徴量）は共有できる。
+# ここでは遷移を一度だけ記録し、報酬設定ごとの Q テーブルをその記録から並列に学習する。
+# M 個の報酬設定の探索コストが、ほぼシミュレーション1回分で済む。
+import contextlib
+import itertools
+import multiprocessing as mp
+import random
+import signal
+import sys
+
+import numpy as np
+
+from evaluate import evaluate
+from rl_env import GameEnv
+from kinematics import ActionTable
+from train_rl import (
+    ACTION_SET, QAgent, reward_features, reward_from_features, analyze_and_report,
+)
+
+REWARD_KEYS = (
+    "angle_bonus", "angle_penalty", "step_penalty",
+    "forward_bonus", "backward_penalty", "obstacle_avoid_bonus",
+    "goal_reward", "goal_margin",
+)
+
+
+def record_worker(seed, action_set, episodes, max_steps, behavior_q_table, behavior_episode, out_queue):
+    """
+    - 行動方策（behavior_q_table の ε-greedy）で環境を動かし、遷移を記録する
+    - 報酬の代わりに reward_features を記録するので、後から任意の報酬係数で報酬を再計算できる
+    - 1エピソード = (states[T+1, D], actions[T], features[T, 4], dones[T])
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+
+    # 行動方策用のエージェント（ローカルのスナップショットなのでロック不要）
+    agent = QAgent(action_set, behavior_q_table, contextlib.nullcontext())
+
+    # 報酬関数の位置で特徴量を返す（LiDARの二重計算を避けるため）
+    env = GameEnv(reward_fn=lambda env, state, done: reward_features(env), action_table=ActionTable(action_set))
+
+    stream = []
+    for ep in range(episodes):
+        state = env.reset()
+        states = [state.copy()]
+        actions = []
+        features = []
+        dones = []
+        for step in range(max_steps):
+            action = agent.select_action_index(state, eval_mode=False, episode=behavior_episode + ep)
+            next_state, feats, done, info = env.step(action)
+            states.append(next_state.copy())  # 環境のバッファは使い回されるのでコピーして残す
+            actions.append(action)
+            features.append(feats)
+            dones.append(done)
+            state = next_state
+            if done:
+                break
+        stream.append((
+            np.array(states),
+            np.array(actions, dtype=np.int8),
+            np.array(features, dtype=np.float64),
+            np.array(dones, dtype=bool),
+        ))
+
+    out_queue.put(stream)
+
+
+def train_from_stream(action_set, q_table, reward_params, stream, alpha=0.1, gamma=0.99):
+    """
+    - 記録済みの遷移から、1つの報酬設定の Q テーブルをオフポリシー（Q学習）で更新する
+    - 記録中のゴール数は行動方策の成績なので、設定の良し悪しには使わない（評価は evaluate で貪欲方策を走らせる）
+    - 戻り値: 更新後のQテーブル
+    """
+    agent = QAgent(action_set, q_table, contextlib.nullcontext())
+    for states, actions, features, dones in stream:
+        rewards = np.array([reward_from_features(tuple(f), **reward_params) for f in features])
+        # 1エピソード分をまとめて更新（ゴール・衝突の終端はブートストラップしない。update(done=) と同じ）
+        discounts = gamma * (1.0 - np.asarray(dones, dtype=np.float64))
+        agent.update_batch(states[:-1], actions, rewards, states[1:], alpha=alpha, discounts=discounts)
+    return agent.q_table
+
+
+def _train_task(args):
+    return train_from_stream(*args)
+
+
+def multi_reward_search():
+    # 検索したいパラメータのリスト（grid_search と同じ並び）
+    angle_bonus_list = [20, 30]
+    angle_penalty_list = [-20, -35]
+    step_penalty_list = [-0.05, -0.1]
+    goal_reward_list = [100]
+    goal_margin_list = [30]
+    forward_bonus_list = [0]
+    backward_penalty_list = [0]
+    obstacle_avoid_bonus_list = [0]
+
+    N_PROCS = 13
+    ROUNDS = 5  # 記録→学習 を何回繰り返すか
+    EPISODES = 130  # 1ラウンドあたりの合計エピソード数
+    episodes_per_proc = EPISODES // N_PROCS
+    MAX_STEPS = 200
+    EVAL_MODES = ("Step_1",)  # 設定ごとの Qテーブルを貪欲方策で評価するモード（record_worker の環境と同じ）
+    EVAL_SCENARIOS = 20
+
+    param_grid = list(itertools.product(
+        angle_bonus_list, angle_penalty_list, step_penalty_list,
+        forward_bonus_list, backward_penalty_list, obstacle_avoid_bonus_list,
+        goal_reward_list, goal_margin_list
+    ))
+    configs = [dict(zip(REWARD_KEYS, params)) for params in param_grid]
+
+    # 報酬設定ごとに独立したQテーブル
+    q_tables = [dict() for _ in configs]
+    results = []
+
+    # Ctrl+Cハンドラ
+    def signal_handler(sig, frame):
+        print("\n[Ctrl+C] 中断されました。ここまでの集計を表示します。")
+        if results:
+            analyze_and_report(results, label="成功率")
+        sys.exit(0)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    # pygame(SDL) が SIGTERM を横取りするので、Pool.terminate ではなく close/join で終わらせる
+    pool = mp.Pool(N_PROCS)
+    try:
+        for r in range(ROUNDS):
+            # 行動方策はラウンドごとに報酬設定を持ち回り（どの設定にも自分の方策に近いデータが入る）
+            behavior = r % len(configs)
+            print(f"\n[round {r+1}/{ROUNDS}] 記録中（行動方策: {configs[behavior]}）")
+
+            out_queue = mp.Queue()
+            procs = []
+            for j in range(N_PROCS):
+                p = mp.Process(
+                    target=record_worker,
+                    args=(
+                        r * N_PROCS + j, ACTION_SET, episodes_per_proc, MAX_STEPS,
+                        q_tables[behavior], r * episodes_per_proc, out_queue,
+                    )
+                )
+                procs.append(p)
+                p.start()
+            stream = []
+            for _ in range(N_PROCS):
+                stream.extend(out_queue.get())
+            for p in procs:
+                p.join()
+
+            n_steps = sum(len(actions) for _, actions, _, _ in stream)
+            print(f"記録: {len(stream)}エピソード / {n_steps}ステップ → {len(configs)}設定を学習")
+
+            # 報酬設定ごとの学習は互いに独立なので並列に実行
+            tasks = [(ACTION_SET, q_tables[i], configs[i], stream) for i in range(len(configs))]
+            q_tables = pool.map(_train_task, tasks)
+        # 設定ごとの成績は、その設定の Qテーブル自身の貪欲方策を固定シナリオで走らせた成功率
+        # （記録した遷移のゴール数は行動方策の成績で、どの設定でも同じになる）
+        results = []
+        for i, q_table in enumerate(q_tables):
+            report = evaluate(q_table, modes=EVAL_MODES, n_scenarios=EVAL_SCENARIOS, max_steps=MAX_STEPS, n_procs=N_PROCS)
+            score = float(np.mean([report[mode]["success_rate"] for mode in EVAL_MODES]))
+            results.append((param_grid[i], score))
+            print(f"成功率={score:.2%} → {param_grid[i]}")
+    finally:
+        pool.close()
+        pool.join()
+
+    analyze_and_report(results, label="成功率")
+    return q_tables, results
+
+
+if __name__ == "__main__":
+    multi_reward_search()
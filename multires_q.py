@@ -0,0 +1,214 @@
+# multires_q.py
+# 粗い状態から細かい状態まで何段階かの Qテーブルを同時に学習し、未知の状態では粗い段階に戻って引く
+#
+# QAgent のキーは93次元を0.1刻みに丸めたものなので、ほとんどの状態は初めて見るキーになり、
+# そのたびにランダム行動になって学習した内容が使われない。
+# ここでは同じ状態を次のような粗いキーにも落とし、段階ごとに別の Qテーブルで同時に Q学習する。
+# - ゴール距離を数個のビン、方向差を数個のビン、LiDAR を数本のセクター（セクター内の最小距離）× 数段階の距離
+# - 最も細かい段階は QAgent.to_key そのもの（共有の q_table。形式は QAgent と同じなので保存・評価はそのまま）
+# 行動選択では細かい段階から順に見て、訪問回数が min_visits 以上の最も細かい段階の Q値を使う（バックオフ）。
+# 1回の引きは「段階数 + 1」回の辞書の参照と、状態ベクトル1本分の NumPy の計算だけ。
+#   agent = MultiResQAgent(ACTION_SET, shared_q_table, lock, levels=DEFAULT_LEVELS, min_visits=5)
+#   agent.memory_by_level()   # 段階ごとの状態数・おおよそのバイト数
+import random
+import sys
+
+import numpy as np
+
+from q_kernel import StateIndex, td_update
+from train_rl import QAgent
+
+
+class ResolutionLevel:
+    """
+    - 粗いキーの作り方（LidarConfig と同じく設定だけを持つ）
+    - sectors: LiDAR をいくつのセクターにまとめるか（各セクターは中の最小距離）
+    - lidar_bins: 正規化した LiDAR 距離（0〜1）を何段階にするか
+    - distance_edges: 正規化したゴール距離（距離 / LIDAR_MAX_DISTANCE）のビンの境界
+    - bearing_bins: 方向差（-1〜1）を何段階にするか
+    """
+    def __init__(self, sectors=8, lidar_bins=3, distance_edges=(0.25, 0.5, 1.0, 2.0), bearing_bins=8):
+        self.sectors = sectors
+        self.lidar_bins = lidar_bins
+        self.distance_edges = np.asarray(distance_edges, dtype=np.float64)
+        self.bearing_bins = bearing_bins
+
+    def __repr__(self):
+        return (f"ResolutionLevel(sectors={self.sectors}, lidar_bins={self.lidar_bins}, "
+                f"distance_edges={tuple(self.distance_edges.tolist())}, bearing_bins={self.bearing_bins})")
+
+    def keys(self, states):
+        """
+        - (N, obs_dim) の状態 → 粗いキー（int8 の並びの bytes）N個
+        - 丸め済みの状態（QAgent.to_key と同じ0.1刻み）から作るので、行動選択と更新で同じキーになる
+        """
+        states = np.round(np.asarray(states, dtype=np.float64), 1)
+        lidar = states[:, 2:]
+        starts = np.linspace(0, lidar.shape[1], self.sectors, endpoint=False).astype(np.int64)
+        codes = np.empty((len(states), 2 + self.sectors), dtype=np.int8)
+        codes[:, 0] = np.searchsorted(self.distance_edges, states[:, 0], side="right")
+        codes[:, 1] = np.clip(((states[:, 1] + 1.0) * 0.5 * self.bearing_bins).astype(np.int64), 0, self.bearing_bins - 1)
+        sector_min = np.minimum.reduceat(lidar, starts, axis=1)
+        codes[:, 2:] = np.clip((sector_min * self.lidar_bins).astype(np.int64), 0, self.lidar_bins - 1)
+        return [row.tobytes() for row in codes]
+
+
+# 粗い順。細かい段階は粗い段階の区切りをすべて含む（セクターの境界・ビンの境界が入れ子）
+# 一番粗い段階は多くても 5×8×3^4 ≒ 3千状態なので、数エピソードで大半が埋まる
+DEFAULT_LEVELS = (
+    ResolutionLevel(sectors=4, lidar_bins=3, distance_edges=(0.3, 0.5, 1.0, 2.0), bearing_bins=8),
+    ResolutionLevel(sectors=8, lidar_bins=3, distance_edges=(0.2, 0.3, 0.4, 0.5, 0.7, 1.0, 1.5, 2.0, 3.0), bearing_bins=16),
+    ResolutionLevel(sectors=16, lidar_bins=6, distance_edges=tuple(np.round(np.arange(0.1, 4.05, 0.1), 1)), bearing_bins=32),
+)
+
+
+class LevelTable(StateIndex):
+    """
+    - 1段階分の Qテーブル（StateIndex）と状態ごとの訪問回数
+    - プロセスごとに持つ（共有しない）。粗い段階は状態数が少ないので各ワーカーで十分に埋まる
+    """
+    def __init__(self, n_actions, capacity=1024):
+        super().__init__(n_actions, capacity)
+        self._visits = np.zeros(capacity, dtype=np.int64)
+
+    def lookup(self, keys, add=True):
+        out = super().lookup(keys, add)
+        if len(self._q) > len(self._visits):
+            visits = np.zeros(len(self._q), dtype=np.int64)
+            visits[:len(self._visits)] = self._visits
+            self._visits = visits
+        return out
+
+    @property
+    def visits(self):
+        return self._visits[:len(self.keys)]
+
+    def nbytes(self):
+        # 確保済みの配列 + キーの bytes + 辞書本体（おおよそ）
+        keys = sum(sys.getsizeof(k) for k in self.keys[:1]) * len(self.keys)
+        return self._q.nbytes + self._visits.nbytes + keys + sys.getsizeof(self.ids) + sys.getsizeof(self.keys)
+
+
+class MultiResQAgent(QAgent):
+    """
+    - QAgent に粗い段階の Qテーブル（LevelTable）を足したもの。最も細かい段階は QAgent の q_table をそのまま使う
+    - update / update_batch / update_keys / update_trajectory（DynaQAgent の計画更新も含む）は全段階をまとめて更新する。
+      粗い段階は段階ごとに独立した Q学習（次状態の価値もその段階の Qテーブルから取る）
+    - 行動選択は訪問回数が min_visits 以上の最も細かい段階の Q値（どの段階も足りなければ、データのある最も細かい段階）
+    - 最も細かい段階の訪問回数はプロセスごとに数える（共有の q_table の形式は変えない）。
+      eval_mode では q_table にあれば訪問回数によらず使う（保存済みのテーブルの評価用）
+    - fallback（ann_index.NeighborFallback など）があれば、q_table にない状態では粗い段階より先に近傍の Q値を使う
+    - level_hits: どの段階で引けたかの回数（粗い段階、最も細かい段階、fallback、どこにもなくランダムになった回数の順）
+    """
+    def __init__(self, action_set, q_table, lock, levels=DEFAULT_LEVELS, min_visits=5, fallback=None):
+        super().__init__(action_set, q_table, lock, fallback=fallback)
+        self.levels = tuple(levels)
+        self.min_visits = min_visits
+        self.tables = [LevelTable(len(action_set)) for _ in self.levels]
+        self.fine_visits = {}
+        # 並び: 粗い段階（levels の順）、最も細かい段階、fallback、ランダム
+        self.level_hits = np.zeros(len(self.levels) + 3, dtype=np.int64)
+
+    def q_values(self, state, eval_mode=False):
+        """
+        - バックオフで選んだ段階の Q値（np.ndarray）と段階の番号（len(levels) が最も細かい段階、len(levels) + 1 が fallback）
+        - どの段階にもない状態なら (None, None)
+        """
+        fallback = None
+        key = self.to_key(state)
+        with self.lock:
+            row = self.q_table.get(key)
+        if row is not None:
+            fine = len(self.levels)
+            if eval_mode or self.fine_visits.get(key, 0) >= self.min_visits:
+                return np.asarray(row), fine
+            fallback = (np.asarray(row), fine)
+        elif self.fallback is not None:
+            # q_table にない状態: 近い訪問済み状態の Q値があれば粗い段階より優先（fallback が q_table を読むのでロックの外で）
+            q = self.fallback.q_values(self, state)
+            if q is not None:
+                return np.asarray(q), len(self.levels) + 1
+        state = np.asarray(state)[None]
+        for lv in range(len(self.levels) - 1, -1, -1):
+            table = self.tables[lv]
+            sid = table.ids.get(self.levels[lv].keys(state)[0])
+            if sid is None:
+                continue
+            if table.visits[sid] >= self.min_visits:
+                return table.q[sid].copy(), lv
+            if fallback is None:
+                fallback = (table.q[sid].copy(), lv)
+        return fallback if fallback is not None else (None, None)
+
+    def select_action_index(self, state, eval_mode=False, episode=0):
+        epsilon = max(0.02, 0.5 * (0.99 ** episode))  # 探索率（QAgent と同じ）
+        if not eval_mode and random.random() <= epsilon:
+            return random.randrange(len(self.action_set))
+        q, level = self.q_values(state, eval_mode=eval_mode)
+        if q is None:
+            self.level_hits[-1] += 1
+            return random.randrange(len(self.action_set))
+        self.level_hits[level] += 1
+        return int(np.argmax(q))
+
+    def update(self, state, action, reward, next_state, alpha=0.1, gamma=0.99, done=False):
+        td = super().update(state, action, reward, next_state, alpha=alpha, gamma=gamma, done=done)
+        key = self.to_key(state)
+        self.fine_visits[key] = self.fine_visits.get(key, 0) + 1
+        self._update_levels(np.asarray(state)[None], [self.to_action_index(action)], [reward],
+                            np.asarray(next_state)[None], [0.0 if done else gamma], alpha)
+        return td
+
+    def update_keys(self, keys, action_idx, rewards, next_keys, discounts, alpha=0.1, weights=None):
+        # update_batch・DynaQAgent から呼ばれる。キーは丸めた状態そのものなので、粗いキーもここから作れる
+        td = super().update_keys(keys, action_idx, rewards, next_keys, discounts, alpha=alpha, weights=weights)
+        for key in keys:
+            self.fine_visits[key] = self.fine_visits.get(key, 0) + 1
+        self._update_levels(np.asarray(keys, dtype=np.float64), action_idx, rewards,
+                            np.asarray(next_keys, dtype=np.float64), discounts, alpha, weights)
+        return td
+
+    def update_trajectory(self, states, action_idx, rewards, dones, alpha=0.1, gamma=0.99, n_step=1, lam=None):
+        # nステップは update_batch → update_keys を通るので粗い段階も更新される。
+        # Q(λ) は QAgent が q_table に直接書くので、粗い段階（1ステップのQ学習）と訪問回数をここで更新する
+        td = super().update_trajectory(states, action_idx, rewards, dones, alpha=alpha, gamma=gamma,
+                                       n_step=n_step, lam=lam)
+        if lam is not None:
+            states = np.asarray([self.to_key(st) for st in states], dtype=np.float64)
+            for key in map(tuple, states[:-1]):
+                self.fine_visits[key] = self.fine_visits.get(key, 0) + 1
+            discounts = gamma * (1.0 - np.asarray(dones, dtype=np.float64))
+            self._update_levels(states[:-1], action_idx, rewards, states[1:], discounts, alpha)
+        return td
+
+    def _update_levels(self, states, action_idx, rewards, next_states, discounts, alpha, weights=None):
+        action_idx = np.asarray(action_idx, dtype=np.int64)
+        for level, table in zip(self.levels, self.tables):
+            s = table.lookup(level.keys(states))
+            s2 = table.lookup(level.keys(next_states))
+            td_update(table.q, s, action_idx, rewards, s2, discounts, alpha=alpha, weights=weights)
+            np.add.at(table.visits, s, 1)
+
+    def memory_by_level(self):
+        """
+        - 段階ごとの (名前, 状態数, おおよそのバイト数)
+        - 最も細かい段階は共有の q_table の件数 × 1件（キーのタプル + 値の list）の大きさの見積もり
+          （Manager.dict は中身を取り出すと全件のコピーになるので、このプロセスで更新したキーで見積もる）
+        """
+        out = [(repr(level), len(table), table.nbytes()) for level, table in zip(self.levels, self.tables)]
+        with self.lock:
+            n_fine = len(self.q_table)
+        key = next(iter(self.fine_visits), None)
+        per_entry = 0
+        if key is not None:
+            per_entry = (sys.getsizeof(key) + sum(sys.getsizeof(v) for v in key)
+                         + sys.getsizeof([0.0] * len(self.action_set)) + 24 * len(self.action_set))
+        out.append(("fine (QAgent.to_key)", n_fine, per_entry * n_fine))
+        return out
+
+    def summary(self):
+        names = [f"L{i}" for i in range(len(self.levels))] + ["fine", "neighbor", "random"]
+        total = max(int(self.level_hits.sum()), 1)
+        hits = " ".join(f"{n}={h / total:.1%}" for n, h in zip(names, self.level_hits))
+        sizes = " ".join(f"{n}={k}" for n, (_, k, _) in zip(names, self.memory_by_level()))
+        return f"引いた段階: {hits} / 状態数: {sizes}"
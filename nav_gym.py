@@ -0,0 +1,181 @@
+# nav_gym.py
+# LiDARシミュレータ（rl_env.GameEnv）を Gymnasium の API で使うためのラッパー
+#
+# GameEnv は従来の (state, reward, done, info) の4要素を返し、時間切れは worker の max_steps ループ任せになっている。
+# ここでは gymnasium.Env として terminated（ゴール・衝突）と truncated（max_steps 到達）を分けて返す。
+# 時間切れは「失敗」ではなく打ち切りなので、学習側は truncated のときは次状態でブートストラップしてよい。
+#   env = NavEnv(mode="Step_1")                      # 1環境（stable-baselines3 などにそのまま渡せる）
+#   envs = make_vector_env(8)                        # 同一プロセスでまとめて step（観測は (8, obs_dim) の1配列）
+#   envs = make_vector_env(8, asynchronous=True)     # サブプロセス版（gymnasium.vector.AsyncVectorEnv）
+import functools
+import math
+import random
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from gymnasium.vector import AsyncVectorEnv, AutoresetMode, VectorEnv
+from gymnasium.vector.utils import batch_space
+
+from game_simulator import GAME_WIDTH, GAME_HEIGHT, LIDAR_MAX_DISTANCE
+from kinematics import ACTION_TABLE
+from rl_env import GameEnv
+from stuck_detector import StuckDetector
+
+
+class NavEnv(gym.Env):
+    metadata = {"render_modes": ["human", "rgb_array"]}
+
+    def __init__(self, mode="Step_1", max_steps=200, reward_fn=None, action_table=ACTION_TABLE,
+                 mode_weights=None, lidar=None, render_mode=None, stuck=None):
+        """
+        - mode / mode_weights / lidar / reward_fn は GameEnv と同じ
+        - stuck: StuckConfig を渡すと停滞したエピソードを truncated で打ち切る（info["outcome"] は "stuck"）
+        - 行動は Discrete(len(action_table))、観測は float32 の Box（長さ 2 + ビーム数）
+        """
+        super().__init__()
+        self.env = GameEnv(reward_fn=reward_fn, action_table=action_table, mode=mode,
+                           mode_weights=mode_weights, lidar=lidar)
+        self.max_steps = max_steps
+        self.render_mode = render_mode
+        self.stuck_detector = StuckDetector(stuck) if stuck is not None else None
+        self.t = 0
+
+        # 状態: [ゴール距離/LIDAR_MAX_DISTANCE, 方向差/180, LiDAR(0～1)×n_beams]
+        n_beams = self.env.lidar_config.n_beams
+        max_goal_dist = math.hypot(GAME_WIDTH, GAME_HEIGHT) / LIDAR_MAX_DISTANCE
+        low = np.concatenate([[0.0, -1.0], np.zeros(n_beams)]).astype(np.float32)
+        high = np.concatenate([[max_goal_dist, 1.0], np.ones(n_beams)]).astype(np.float32)
+        self.observation_space = spaces.Box(low=low, high=high, dtype=np.float32)
+        self.action_space = spaces.Discrete(len(action_table))
+
+    # Gymnasium の約束どおり、1環境の reset/step は毎回新しい配列を返す
+    # （GameEnv のバッファは使い回されるので copy。まとめて動かすときは NavVectorEnv を使う）
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        obs, info = self.reset_into(None, seed, options)
+        return obs.copy(), info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.step_into(action, None)
+        return obs.copy(), reward, terminated, truncated, info
+
+    def reset_into(self, out, seed=None, options=None):
+        # Game は random / np.random を直接使うので、シードはそちらに入れる（evaluate.py と同じ）
+        # options={"snapshot": GameSnapshot} ならマップを作らずにその状態から始める（シードより後に戻すので乱数もスナップショットのもの）
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        self.t = 0
+        snapshot = (options or {}).get("snapshot")
+        obs = self.env.reset(out) if snapshot is None else self.env.restore(snapshot, out)
+        if self.stuck_detector is not None:
+            self.stuck_detector.reset(self.env.game)
+        return obs, {"mode": self.env.mode}
+
+    def step_into(self, action, out):
+        """
+        - step と同じだが、観測を out（共有配列の行など）に書き込む
+        - 戻り値: (obs, reward, terminated, truncated, info)
+        """
+        obs, reward, done, info = self.env.step(int(action), out)
+        self.t += 1
+        terminated = bool(done)
+        truncated = not terminated and self.t >= self.max_steps
+        stuck = None
+        if not terminated and self.stuck_detector is not None:
+            stuck = self.stuck_detector.update(self.env.game, obs)
+        if terminated:
+            info["outcome"] = "goal" if self.env.game.check_goal() else "collision"
+        elif stuck is not None:
+            truncated = True
+            info["outcome"] = "stuck"
+            info["stuck_reason"] = stuck
+        elif truncated:
+            info["outcome"] = "timeout"
+        return obs, float(reward), terminated, truncated, info
+
+    def render(self):
+        if self.render_mode is None:
+            return None
+        game = self.env.game
+        game.draw()
+        if self.render_mode == "rgb_array":
+            import pygame
+            return np.transpose(pygame.surfarray.array3d(game.screen), (1, 0, 2))
+        return None
+
+
+class NavVectorEnv(VectorEnv):
+    """
+    - 同一プロセスで num_envs 個の NavEnv をまとめて進める
+    - 観測・報酬・終了フラグは (num_envs, ...) の配列1つずつに各環境が直接書き込む
+    - 自動リセットは同じ step 内で行う（AutoresetMode.SAME_STEP）。
+      終了した環境の最後の観測は infos["final_obs"]、その info は infos["final_info"] に入る
+    - copy=False なら内部の配列をそのまま返す（次の step で上書きされる）
+    """
+    def __init__(self, num_envs, copy=True, **env_kwargs):
+        self.envs = [NavEnv(**env_kwargs) for _ in range(num_envs)]
+        self.num_envs = num_envs
+        self.copy = copy
+        self.metadata = {**NavEnv.metadata, "autoreset_mode": AutoresetMode.SAME_STEP}
+        self.render_mode = env_kwargs.get("render_mode")
+
+        self.single_observation_space = self.envs[0].observation_space
+        self.single_action_space = self.envs[0].action_space
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+
+        self._obs = np.zeros((num_envs,) + self.single_observation_space.shape, dtype=np.float32)
+        self._rewards = np.zeros(num_envs, dtype=np.float64)
+        self._terminations = np.zeros(num_envs, dtype=np.bool_)
+        self._truncations = np.zeros(num_envs, dtype=np.bool_)
+
+    def _output(self, array):
+        return array.copy() if self.copy else array
+
+    def reset(self, *, seed=None, options=None):
+        if seed is None or isinstance(seed, int):
+            seeds = [None if seed is None else seed + i for i in range(self.num_envs)]
+        else:
+            seeds = list(seed)
+        infos = {}
+        for i, (env, s) in enumerate(zip(self.envs, seeds)):
+            _, info = env.reset_into(self._obs[i], s)
+            infos = self._add_info(infos, info, i)
+        self._terminations[:] = False
+        self._truncations[:] = False
+        return self._output(self._obs), infos
+
+    def step(self, actions):
+        infos = {}
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            row = self._obs[i]
+            _, reward, terminated, truncated, info = env.step_into(action, row)
+            self._rewards[i] = reward
+            self._terminations[i] = terminated
+            self._truncations[i] = truncated
+            if terminated or truncated:
+                final_obs = row.copy()
+                _, reset_info = env.reset_into(row)
+                info = {**reset_info, "final_obs": final_obs, "final_info": info}
+            infos = self._add_info(infos, info, i)
+        return (self._output(self._obs), self._output(self._rewards),
+                self._output(self._terminations), self._output(self._truncations), infos)
+
+    def render(self):
+        return [env.render() for env in self.envs]
+
+
+def make_vector_env(num_envs, asynchronous=False, **env_kwargs):
+    """
+    - asynchronous=False: NavVectorEnv（同一プロセス。LiDARが軽い設定や少数の環境向け）
+    - asynchronous=True: gymnasium.vector.AsyncVectorEnv（環境ごとにサブプロセス、観測は共有メモリ経由）
+    - どちらも自動リセットは SAME_STEP
+    """
+    if not asynchronous:
+        return NavVectorEnv(num_envs, **env_kwargs)
+    return AsyncVectorEnv(
+        [functools.partial(NavEnv, **env_kwargs) for _ in range(num_envs)],
+        autoreset_mode=AutoresetMode.SAME_STEP,
+    )
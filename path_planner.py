@@ -0,0 +1,302 @@
+# path_planner.py
+# グリッド上の経路計画（ゴールからの距離場）を使った報酬の整形と、お手本エピソードによる事前学習
+#
+# improved_reward はゴールの向きしか見ないので、壁の向こうのゴールに対しては「壁に向かって進め」と教えてしまう。
+# ここでは map_check と同じ占有グリッド（ロボットの半径ぶん膨らませた障害物）で、
+# ゴール判定の範囲からの最短距離（8近傍のダイクストラ。全マスへの A* をまとめて解くのと同じ）を1エピソードに1回だけ求める。
+# - DistanceField.at(x, y): 任意の位置の「壁を回り込んだ」ゴールまでの距離[px]（周囲4マスの補間、O(1)）
+# - PotentialShaping: 報酬関数に F = gamma * Φ(s') - Φ(s)、Φ = -weight * 距離 / scale を足す（最適方策を変えない整形）
+# - expert_action / run_expert_episode: 距離場を下る方向へ進み、ゴールの手前で向きを合わせるお手本
+# - collect_demonstrations / prefill_agent / prefill_replay: お手本の遷移で学習前に Qテーブル・リプレイバッファを埋める
+import heapq
+import math
+
+import numpy as np
+
+import pygame
+
+from game_simulator import LIDAR_MAX_DISTANCE, ROBOT_RADIUS
+from map_check import GOAL_REACH, GRID_CELL, GRID_MARGIN, cell_centers, disk_mask, occupancy_grid, static_rects, to_cell
+from profiler import profiled
+
+PLANNER_CLEARANCE = 5  # 距離場では障害物をロボットの半径よりさらにこれだけ膨らませる[px]（壁すれすれの経路を避ける）
+SQRT2 = math.sqrt(2)
+_NEIGHBORS = [(-1, 0, 1.0), (1, 0, 1.0), (0, -1, 1.0), (0, 1, 1.0),
+              (-1, -1, SQRT2), (-1, 1, SQRT2), (1, -1, SQRT2), (1, 1, SQRT2)]
+
+
+def planning_rects(game):
+    """
+    - 距離場で避ける障害物の矩形。壁・静的障害物に加えて、今見えている動く障害物・点滅ドアも入れる
+      （GameEnv.step は障害物を動かさないので、学習中はその場に止まっている）
+    """
+    rects = static_rects(game)
+    extra = tuple((o.rect.x, o.rect.y, o.rect.w, o.rect.h) for o in game.dynamic_obstacles + game.blinking_doors if o.visible)
+    return rects + extra
+
+
+def geodesic_distance(free, target):
+    """
+    - target（bool 配列）の各マスからの最短距離[マス]を free 上の8近傍ダイクストラで求める
+    - 斜め移動は、角の両側のマスが空いているときだけ（壁の角をすり抜けない）
+    - 届かないマスは inf
+    """
+    h, w = free.shape
+    dist = np.full((h, w), np.inf)
+    heap = []
+    for r, c in zip(*np.nonzero(target & free)):
+        dist[r, c] = 0.0
+        heap.append((0.0, int(r), int(c)))
+    heapq.heapify(heap)
+    free_rows = free.tolist()  # 要素アクセスは list の方が速い
+    dist_rows = dist.tolist()
+    while heap:
+        d, r, c = heapq.heappop(heap)
+        if d > dist_rows[r][c]:
+            continue
+        for dr, dc, cost in _NEIGHBORS:
+            nr, nc = r + dr, c + dc
+            if not (0 <= nr < h and 0 <= nc < w) or not free_rows[nr][nc]:
+                continue
+            if dr and dc and not (free_rows[r + dr][c] and free_rows[r][c + dc]):
+                continue
+            nd = d + cost
+            if nd < dist_rows[nr][nc]:
+                dist_rows[nr][nc] = nd
+                heapq.heappush(heap, (nd, nr, nc))
+    return np.array(dist_rows)
+
+
+class DistanceField:
+    """
+    - game の障害物（planning_rects）とゴールから、グリッドの各マスのゴールまでの最短距離[px]を求めて持つ
+    - 届かないマス・障害物の中は max_distance（グリッド上で届くマスの最大値 + 1マス）として扱う
+    - 障害物は ROBOT_RADIUS + clearance だけ膨らませる（ゴールが壁際で余裕を取ると届かない場合は clearance なし）
+    """
+    def __init__(self, game, cell=GRID_CELL, margin=GRID_MARGIN, clearance=PLANNER_CLEARANCE):
+        self.cell = cell
+        self.margin = margin
+        self.goal = (game.goal_x, game.goal_y)
+        rects = planning_rects(game)
+        goal_disk = disk_mask(game.goal_x, game.goal_y, GOAL_REACH, cell, margin)
+        free = ~occupancy_grid(rects, cell, margin, ROBOT_RADIUS + clearance)
+        if not (goal_disk & free).any():
+            free = ~occupancy_grid(rects, cell, margin)
+        target = goal_disk & free
+        dist = geodesic_distance(free, target) * cell
+        self.reachable = np.isfinite(dist)
+        self.max_distance = (dist[self.reachable].max() if self.reachable.any() else 0.0) + cell
+        self.dist = np.where(self.reachable, dist, self.max_distance)
+        self.xs, self.ys = cell_centers(cell, margin)
+
+    def at(self, x, y):
+        """
+        - (x, y) のゴールまでの距離[px]（周囲4マスの双線形補間）
+        - 障害物側のマスは補間に混ぜない（混ぜると壁際に山ができて、狭い通路の手前が谷になる）
+        """
+        h, w = self.dist.shape
+        fc = (x - self.xs[0]) / self.cell
+        fr = (y - self.ys[0]) / self.cell
+        c0 = min(max(int(math.floor(fc)), 0), w - 2)
+        r0 = min(max(int(math.floor(fr)), 0), h - 2)
+        tc = min(max(fc - c0, 0.0), 1.0)
+        tr = min(max(fr - r0, 0.0), 1.0)
+        total = weight = 0.0
+        for r, c, k in ((r0, c0, (1 - tr) * (1 - tc)), (r0, c0 + 1, (1 - tr) * tc),
+                        (r0 + 1, c0, tr * (1 - tc)), (r0 + 1, c0 + 1, tr * tc)):
+            if self.reachable[r, c]:
+                total += k * self.dist[r, c]
+                weight += k
+        if weight <= 0.0:
+            return float(self.max_distance)
+        return total / weight
+
+    def waypoint(self, x, y, lookahead=3):
+        """
+        - (x, y) のマスから、距離が最も小さい隣のマスへ lookahead 回たどった先のマスの中心
+        - (x, y) のマスが届かない（障害物の余裕の内側）なら隣の届くマスのうち最も近いものの中心、それも無ければゴールの位置
+        """
+        h, w = self.dist.shape
+        r, c = to_cell(x, y, self.cell, self.margin)
+        r = min(max(r, 0), h - 1)
+        c = min(max(c, 0), w - 1)
+        if not self.reachable[r, c]:
+            # 障害物の近く（余裕の内側）にいるときは、まず一番近い届くマスへ戻る（角を斜めに切らない）
+            near = [((self.xs[c + dc] - x) ** 2 + (self.ys[r + dr] - y) ** 2, r + dr, c + dc) for dr, dc, _ in _NEIGHBORS
+                    if 0 <= r + dr < h and 0 <= c + dc < w and self.reachable[r + dr, c + dc]]
+            if not near:
+                return self.goal
+            _, r, c = min(near)
+            return float(self.xs[c]), float(self.ys[r])
+        for _ in range(lookahead):
+            best = (self.dist[r, c], r, c)
+            for dr, dc, _ in _NEIGHBORS:
+                nr, nc = r + dr, c + dc
+                if 0 <= nr < h and 0 <= nc < w and self.reachable[nr, nc] and self.dist[nr, nc] < best[0]:
+                    best = (self.dist[nr, nc], nr, nc)
+            if best[1:] == (r, c):
+                break
+            _, r, c = best
+        if self.dist[r, c] == 0.0:
+            return self.goal
+        return float(self.xs[c]), float(self.ys[r])
+
+    def direction(self, x, y):
+        # (x, y) から waypoint へ向かう向き[deg]（Robot.angle と同じく 0度=右、時計回り）
+        wx, wy = self.waypoint(x, y)
+        return math.degrees(math.atan2(wy - y, wx - x))
+
+
+class FieldCache:
+    # 同じ配置（障害物・ゴール）の距離場は作り直さない（古いものから捨てる）
+    def __init__(self, size=64, cell=GRID_CELL, margin=GRID_MARGIN):
+        self.size = size
+        self.cell = cell
+        self.margin = margin
+        self.fields = {}
+
+    @profiled("DistanceField")
+    def get(self, game):
+        key = (planning_rects(game), game.goal_x, game.goal_y)
+        field = self.fields.get(key)
+        if field is None:
+            field = DistanceField(game, self.cell, self.margin)
+            self.fields[key] = field
+            if len(self.fields) > self.size:
+                del self.fields[next(iter(self.fields))]
+        return field
+
+
+FIELD_CACHE = FieldCache()
+
+
+class PotentialShaping:
+    """
+    - reward_fn(env, state, done) に距離場のポテンシャル整形を足した報酬関数
+    - Φ(s) = -weight * 距離 / scale、F = gamma * Φ(s') - Φ(s)（終了時は Φ(s') = 0）
+    - GameEnv.reset から on_reset(env) が呼ばれ、その時点（スタート位置）の Φ を覚える。距離場は env ごとに env.distance_field に置く
+    - pickle できる（SharedMemoryVecEnv の env_kwargs にも渡せる）
+    """
+    def __init__(self, reward_fn, weight=1.0, gamma=0.99, scale=LIDAR_MAX_DISTANCE):
+        self.reward_fn = reward_fn
+        self.weight = weight
+        self.gamma = gamma
+        self.scale = scale
+
+    def potential(self, env):
+        robot = env.game.robot
+        return -self.weight * env.distance_field.at(robot.x, robot.y) / self.scale
+
+    def on_reset(self, env):
+        env.distance_field = FIELD_CACHE.get(env.game)
+        env.shaping_potential = self.potential(env)
+
+    def __call__(self, env, state, done):
+        reward = self.reward_fn(env, state, done)
+        if getattr(env, "distance_field", None) is None:
+            self.on_reset(env)  # reset を経ずに step された場合
+        next_potential = 0.0 if done else self.potential(env)
+        reward += self.gamma * next_potential - env.shaping_potential
+        env.shaping_potential = next_potential
+        return reward
+
+
+def expert_action(env, field=None, heading_cost=0.2, goal_margin=20):
+    """
+    - 距離場を使った1手先読みのお手本の行動インデックス
+    - ゴールから遠いとき: 移動後の距離 + heading_cost * 今の位置から waypoint への向きとのずれ[deg] が最小の行動
+    - ゴール判定の範囲内: その場で goal_angle に向きを合わせる（範囲から出る行動は選ばない）
+    - 止まる行動と、移動後に今見えている障害物とぶつかる行動は選ばない（動く障害物の次の動きまでは読まない）
+    """
+    game = env.game
+    field = field if field is not None else FIELD_CACHE.get(game)
+    table = env.action_table
+    robot = game.robot
+    n = len(table)
+    xs, ys, angles = table.step(np.full(n, robot.x), np.full(n, robot.y), np.full(n, robot.angle), np.arange(n))
+    obstacles = [obs.rect for obs in game.wall_obstacles + game.blinking_doors + game.obstacles + game.dynamic_obstacles
+                 if obs.visible]
+    near_goal = math.hypot(game.goal_x - robot.x, game.goal_y - robot.y) < GOAL_REACH
+    # 目標の向きは今の位置で1回だけ決める（候補ごとに変えると、その場で止まるのが最善になりやすい）
+    target_angle = game.goal_angle if near_goal else field.direction(robot.x, robot.y)
+    best, best_cost = 0, math.inf
+    for a in range(n):
+        if table.v_list[a] == 0 and table.omega_list[a] == 0:
+            continue
+        x, y, angle = float(xs[a]), float(ys[a]), float(angles[a])
+        # Robot.get_rect と同じ矩形（Rect の生成は座標を切り捨てる）
+        robot_rect = pygame.Rect(x - ROBOT_RADIUS, y - ROBOT_RADIUS, ROBOT_RADIUS * 2, ROBOT_RADIUS * 2)
+        if robot_rect.collidelist(obstacles) >= 0:
+            continue
+        if near_goal:
+            if math.hypot(game.goal_x - x, game.goal_y - y) >= GOAL_REACH - 1:
+                continue
+            cost = 0.0
+        else:
+            cost = field.at(x, y)
+        heading_err = abs((angle - target_angle + 180) % 360 - 180)
+        cost += heading_cost * heading_err
+        if near_goal and heading_err <= goal_margin:
+            cost -= 1000.0  # ゴール条件を満たす行動を最優先
+        if cost < best_cost:
+            best, best_cost = a, cost
+    return best
+
+
+def run_expert_episode(env, max_steps=200, heading_cost=0.2):
+    """
+    - env.reset してからお手本の方策で1エピソード走らせる
+    - 戻り値: (遷移のリスト [(状態, 行動, 報酬, 次状態, done)], 結果 "goal"/"collision"/"timeout")
+    """
+    state = env.reset().copy()
+    field = FIELD_CACHE.get(env.game)
+    transitions = []
+    outcome = "timeout"
+    for _ in range(max_steps):
+        action = expert_action(env, field, heading_cost)
+        next_state, reward, done, _ = env.step(action)
+        next_state = next_state.copy()
+        transitions.append((state, action, reward, next_state, done))
+        state = next_state
+        if done:
+            outcome = "goal" if env.game.check_goal() else "collision"
+            break
+    return transitions, outcome
+
+
+def collect_demonstrations(env, episodes=20, max_steps=200, only_success=True):
+    """
+    - お手本の方策で episodes エピソード走らせ、エピソードごとの遷移の配列をまとめて返す
+    - only_success=True ならゴールしたエピソードだけ残す
+    - 戻り値: [(状態, 行動, 報酬, 次状態, done), ...]（1要素が1エピソード、それぞれ NumPy 配列）
+    """
+    demos = []
+    outcomes = {"goal": 0, "collision": 0, "timeout": 0}
+    for _ in range(episodes):
+        transitions, outcome = run_expert_episode(env, max_steps)
+        outcomes[outcome] += 1
+        if transitions and (outcome == "goal" or not only_success):
+            s, a, r, s2, d = zip(*transitions)
+            demos.append((np.array(s), np.array(a), np.array(r, dtype=np.float64), np.array(s2), np.array(d)))
+    print(f"[expert] {episodes} エピソード: {outcomes}")
+    return demos
+
+
+def prefill_agent(agent, demos, passes=1, alpha=0.1, gamma=0.99):
+    """
+    - お手本の遷移で agent（QAgent / DQNAgent）を事前に学習させる
+    - 各エピソードの遷移を後ろから順に agent.update する（ゴールの価値が1回のなぞりでスタートまで伝わる）。passes 回くり返す
+    - 戻り値: 使った遷移数
+    """
+    for _ in range(passes):
+        for s, a, r, s2, d in demos:
+            for t in reversed(range(len(s))):
+                agent.update(s[t], int(a[t]), r[t], s2[t], alpha=alpha, gamma=gamma, done=bool(d[t]))
+    return sum(len(demo[0]) for demo in demos)
+
+
+def prefill_replay(replay, demos):
+    # お手本の遷移を replay_buffer.ReplayBuffer に入れる（戻り値: 入れた遷移数）
+    for s, a, r, s2, d in demos:
+        replay.add_batch(s, a, r, s2, d)
+    return sum(len(demo[0]) for demo in demos)
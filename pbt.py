@@ -0,0 +1,218 @@
+# pbt.py
+# 報酬係数の population-based training（PBT）
+#
+# grid_search は improved_reward の係数の組み合わせ（直積）ごとに Qテーブルを作り直して最初から学習する。
+# ここでは N_PROCS 個のワーカーがそれぞれ自分の係数と自分の Qテーブルを持つ「個体」として並列に学習し、
+# 世代（generation_episodes エピソード）ごとに
+# - 成績（ゴール率の指数移動平均）の下位 exploit_frac の個体は、上位 exploit_frac の個体から Qテーブルと係数をコピーし（exploit）
+# - コピーした係数を少しずらす（×0.8 / ×1.2、確率 resample_prob で探索範囲から引き直す）（explore）
+# 学習の途中で良い係数に寄せていくので、grid_search で組み合わせを1つずつ最初から学習するより少ないエピソード数で係数の空間を探せる。
+# 成績は報酬の合計ではなくゴール率で比べる（報酬の大きさは係数によって変わるので比べられない）。
+# 数エピソードのゴール率はほぼ偶然で決まるので、係数を変えてから min_exploit_episodes エピソードに満たない個体は
+# exploit の比較に入れない（既定値は13個体 × 10エピソード × 10世代 = 1300エピソードで、grid_search の EPISODES=130 の10倍かかる。
+# min_exploit_episodes=20 なので最初の exploit は2世代目の後。これより小さい設定は動作確認用）。
+#   python pbt.py
+import json
+import multiprocessing as mp
+import os
+import random
+import signal
+import sys
+
+from episode_stats import EpisodeStats, collect
+from multi_reward import REWARD_KEYS
+from train_rl import ACTION_SET, save_q_table, worker
+
+# 係数の探索範囲（下限, 上限）。初期値の引き直しと explore のはみ出しの切り詰めに使う
+PBT_SPACE = {
+    "angle_bonus": (0.0, 60.0),
+    "angle_penalty": (-60.0, 0.0),
+    "step_penalty": (-0.5, 0.0),
+    "forward_bonus": (0.0, 5.0),
+    "backward_penalty": (-5.0, 0.0),
+    "obstacle_avoid_bonus": (0.0, 5.0),
+    "goal_reward": (50.0, 300.0),
+    "goal_margin": (10, 60),  # 整数（px）
+}
+
+
+def sample_params(rng, space=PBT_SPACE):
+    # 探索範囲から一様に引いた係数
+    params = {}
+    for key in REWARD_KEYS:
+        low, high = space[key]
+        params[key] = rng.randint(low, high) if isinstance(low, int) else rng.uniform(low, high)
+    return params
+
+
+def perturb(params, rng, space=PBT_SPACE, factors=(0.8, 1.2), resample_prob=0.25):
+    """
+    - 係数ごとに、確率 resample_prob で探索範囲から引き直し、それ以外は factors のどれかを掛ける
+    - 0 の係数は掛けても動かないので、範囲の幅の 1/10 だけ上か下にずらす
+    - 探索範囲の外に出たら端に切り詰める
+    """
+    out = {}
+    for key in REWARD_KEYS:
+        low, high = space[key]
+        value = params[key]
+        if rng.random() < resample_prob:
+            value = rng.randint(low, high) if isinstance(low, int) else rng.uniform(low, high)
+        elif value == 0:
+            value = rng.choice((-1, 1)) * (high - low) / 10
+        else:
+            value = value * rng.choice(factors)
+        value = min(max(value, low), high)
+        out[key] = int(round(value)) if isinstance(low, int) else value
+    return out
+
+
+def format_params(params):
+    return ", ".join(f"{k}={params[k]:.3g}" for k in REWARD_KEYS)
+
+
+def run_generation(tables, locks, population, episodes, max_steps, seed_base, episode_offset, mode="Step_1", lidar=None):
+    """
+    - 個体ごとに worker を1つ（自分の係数・自分の Qテーブル）で episodes エピソード動かす
+    - 戻り値: 個体ごとの (エピソード数, ゴール数)
+    """
+    stats_queue = mp.Queue()
+    stats = EpisodeStats()
+    procs = []
+    for m, params in enumerate(population):
+        p = mp.Process(
+            target=worker,
+            args=(
+                seed_base + m, ACTION_SET, episodes, max_steps, stats_queue,
+                locks[m], tables[m],
+                *(params[key] for key in REWARD_KEYS),
+            ),
+            kwargs=dict(mode=mode, episode_offset=episode_offset, lidar=lidar),
+        )
+        procs.append(p)
+        p.start()
+    collect(stats_queue, len(population), stats, procs=procs)
+    for p in procs:
+        p.join()
+    print(f"[train] {stats.summary()}")
+    return [tuple(stats.per_worker.get(seed_base + m, (0, 0))) for m in range(len(population))]
+
+
+def exploit_explore(scores, population, tables, rng, exploit_frac=0.25, episodes=None, min_episodes=0,
+                    **perturb_kwargs):
+    """
+    - 成績の下位 exploit_frac の個体を、上位 exploit_frac からランダムに選んだ個体の Qテーブル・係数・成績で置き換え、係数をずらす
+    - episodes: 個体ごとの「今の係数になってから」のエピソード数。min_episodes に満たない個体は比べない（コピー元にも先にもならない）。
+      コピー先は係数が変わるので 0 に戻す
+    - population・scores・episodes はその場で書き換える
+    - 戻り値: [(コピー先, コピー元), ...]
+    """
+    members = range(len(population))
+    if episodes is not None:
+        members = [m for m in members if episodes[m] >= min_episodes]
+    if len(members) < 2:
+        return []
+    n_swap = max(1, int(len(members) * exploit_frac))
+    order = sorted(members, key=lambda m: scores[m], reverse=True)
+    top, bottom = order[:n_swap], order[-n_swap:]
+    copies = []
+    for m in bottom:
+        if m in top:
+            continue
+        src = rng.choice(top)
+        tables[m].clear()
+        tables[m].update(tables[src].copy())
+        population[m] = perturb(population[src], rng, **perturb_kwargs)
+        scores[m] = scores[src]
+        if episodes is not None:
+            episodes[m] = 0
+        copies.append((m, src))
+    return copies
+
+
+def run_pbt(
+    population_size=13, total_episodes=1300, generation_episodes=10, max_steps=200, mode="Step_1",
+    exploit_frac=0.25, score_decay=0.5, min_exploit_episodes=20, initial_params=None, seed=0, lidar=None,
+    save_dir="q_tables/pbt", results_path="runs/pbt_results.json",
+):
+    """
+    - population_size 個の個体（= ワーカー）で合計 total_episodes エピソードを学習
+    - 1世代は各個体 generation_episodes エピソード。世代の後に exploit_explore
+    - 成績: 世代ごとのゴール率の指数移動平均（score = score_decay * score + (1 - score_decay) * ゴール率）
+    - min_exploit_episodes: 今の係数で走ったエピソード数がこれに満たない個体は exploit で比べない
+      （既定値では min_exploit_episodes / generation_episodes = 2 世代たつまで誰もコピーされない。
+      exploit を最低1回するには total_episodes >= population_size * generation_episodes * (ceil(min_exploit_episodes / generation_episodes) + 1)）
+    - 既定の total_episodes=1300 は grid_search（train_rl.py の EPISODES=130）の10倍のエピソード数。
+      130 に揃えると 13個体 × 10エピソードの1世代だけで exploit が起きないので、同じ予算で比べるときは
+      generation_episodes と min_exploit_episodes も小さくする（成績はほぼ偶然になるので動作確認用）
+    - initial_params: 個体0の初期係数（None なら curriculum.REWARD_PARAMS）。ほかの個体は探索範囲から引く
+    - 世代ごとの係数・成績・コピーの記録を results_path に保存し、最後に成績1位の Qテーブルを save_dir/best.pkl に保存
+    - 戻り値: (1位の係数, 1位の Qテーブル, 世代ごとの記録)
+    """
+    if initial_params is None:
+        from curriculum import REWARD_PARAMS
+        initial_params = REWARD_PARAMS
+    rng = random.Random(seed)
+    population = [dict(initial_params)] + [sample_params(rng) for _ in range(population_size - 1)]
+    scores = [0.0] * population_size
+    member_episodes = [0] * population_size  # 今の係数になってからのエピソード数
+    n_generations = max(1, total_episodes // (population_size * generation_episodes))
+
+    manager = mp.Manager()
+    tables = [manager.dict() for _ in range(population_size)]
+    locks = [manager.Lock() for _ in range(population_size)]
+    history = []
+    main_pid = os.getpid()
+
+    def save_history():
+        os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+        with open(results_path, "w") as f:
+            json.dump(history, f, ensure_ascii=False, indent=2)
+
+    # Ctrl+Cハンドラ（ここまでの記録と1位の Qテーブルを保存して終了、ワーカーは何もせず終了）
+    def signal_handler(sig, frame):
+        if os.getpid() != main_pid:
+            sys.exit(0)
+        print("\n[Ctrl+C] 中断されました。ここまでの記録を保存します。")
+        save_history()
+        best = max(range(population_size), key=lambda m: scores[m])
+        save_q_table(tables[best], os.path.join(save_dir, "interrupted.pkl"))
+        sys.exit(0)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    for gen in range(n_generations):
+        results = run_generation(
+            tables, locks, population, generation_episodes, max_steps,
+            seed_base=seed + gen * population_size, episode_offset=gen * generation_episodes, mode=mode, lidar=lidar,
+        )
+        for m, (n_ep, goals) in enumerate(results):
+            rate = goals / n_ep if n_ep else 0.0
+            scores[m] = score_decay * scores[m] + (1 - score_decay) * rate
+            member_episodes[m] += n_ep
+        record = {
+            "generation": gen,
+            "members": [
+                {"params": dict(population[m]), "episodes": results[m][0], "goals": results[m][1], "score": scores[m],
+                 "episodes_with_params": member_episodes[m], "states": len(tables[m])}
+                for m in range(population_size)
+            ],
+        }
+        best = max(range(population_size), key=lambda m: scores[m])
+        print(f"[世代 {gen + 1}/{n_generations}] 1位: 個体{best} score={scores[best]:.2f} ({format_params(population[best])})")
+        if gen < n_generations - 1:
+            copies = exploit_explore(scores, population, tables, rng, exploit_frac=exploit_frac,
+                                     episodes=member_episodes, min_episodes=min_exploit_episodes)
+            record["copies"] = copies
+            for dst, src in copies:
+                print(f"  個体{dst} ← 個体{src}: {format_params(population[dst])}")
+        history.append(record)
+        save_history()
+
+    best = max(range(population_size), key=lambda m: scores[m])
+    best_table = tables[best].copy()
+    save_q_table(best_table, os.path.join(save_dir, "best.pkl"))
+    print(f"\n==== PBT 結果 ====\n1位: 個体{best} score={scores[best]:.2f}\n{format_params(population[best])}")
+    return dict(population[best]), best_table, history
+
+
+if __name__ == "__main__":
+    run_pbt()
@@ -0,0 +1,144 @@
+# profiler.py
+# 区間ごとの時間計測（マップ生成・LiDAR・報酬・ロック待ち・Q更新・ログ出力など）
+#
+# 環境変数 NAV_PROFILE=1 を付けて起動したときだけ有効（インポート時に判定）。
+# 無効なら @profiled はデコレート対象の関数をそのまま返し、TimedLock も使われないので余計なコストはない。
+#   NAV_PROFILE=1 python train_rl.py
+# 集計はプロセス（ワーカー）ごと。summary() で表、dump_chrome_trace() で chrome://tracing 用のJSONを出力する。
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("NAV_PROFILE", "") not in ("", "0")
+
+
+class Profiler:
+    def __init__(self, max_events=200_000):
+        self.stats = {}  # name -> [回数, 合計ns, 最大ns]
+        self.counters = {}
+        self.events = []  # Chrome trace 用（max_events を超えたら集計のみ）
+        self.max_events = max_events
+        self.pid = os.getpid()
+
+    def reset(self):
+        self.stats.clear()
+        self.counters.clear()
+        self.events.clear()
+        self.pid = os.getpid()
+
+    def record(self, name, start_ns, dur_ns):
+        st = self.stats.get(name)
+        if st is None:
+            self.stats[name] = [1, dur_ns, dur_ns]
+        else:
+            st[0] += 1
+            st[1] += dur_ns
+            if dur_ns > st[2]:
+                st[2] = dur_ns
+        if len(self.events) < self.max_events:
+            self.events.append((name, start_ns, dur_ns, threading.get_ident()))
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        lines = [f"{'区間':<32}{'回数':>10}{'合計[s]':>12}{'平均[ms]':>12}{'最大[ms]':>12}"]
+        for name, (n, total, peak) in sorted(self.stats.items(), key=lambda x: -x[1][1]):
+            lines.append(f"{name:<32}{n:>10}{total / 1e9:>12.3f}{total / n / 1e6:>12.3f}{peak / 1e6:>12.3f}")
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"{name:<32}{n:>10}")
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        events = [
+            {"name": name, "ph": "X", "ts": start / 1000, "dur": dur / 1000, "pid": self.pid, "tid": tid}
+            for name, start, dur, tid in self.events
+        ]
+        for name, n in self.counters.items():
+            events.append({"name": name, "ph": "C", "ts": time.perf_counter_ns() / 1000, "pid": self.pid, "args": {name: n}})
+        return events
+
+    def dump_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.chrome_trace()}, f)
+
+
+PROFILER = Profiler()
+
+
+class _Section:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        PROFILER.record(self.name, self.start, end - self.start)
+        return False
+
+
+_NULL_SECTION = contextlib.nullcontext()
+
+
+def section(name):
+    # with section("名前"): ... の区間を計測（無効時は何もしないコンテキスト）
+    return _Section(name) if ENABLED else _NULL_SECTION
+
+
+def count(name, n=1):
+    if ENABLED:
+        PROFILER.count(name, n)
+
+
+def profiled(name):
+    # 関数全体を計測するデコレータ（無効時は関数をそのまま返す）
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                end = time.perf_counter_ns()
+                PROFILER.record(name, start, end - start)
+        return wrapper
+    return decorator
+
+
+class TimedLock:
+    """
+    - ロック獲得までの待ち時間を計測するラッパー（with lock: の形で使う）
+    """
+    def __init__(self, lock, name="lock_wait"):
+        self.lock = lock
+        self.name = name
+
+    def __enter__(self):
+        start = time.perf_counter_ns()
+        self.lock.__enter__()
+        PROFILER.record(self.name, start, time.perf_counter_ns() - start)
+        return self
+
+    def __exit__(self, *exc):
+        return self.lock.__exit__(*exc)
+
+
+def merge_chrome_traces(paths, out_path):
+    # ワーカーごとのトレースを1ファイルにまとめる（pid で区別される）
+    events = []
+    for path in paths:
+        with open(path) as f:
+            events.extend(json.load(f)["traceEvents"])
+    with open(out_path, "w") as f:
+        json.dump({"traceEvents": events}, f)
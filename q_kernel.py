@@ -0,0 +1,154 @@
+# q_kernel.py
+# Qテーブルのまとめ更新（NumPy）
+#
+# Qテーブルを (状態ID, 行動ID) の2次元配列として扱い、複数の遷移を1回の配列演算で更新する。
+# 状態キー（QAgent.to_key のタプル）から状態IDへの対応は StateIndex で管理する。
+import numpy as np
+
+
+def td_update(q, s, a, rewards, s2, discounts, alpha=0.1, weights=None):
+    """
+    - q[s, a] を目標 rewards + discounts * max_a' q[s2, a'] に近づける（q はその場で更新）
+    - 1ステップQ学習なら discounts = gamma * (1 - done)、nステップなら gamma**n など
+    - 同じ (s, a) が複数回出てきた場合は、目標の平均に向けて
+      「alpha で k 回続けて更新した」のと同じ量だけ動かす（1 - (1 - alpha)**k）
+    - 目標はすべて更新前の q から計算する
+    - weights: 遷移ごとの重み（優先度付きリプレイの重要度サンプリングの補正など）。1件なら q[s, a] += alpha * w * td、
+      同じ (s, a) が複数回なら w * td の平均に向けて上と同じ量だけ動かす
+    - 戻り値: 各遷移のTD誤差
+    """
+    s = np.asarray(s, dtype=np.int64)
+    a = np.asarray(a, dtype=np.int64)
+    s2 = np.asarray(s2, dtype=np.int64)
+    n_actions = q.shape[1]
+
+    targets = np.asarray(rewards, dtype=q.dtype) + np.asarray(discounts, dtype=q.dtype) * q[s2].max(axis=1)
+    td = targets - q[s, a]
+
+    flat = s * n_actions + a
+    uniq, inv, counts = np.unique(flat, return_inverse=True, return_counts=True)
+    step_td = td if weights is None else td * np.asarray(weights, dtype=q.dtype)
+    mean_td = np.bincount(inv, weights=step_td, minlength=len(uniq)) / counts
+    step = 1.0 - (1.0 - alpha) ** counts
+    q[uniq // n_actions, uniq % n_actions] += step * mean_td
+    return td
+
+
+def n_step_returns(rewards, dones, gamma=0.99, n=1):
+    """
+    - 1エピソード分の報酬列から nステップ収益を計算する
+    - 戻り値: (G, boot, discounts)
+      G[t] = r[t] + gamma*r[t+1] + ... （最大nステップ、終端またはエピソード末尾で打ち切り）
+      boot[t] = ブートストラップに使う次状態の位置（states[boot[t]]、states は長さT+1）
+      discounts[t] = gamma**m（終端に到達した場合は0）
+    """
+    rewards = np.asarray(rewards, dtype=np.float64)
+    dones = np.asarray(dones, dtype=bool)
+    T = len(rewards)
+    G = np.zeros(T)
+    discounts = np.ones(T)
+    alive = np.ones(T, dtype=bool)  # まだ終端に達していないか
+    steps = np.zeros(T, dtype=np.int64)
+    t = np.arange(T)
+    for k in range(n):
+        idx = t + k
+        valid = alive & (idx < T)
+        G[valid] += discounts[valid] * rewards[idx[valid]]
+        discounts[valid] *= gamma
+        steps[valid] += 1
+        ended = np.zeros(T, dtype=bool)
+        ended[valid] = dones[idx[valid]]
+        alive &= ~ended & valid
+        discounts[ended] = 0.0
+    boot = t + steps
+    return G, boot, discounts
+
+
+def q_lambda_update(q, s, a, rewards, s2, dones, alpha=0.1, gamma=0.99, lam=0.9):
+    """
+    - Watkins の Q(λ)（適格度トレース）で1エピソード分をまとめて更新する（q はその場で更新）
+    - 時間方向は逐次だが、各ステップのトレース全体への反映は配列演算で行う
+    - 次の行動が貪欲行動でなければトレースを切る
+    """
+    s = np.asarray(s, dtype=np.int64)
+    a = np.asarray(a, dtype=np.int64)
+    s2 = np.asarray(s2, dtype=np.int64)
+    T = len(s)
+    trace_pos = {}  # (s, a) -> トレース配列の位置
+    trace_s = np.zeros(T, dtype=np.int64)
+    trace_a = np.zeros(T, dtype=np.int64)
+    trace_e = np.zeros(T)
+    n = 0
+    td = np.zeros(T)
+    for t in range(T):
+        greedy_next = int(np.argmax(q[s2[t]]))
+        target = rewards[t] + (0.0 if dones[t] else gamma * q[s2[t], greedy_next])
+        td[t] = target - q[s[t], a[t]]
+
+        # 置換トレース
+        sa = (s[t], a[t])
+        if sa in trace_pos:
+            trace_e[trace_pos[sa]] = 1.0
+        else:
+            trace_pos[sa] = n
+            trace_s[n], trace_a[n], trace_e[n] = sa[0], sa[1], 1.0
+            n += 1
+
+        # trace_pos で重複を除いているので単純な加算でよい
+        q[trace_s[:n], trace_a[:n]] += alpha * td[t] * trace_e[:n]
+
+        if dones[t]:
+            break
+        if t + 1 < T and a[t + 1] == greedy_next:
+            trace_e[:n] *= gamma * lam
+        else:
+            trace_pos.clear()
+            n = 0
+    return td
+
+
+class StateIndex:
+    """
+    - 状態キー → 状態ID（0, 1, 2, ...）の対応と、その状態IDで引ける Q 配列を持つ
+    - 新しいキーが来たら行を追加（容量は倍々で拡張）
+    """
+    def __init__(self, n_actions, capacity=1024, dtype=np.float64):
+        self.n_actions = n_actions
+        self.ids = {}
+        self.keys = []
+        self._q = np.zeros((capacity, n_actions), dtype=dtype)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.ids
+
+    @property
+    def q(self):
+        return self._q[:len(self.keys)]
+
+    def lookup(self, keys, add=True):
+        # add=False の場合、未登録のキーは -1
+        out = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            sid = self.ids.get(key)
+            if sid is None:
+                if not add:
+                    out[i] = -1
+                    continue
+                sid = len(self.keys)
+                self.ids[key] = sid
+                self.keys.append(key)
+            out[i] = sid
+        if len(self.keys) > len(self._q):
+            new_q = np.zeros((max(len(self.keys), 2 * len(self._q)), self.n_actions), dtype=self._q.dtype)
+            new_q[:len(self._q)] = self._q
+            self._q = new_q
+        return out
+
+    def update(self, keys, action_idx, rewards, next_keys, dones, alpha=0.1, gamma=0.99):
+        s = self.lookup(keys)
+        s2 = self.lookup(next_keys)
+        discounts = gamma * (1.0 - np.asarray(dones, dtype=np.float64))
+        return td_update(self.q, s, action_idx, rewards, s2, discounts, alpha=alpha)
@@ -0,0 +1,155 @@
+# replay_buffer.py
+# 遷移 (state, action, reward, next_state, done) を固定メモリのリングバッファに保存する
+#
+# 状態ベクトル（GameEnv.get_state）は [ゴール距離, ゴール方向差, LiDAR...] の並び。
+# LiDAR部分は0～1に正規化されているので uint8（または float16）に量子化して列ごとに保存する。
+# Qテーブル（QAgent.to_key は0.1刻みの丸め）の学習に使うときは lidar_scale=10 にして、キーと同じ刻みで保存する
+# （1/255刻みだと復元した値が0.1刻みの丸めの境界をまたいで、元の状態と別のキーになることがある）。
+# path を指定すると各列をディスク上のメモリマップファイル（.npy）に置く。
+import os
+
+import numpy as np
+
+from game_simulator import LIDAR_RESOLUTION
+
+HEADER_DIM = 2  # ゴール距離・ゴール方向差
+
+
+class ReplayBuffer:
+    def __init__(self, capacity, lidar_dim=LIDAR_RESOLUTION, lidar_dtype="uint8", path=None, alpha=0.6,
+                 lidar_scale=255):
+        """
+        - capacity: 保存できる遷移の最大数（超えたら古いものから上書き）
+        - lidar_dtype: "uint8"（1/lidar_scale 刻みに量子化）または "float16"
+        - lidar_scale: uint8 のときの刻みの逆数（255以下）。10 なら QAgent.to_key と同じ0.1刻みで、復元した状態のキーが元の状態と一致する
+        - path: 指定するとディスク上のメモリマップに保存（メモリに載らない量でもOK）
+        - alpha: 優先度付きサンプリングの強さ（0で一様）
+        """
+        if lidar_dtype not in ("uint8", "float16"):
+            raise ValueError(f"lidar_dtype は uint8 か float16: {lidar_dtype}")
+        if not 0 < lidar_scale <= 255:
+            raise ValueError(f"lidar_scale は 1〜255: {lidar_scale}")
+        self.capacity = capacity
+        self.lidar_dim = lidar_dim
+        self.lidar_dtype = np.dtype(lidar_dtype)
+        self.lidar_scale = lidar_scale
+        self.path = path
+        self.alpha = alpha
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        self.header = self._column("header", (capacity, HEADER_DIM), np.float32)
+        self.next_header = self._column("next_header", (capacity, HEADER_DIM), np.float32)
+        self.lidar = self._column("lidar", (capacity, lidar_dim), self.lidar_dtype)
+        self.next_lidar = self._column("next_lidar", (capacity, lidar_dim), self.lidar_dtype)
+        self.action = self._column("action", (capacity,), np.int8)
+        self.reward = self._column("reward", (capacity,), np.float32)
+        self.done = self._column("done", (capacity,), np.bool_)
+        # 優先度は alpha 乗した値を保存しておく（サンプリング時の累乗計算を省く）
+        self.priority = self._column("priority", (capacity,), np.float32)
+
+        self.pos = 0
+        self.size = 0
+        self.max_priority = 1.0
+
+    def _column(self, name, shape, dtype):
+        if self.path is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(
+            os.path.join(self.path, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape
+        )
+
+    def __len__(self):
+        return self.size
+
+    def _encode_lidar(self, lidar):
+        if self.lidar_dtype == np.uint8:
+            # 丸めは to_key と同じく float64 で（float32 のままだと丸めの境界で結果がずれることがある）
+            return np.rint(np.clip(np.asarray(lidar, dtype=np.float64), 0.0, 1.0) * self.lidar_scale)
+        return lidar
+
+    def _decode_lidar(self, lidar):
+        if self.lidar_dtype == np.uint8:
+            return lidar.astype(np.float32) / self.lidar_scale
+        return lidar.astype(np.float32)
+
+    def add(self, state, action_idx, reward, next_state, done):
+        i = self.pos
+        self.header[i] = state[:HEADER_DIM]
+        self.lidar[i] = self._encode_lidar(np.asarray(state[HEADER_DIM:]))
+        self.next_header[i] = next_state[:HEADER_DIM]
+        self.next_lidar[i] = self._encode_lidar(np.asarray(next_state[HEADER_DIM:]))
+        self.action[i] = action_idx
+        self.reward[i] = reward
+        self.done[i] = done
+        # 新しい遷移は最大優先度で入れて、最低1回はサンプルされやすくする
+        self.priority[i] = self.max_priority ** self.alpha
+        self.pos = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_batch(self, states, action_idx, rewards, next_states, dones):
+        states = np.asarray(states)
+        next_states = np.asarray(next_states)
+        n = len(states)
+        idx = (self.pos + np.arange(n)) % self.capacity
+        self.header[idx] = states[:, :HEADER_DIM]
+        self.lidar[idx] = self._encode_lidar(states[:, HEADER_DIM:])
+        self.next_header[idx] = next_states[:, :HEADER_DIM]
+        self.next_lidar[idx] = self._encode_lidar(next_states[:, HEADER_DIM:])
+        self.action[idx] = action_idx
+        self.reward[idx] = rewards
+        self.done[idx] = dones
+        self.priority[idx] = self.max_priority ** self.alpha
+        self.pos = int((self.pos + n) % self.capacity)
+        self.size = min(self.size + n, self.capacity)
+
+    def states(self, idx):
+        return np.concatenate([self.header[idx], self._decode_lidar(self.lidar[idx])], axis=1)
+
+    def next_states(self, idx):
+        return np.concatenate([self.next_header[idx], self._decode_lidar(self.next_lidar[idx])], axis=1)
+
+    def sample(self, batch_size, prioritized=False, beta=0.4):
+        """
+        - 一様（prioritized=False）または優先度に比例してサンプリング
+        - 戻り値: (states, actions, rewards, next_states, dones, idx, weights)
+        - weights は重要度サンプリングの補正係数（一様なら全部1）
+        """
+        if self.size == 0:
+            raise ValueError("リプレイバッファが空です。")
+        if prioritized:
+            p = self.priority[:self.size].astype(np.float64)
+            p /= p.sum()
+            idx = np.random.choice(self.size, batch_size, p=p)
+            weights = (self.size * p[idx]) ** (-beta)
+            weights = (weights / weights.max()).astype(np.float32)
+        else:
+            idx = np.random.randint(0, self.size, batch_size)
+            weights = np.ones(batch_size, dtype=np.float32)
+        return (
+            self.states(idx),
+            self.action[idx].astype(np.int64),
+            self.reward[idx],
+            self.next_states(idx),
+            self.done[idx],
+            idx,
+            weights,
+        )
+
+    def update_priorities(self, idx, td_errors, eps=1e-3):
+        # TD誤差が大きい遷移ほど優先的にサンプルされるようにする
+        p = np.abs(np.asarray(td_errors, dtype=np.float64)) + eps
+        self.max_priority = max(self.max_priority, float(p.max()))
+        self.priority[idx] = p ** self.alpha
+
+    def flush(self):
+        # メモリマップの内容をディスクに書き出す
+        if self.path is not None:
+            for col in (self.header, self.next_header, self.lidar, self.next_lidar,
+                        self.action, self.reward, self.done, self.priority):
+                col.flush()
+
+    def nbytes(self):
+        return sum(col.nbytes for col in (
+            self.header, self.next_header, self.lidar, self.next_lidar,
+            self.action, self.reward, self.done, self.priority))
@@ -1,47 +1,122 @@
 # rl_env.py
-from game_simulator import LIDAR_MAX_DISTANCE
+from game_simulator import LIDAR_MAX_DISTANCE, LIDAR_RESOLUTION, DEFAULT_LIDAR
 from game_simulator import Game   # Gameクラス本体（game_simulator.py）が同じディレクトリにあること
+from kinematics import ACTION_TABLE
+from map_check import SolvabilityChecker
+from profiler import profiled
+import collections
 import numpy as np
+import random
 print(LIDAR_MAX_DISTANCE)
+
+# 状態ベクトルの長さ（ゴール距離, 方向差, LiDAR×LIDAR_RESOLUTION）。LidarConfig を変えた場合は env.obs_dim
+OBS_DIM = 2 + LIDAR_RESOLUTION
+
+
 class GameEnv:
-    def __init__(self, reward_fn=None):
-        self.game = Game(mode="Step_1")
+    def __init__(self, reward_fn=None, action_table=ACTION_TABLE, mode="Step_1", mode_weights=None, obs_dtype=np.float32, lidar=None,
+                 check_solvable=True, max_map_retries=100):
+        # mode にリストを渡すと reset ごとに mode_weights の比率でモードを選ぶ（カリキュラム用）
+        # obs_dtype は浮動小数点型だけ（状態は正規化した実数で、方向差は負にもなる。整数型に入れると 0/1 に切り捨てられる）
+        if not np.issubdtype(np.dtype(obs_dtype), np.floating):
+            raise ValueError(f"obs_dtype は浮動小数点型（float16/float32/float64）: {np.dtype(obs_dtype)}")
+        # check_solvable: ゴールまで通れないマップ（map_check）は作り直す。max_map_retries 回続いたらそのまま使う
+        self.map_checker = SolvabilityChecker() if check_solvable else None
+        self.max_map_retries = max_map_retries
+        self.modes = [mode] if isinstance(mode, str) else list(mode)
+        self.mode_weights = mode_weights
+        self.mode = self.sample_mode()
+        # LiDARの本数・範囲・ノイズ（None なら従来の定数と同じ設定）
+        self.lidar_config = lidar if lidar is not None else DEFAULT_LIDAR
+        self.obs_dim = 2 + self.lidar_config.n_beams
+        self.game = self.new_game()
+        self.action_table = action_table
         self.reward_fn = reward_fn if reward_fn else self.default_reward
         self.done = False
+        # 状態は毎回新しい配列を作らず、環境が持つ2行のバッファに交互に書き込む
+        # （直前の state と next_state が同じ配列を指さないように2行）
+        self.obs_buffer = np.zeros((2, self.obs_dim), dtype=obs_dtype)
+        self.obs_slot = 0
+        self.lidar = np.zeros(self.lidar_config.n_beams, dtype=np.float32)  # 直近のLiDAR距離[px]（報酬計算で再利用）
 
-    def reset(self):
+    def reset(self, out=None):
         # ゲーム状態を初期化
-        self.game = Game(mode="Step_1")
+        self.mode = self.sample_mode()
+        self.game = self.new_game()
+        self.done = False
+        # 報酬関数がエピソードごとの準備を持っていれば呼ぶ（path_planner.PotentialShaping など）
+        on_reset = getattr(self.reward_fn, "on_reset", None)
+        if on_reset is not None:
+            on_reset(self)
+        return self.get_state(out)
+
+    def new_game(self):
+        # self.mode のマップを作る（解けないマップは捨てて作り直す）
+        game = Game(mode=self.mode, lidar=self.lidar_config)
+        if self.map_checker is None:
+            return game
+        for _ in range(self.max_map_retries):
+            if self.map_checker.check(game):
+                break
+            game = Game(mode=self.mode, lidar=self.lidar_config)
+        return game
+
+    def snapshot(self, include_rng=True):
+        # 今の世界の状態（game_simulator.GameSnapshot）。restore でここから何度でもやり直せる
+        return self.game.snapshot(include_rng)
+
+    def restore(self, snapshot, out=None):
+        """
+        - snapshot の状態から再開する（reset の代わり。マップは作り直さない）
+        - 戻り値: その時点の状態ベクトル（reset と同じ）
+        """
+        self.game.restore(snapshot)
+        self.mode = snapshot.mode
         self.done = False
-        return self.get_state()
+        on_reset = getattr(self.reward_fn, "on_reset", None)
+        if on_reset is not None:
+            on_reset(self)
+        return self.get_state(out)
+
+    def sample_mode(self):
+        if len(self.modes) == 1:
+            return self.modes[0]
+        return random.choices(self.modes, weights=self.mode_weights)[0]
 
-    def step(self, action):
-        # action: (v_left, v_right)のタプル
-        self.game.robot.update(*action)
+    @profiled("GameEnv.step")
+    def step(self, action, out=None):
+        # action: 行動インデックス（action_table の表引き）または (v_left, v_right)のタプル
+        if isinstance(action, (int, np.integer)):
+            self.game.robot.move(self.action_table.v_list[action], self.action_table.omega_list[action])
+        else:
+            self.game.robot.update(*action)
         done = self.game.check_goal() or self.game.check_collision()
         self.done = done
-        state = self.get_state()
+        state = self.get_state(out)
         reward = self.reward_fn(self, state, done)
         info = {}
         return state, reward, done, info
 
-    def get_state(self):
-        # 必要な状態変数をまとめて返す（ゴール距離/方向差/ライダー配列）
-        x, y = self.game.robot.x, self.game.robot.y
-        theta = self.game.robot.angle
-        goal_dx = self.game.goal_x - x
-        goal_dy = self.game.goal_y - y
-        goal_dist = np.hypot(goal_dx, goal_dy)
-        goal_dir = np.degrees(np.arctan2(goal_dx, -goal_dy)) % 360
-        goal_dir_diff = (goal_dir - theta + 180) % 360 - 180
-        # lidar = np.array(self.game.get_lidar_distances()) / LIDAR_MAX_DISTANCE
-        lidar = np.array(self.game.get_lidar_distances()) / LIDAR_MAX_DISTANCE
-
-        # 状態ベクトルとして結合して返す
-        return np.concatenate([
-            np.array([goal_dist / LIDAR_MAX_DISTANCE, goal_dir_diff / 180]),  # 正規化
-            lidar
-        ])
+    @profiled("GameEnv.get_state")
+    def get_state(self, out=None):
+        """
+        - 必要な状態変数をまとめて返す（ゴール距離/方向差/ライダー配列、長さ self.obs_dim）
+        - out を渡すとそこへ書き込む（複数環境で共有の (N, obs_dim) 配列の行を渡す使い方）
+        - out を省略すると環境内のバッファに書き込む。このバッファは2ステップ後に上書きされるので、
+          状態を溜めておく場合は copy() すること
+        """
+        if out is None:
+            self.obs_slot ^= 1
+            out = self.obs_buffer[self.obs_slot]
+        geom = self.game.geometry()
+        self.game.get_lidar_distances(out=self.lidar)
+
+        # 正規化してそのまま書き込む
+        # ゴール距離は LiDAR の設定によらず LIDAR_MAX_DISTANCE で正規化（設定を変えても意味が変わらないように）
+        out[0] = geom.distance / LIDAR_MAX_DISTANCE
+        out[1] = geom.bearing_diff / 180
+        np.divide(self.lidar, self.lidar_config.max_distance, out=out[2:])
+        return out
 
     def set_reward_function(self, fn):
         self.reward_fn = fn
@@ -55,3 +130,44 @@ class GameEnv:
         return -1
 
 
+
+
+class FailureStarts:
+    """
+    - 失敗（衝突・停滞）したエピソードの少し手前の状態を貯めておき、そこから再開させる（難しい場面の練習）
+    - 毎ステップ record(env) で every ステップごとにスナップショットを取り、
+      失敗したら failed() でその rewind ステップ前あたりのスナップショットを候補に入れる
+    - maybe_restore(env) は prob の確率で候補から1つ選んで env.restore し、状態を返す（選ばなければ None）
+    - 乱数の状態は含めない（再開後の障害物・ノイズは毎回変わる）
+    """
+    def __init__(self, capacity=256, every=10, rewind=30, prob=0.2):
+        self.starts = collections.deque(maxlen=capacity)
+        self.every = every
+        self.rewind = rewind
+        self.prob = prob
+        self.recent = collections.deque(maxlen=max(1, rewind // every + 1))
+        self.t = 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def begin(self, env):
+        # エピソードの最初（reset / restore の直後）に呼ぶ
+        self.recent.clear()
+        self.t = 0
+        self.record(env)
+
+    def record(self, env):
+        if self.t % self.every == 0:
+            self.recent.append(env.snapshot(include_rng=False))
+        self.t += 1
+
+    def failed(self):
+        # 残っている中で一番古いもの（rewind ステップ前くらい）を候補にする
+        if self.recent:
+            self.starts.append(self.recent[0])
+
+    def maybe_restore(self, env, out=None):
+        if not self.starts or random.random() >= self.prob:
+            return None
+        return env.restore(random.choice(self.starts), out)
@@ -0,0 +1,547 @@
+# sharded_q.py
+# 状態キーのハッシュで Qテーブルを P 個のシャードに分け、シャードごとのプロセスで持つ
+#
+# grid_search の worker は全員が1つの Manager.dict（サーバープロセス1つ）へ pickle 付きで読み書きするので、
+# 状態数もスループットもそのプロセス1つで頭打ちになる。
+# ここでは QAgent.to_key と同じ丸め（0.1刻み）の状態を int16 の行（値×10）にして、そのハッシュで担当シャードを決める。
+# - シャードサーバー: StateIndex を1つ持ち、担当する状態の Q値の取得・更新（q_kernel.td_update）をまとめて処理する
+# - クライアント（学習ワーカー）: ベクトル環境の1ステップ分の状態をシャードごとに振り分け、
+#   共有メモリの自分専用の枠（クライアント × シャード）に書いて1バイトの合図を送る（shm_vec_env と同じやり方）
+# - 1回のやり取りで「前のステップの遷移の更新」と「今の観測の Q値の取得」を同時に行う（1ステップ1往復）
+# Qテーブルの容量は各シャードのプロセスのメモリの合計、更新はシャードの数だけ並列になる。
+#   table = ShardedQTable(n_actions=len(ACTION_SET), num_shards=4, num_clients=8)
+#   client = ShardClient(**table.client_spec(0))       # 学習ワーカーのプロセス内で作る
+#   q, found, _ = client.request(encode_states(obs))
+#   q_table = table.q_table()                           # QAgent と同じ形式の辞書（save_q_table で保存できる）
+#   python sharded_q.py --shards 4 --workers 8 --envs 4 --episodes 100 --mode Step_1
+import argparse
+import contextlib
+import functools
+import multiprocessing as mp
+import random
+import time
+import traceback
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from episode_stats import EpisodeStats, collect
+from kinematics import ACTION_SET
+from nav_gym import make_vector_env
+from q_kernel import StateIndex, td_update
+from rl_env import OBS_DIM
+from shm_vec_env import _shared_array
+from train_rl import improved_reward, save_q_table
+
+_REQUEST, _DUMP, _LOAD, _LEN, _CLOSE = b"q", b"d", b"l", b"n", b"c"
+_OK, _ERROR = b"k", b"e"
+
+KEY_SCALE = 10  # QAgent.to_key の丸め（小数1桁）に合わせた倍率
+
+
+def encode_states(states):
+    """
+    - 状態ベクトル (N, obs_dim) → 丸めた値×10 の int16 (N, obs_dim)
+    - np.round(x, 1) は rint(x * 10) / 10 なので、decode_key で QAgent.to_key と同じタプルに戻せる
+    """
+    return np.rint(np.asarray(states, dtype=np.float64) * KEY_SCALE).astype(np.int16)
+
+
+def decode_key(code):
+    # int16 の行（または bytes）→ QAgent.to_key と同じタプル
+    if isinstance(code, bytes):
+        code = np.frombuffer(code, dtype=np.int16)
+    return tuple(code.astype(np.float64) / KEY_SCALE)
+
+
+def shard_of(codes, num_shards):
+    # 各行の担当シャード（どのプロセスでも同じ値になる決定的なハッシュ。Python の hash は使わない）
+    weights = np.arange(1, codes.shape[1] + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    h = (codes.astype(np.int64).view(np.uint64) * weights).sum(axis=1)
+    h ^= h >> np.uint64(29)
+    h *= np.uint64(0xBF58476D1CE4E5B9)
+    h ^= h >> np.uint64(32)
+    return (h % np.uint64(num_shards)).astype(np.int64)
+
+
+def _slot_specs(n_actions, obs_dim, batch_capacity):
+    # クライアント × シャードごとの共有メモリの枠
+    b = batch_capacity
+    return {
+        "counts": ((2,), np.int64),  # [更新の行数, 取得の行数]
+        "alpha": ((1,), np.float64),
+        "upd_codes": ((b, obs_dim), np.int16),
+        "upd_actions": ((b,), np.int64),
+        "upd_targets": ((b,), np.float64),
+        "td": ((b,), np.float64),
+        "get_codes": ((b, obs_dim), np.int16),
+        "q": ((b, n_actions), np.float64),
+        "found": ((b,), np.bool_),
+    }
+
+
+def _attach(blocks):
+    return {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf) for name, (shm, shape, dtype) in blocks.items()}
+
+
+def _serve(index, slot):
+    """
+    - 1つの枠の要求を処理する。更新を先に反映してから取得するので、同じ状態なら更新後の値が返る
+    - 更新の目標（r + 割引 × 次状態の最大Q値）はクライアント側で計算済み。ここでは td_update の割引を0にして使う
+    """
+    n_upd, n_get = (int(v) for v in slot["counts"])
+    if n_upd:
+        s = index.lookup([row.tobytes() for row in slot["upd_codes"][:n_upd]])
+        slot["td"][:n_upd] = td_update(index.q, s, slot["upd_actions"][:n_upd], slot["upd_targets"][:n_upd],
+                                       s, np.zeros(n_upd), alpha=float(slot["alpha"][0]))
+    if n_get:
+        s = index.lookup([row.tobytes() for row in slot["get_codes"][:n_get]], add=False)
+        found = s >= 0
+        q = slot["q"][:n_get]
+        q[:] = 0.0
+        q[found] = index.q[s[found]]
+        slot["found"][:n_get] = found
+
+
+def _shard_server(shard_id, control, conns, blocks, n_actions, capacity):
+    """
+    - シャード shard_id の StateIndex を持つサーバー
+    - conns[c] / blocks[c]: クライアント c との合図用パイプと共有メモリの枠
+    - control: 親プロセスからの操作（全件の書き出し・読み込み・件数・終了）
+    """
+    slots = [_attach(b) for b in blocks]
+    client_of = {conn: c for c, conn in enumerate(conns)}
+    live = [control] + list(conns)
+    index = StateIndex(n_actions, capacity=capacity)
+    try:
+        while True:
+            for conn in wait(live):
+                try:
+                    cmd = conn.recv_bytes()
+                except EOFError:
+                    # クライアントのプロセスが終わった
+                    live.remove(conn)
+                    continue
+                try:
+                    if cmd == _REQUEST:
+                        _serve(index, slots[client_of[conn]])
+                        conn.send_bytes(_OK)
+                    elif cmd == _DUMP:
+                        conn.send({key: index.q[i].tolist() for i, key in enumerate(index.keys)})
+                    elif cmd == _LOAD:
+                        rows = conn.recv()
+                        s = index.lookup(list(rows))
+                        index.q[s] = np.asarray(list(rows.values()), dtype=np.float64).reshape(len(s), n_actions)
+                        conn.send(_OK)
+                    elif cmd == _LEN:
+                        conn.send(len(index))
+                    elif cmd == _CLOSE:
+                        conn.send(_OK)
+                        return
+                except Exception:
+                    # クライアントには1バイト目 _ERROR の bytes、親プロセスには pickle で返す
+                    msg = _ERROR + f"shard {shard_id}: ".encode() + traceback.format_exc().encode()
+                    if conn is control:
+                        conn.send(msg)
+                    else:
+                        conn.send_bytes(msg)
+    finally:
+        slots = None
+        for conn in [control] + list(conns):
+            conn.close()
+
+
+class ShardClient:
+    """
+    - 1つの学習プロセスから全シャードへ要求を送る側（ShardedQTable.client_spec の内容で作る）
+    - request: 更新と取得をシャードごとに振り分けて全シャードへ同時に送り、返事をまとめて元の順に戻す
+    - 1つのシャードに batch_capacity 行を超えて振り分けられた場合は、何往復かに分けて送る
+    """
+    def __init__(self, conns, blocks, batch_capacity):
+        self.conns = conns
+        self.num_shards = len(conns)
+        self.batch_capacity = batch_capacity
+        self.slots = [_attach(b) for b in blocks]
+        self.n_requests = 0
+        self.n_rows = 0
+
+    def _split(self, codes):
+        # シャードごとの行番号のリスト
+        if codes is None or len(codes) == 0:
+            return [np.zeros(0, dtype=np.int64)] * self.num_shards
+        shard = shard_of(codes, self.num_shards)
+        order = np.argsort(shard, kind="stable")
+        bounds = np.searchsorted(shard[order], np.arange(self.num_shards + 1))
+        return [order[bounds[p]:bounds[p + 1]] for p in range(self.num_shards)]
+
+    def request(self, get_codes=None, upd_codes=None, upd_actions=None, upd_targets=None, alpha=0.1):
+        """
+        - upd_*: (状態, 行動) を目標 upd_targets に alpha で近づける（同じ (状態, 行動) は td_update と同じく目標の平均へ）
+          ただし1つのシャードへの更新が batch_capacity 行を超えて何往復かに分かれた場合、往復をまたぐ重複は順に更新される
+        - get_codes: Q値を取り出す状態（更新の後に読む）
+        - 戻り値: (Q値 (N, n_actions)、テーブルにあったか (N,)、更新のTD誤差)。テーブルにない状態の Q値は0
+        """
+        n_get = 0 if get_codes is None else len(get_codes)
+        n_upd = 0 if upd_codes is None else len(upd_codes)
+        n_actions = self.slots[0]["q"].shape[1]
+        q = np.zeros((n_get, n_actions))
+        found = np.zeros(n_get, dtype=bool)
+        td = np.zeros(n_upd)
+        get_rows = self._split(get_codes)
+        upd_rows = self._split(upd_codes)
+        if n_upd:
+            upd_actions = np.asarray(upd_actions, dtype=np.int64)
+            upd_targets = np.asarray(upd_targets, dtype=np.float64)
+        b = self.batch_capacity
+        n_rounds = max([0] + [-(-max(len(g), len(u)) // b) for g, u in zip(get_rows, upd_rows)])
+        for r in range(n_rounds):
+            sent = []
+            for p, slot in enumerate(self.slots):
+                g = get_rows[p][r * b:(r + 1) * b]
+                u = upd_rows[p][r * b:(r + 1) * b]
+                if len(g) == 0 and len(u) == 0:
+                    continue
+                slot["counts"][:] = (len(u), len(g))
+                slot["alpha"][0] = alpha
+                if len(u):
+                    slot["upd_codes"][:len(u)] = upd_codes[u]
+                    slot["upd_actions"][:len(u)] = upd_actions[u]
+                    slot["upd_targets"][:len(u)] = upd_targets[u]
+                if len(g):
+                    slot["get_codes"][:len(g)] = get_codes[g]
+                self.conns[p].send_bytes(_REQUEST)
+                sent.append((p, g, u))
+            for p, g, u in sent:
+                msg = self.conns[p].recv_bytes()
+                if msg != _OK:
+                    raise RuntimeError(f"shard {p} でエラー:\n{msg[1:].decode()}")
+                slot = self.slots[p]
+                q[g] = slot["q"][:len(g)]
+                found[g] = slot["found"][:len(g)]
+                td[u] = slot["td"][:len(u)]
+            self.n_requests += len(sent)
+        self.n_rows += n_get + n_upd
+        return q, found, td
+
+    def close(self):
+        self.slots = None
+        for conn in self.conns:
+            conn.close()
+
+
+class ShardedQTable:
+    """
+    - num_shards 個のシャードサーバーと、num_clients 個のクライアント用の共有メモリの枠・パイプを用意する
+    - client_spec(c): クライアント c を作るための引数（学習ワーカーのプロセスへ渡す。1つの c は1プロセスだけで使う）
+    - q_table() / load(q_table): QAgent と同じ形式の辞書との変換
+    - 使い終わったら close()
+    """
+    def __init__(self, n_actions=len(ACTION_SET), num_shards=4, num_clients=1, obs_dim=OBS_DIM,
+                 batch_capacity=256, capacity=4096, q_table=None):
+        self.n_actions = n_actions
+        self.num_shards = num_shards
+        self.num_clients = num_clients
+        self.batch_capacity = batch_capacity
+        self.closed = False
+        specs = _slot_specs(n_actions, obs_dim, batch_capacity)
+        self._shms = []
+        # blocks[c][p]: クライアント c とシャード p の枠
+        self._blocks = []
+        for _ in range(num_clients):
+            row = []
+            for _ in range(num_shards):
+                block = {}
+                for name, (shape, dtype) in specs.items():
+                    shm, _ = _shared_array(shape, dtype)
+                    self._shms.append(shm)
+                    block[name] = (shm, shape, dtype)
+                row.append(block)
+            self._blocks.append(row)
+
+        self._client_conns = [[None] * num_shards for _ in range(num_clients)]
+        self._controls = []
+        self._procs = []
+        for p in range(num_shards):
+            server_conns = []
+            for c in range(num_clients):
+                client_conn, server_conn = mp.Pipe()
+                self._client_conns[c][p] = client_conn
+                server_conns.append(server_conn)
+            control, child_control = mp.Pipe()
+            proc = mp.Process(
+                target=_shard_server,
+                args=(p, child_control, server_conns, [self._blocks[c][p] for c in range(num_clients)],
+                      n_actions, capacity),
+                daemon=True,
+            )
+            proc.start()
+            child_control.close()
+            for conn in server_conns:
+                conn.close()
+            self._controls.append(control)
+            self._procs.append(proc)
+        if q_table:
+            self.load(q_table)
+
+    def client_spec(self, c):
+        return dict(conns=self._client_conns[c], blocks=self._blocks[c], batch_capacity=self.batch_capacity)
+
+    def _reply(self, p):
+        msg = self._controls[p].recv()
+        if isinstance(msg, bytes) and msg.startswith(_ERROR):
+            raise RuntimeError(msg[1:].decode())
+        return msg
+
+    def load(self, q_table):
+        # QAgent 形式の辞書（キーは to_key のタプル）を各シャードに振り分けて書き込む
+        keys = list(q_table)
+        if not keys:
+            return
+        codes = encode_states(np.asarray(keys, dtype=np.float64))
+        shard = shard_of(codes, self.num_shards)
+        for p, control in enumerate(self._controls):
+            rows = {codes[i].tobytes(): list(q_table[keys[i]]) for i in np.flatnonzero(shard == p)}
+            control.send_bytes(_LOAD)
+            control.send(rows)
+        for p in range(self.num_shards):
+            self._reply(p)
+
+    def shard_sizes(self):
+        for control in self._controls:
+            control.send_bytes(_LEN)
+        return [self._reply(p) for p in range(self.num_shards)]
+
+    def __len__(self):
+        return sum(self.shard_sizes())
+
+    def q_table(self):
+        # 全シャードの内容を QAgent と同じ形式（to_key のタプル → list）の普通の辞書にまとめる
+        for control in self._controls:
+            control.send_bytes(_DUMP)
+        table = {}
+        for p in range(self.num_shards):
+            for code, row in self._reply(p).items():
+                table[decode_key(code)] = row
+        return table
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for control in self._controls:
+            with contextlib.suppress(OSError):
+                control.send_bytes(_CLOSE)
+        for control in self._controls:
+            with contextlib.suppress(OSError, EOFError):
+                control.recv()
+        for proc in self._procs:
+            proc.join()
+        for control in self._controls:
+            control.close()
+        for row in self._client_conns:
+            for conn in row:
+                conn.close()
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardedQAgent:
+    """
+    - ShardClient を QAgent と同じ呼び方で使う（select_action / select_action_index / update / update_batch / update_keys）
+    - select_action_indices: 全状態の Q値を1往復で取ってから行動を選ぶ（ベクトル環境用）
+    - update 系は「次状態の Q値の取得」と「更新」の2往復。学習ループでは sharded_worker のように
+      取得と前ステップの更新を request 1回にまとめた方が速い
+    """
+    def __init__(self, client, action_set=ACTION_SET):
+        self.client = client
+        self.action_set = action_set
+        self.n_actions = len(action_set)
+        self.action_index = {a: i for i, a in enumerate(action_set)}
+
+    @staticmethod
+    def to_key(state):
+        return tuple(np.round(np.asarray(state, dtype=np.float64), 1))
+
+    def to_action_index(self, action):
+        if isinstance(action, (int, np.integer)):
+            return int(action)
+        return self.action_index[action]
+
+    def choose(self, q, found, eval_mode=False, episodes=0):
+        """
+        - 取得済みの Q値から行動を選ぶ（QAgent と同じく、テーブルにない状態と探索率 epsilon の分はランダム）
+        - episodes: 環境ごとのエピソード番号（配列またはスカラー）
+        """
+        n = len(q)
+        actions = q.argmax(axis=1)
+        explore = ~found
+        if not eval_mode:
+            eps = np.maximum(0.02, 0.5 * (0.99 ** np.broadcast_to(np.asarray(episodes, dtype=np.float64), (n,))))
+            explore |= np.random.random(n) < eps
+        actions[explore] = np.random.randint(0, self.n_actions, explore.sum())
+        return actions
+
+    def select_action_indices(self, states, eval_mode=False, episodes=0):
+        q, found, _ = self.client.request(encode_states(states))
+        return self.choose(q, found, eval_mode=eval_mode, episodes=episodes)
+
+    def select_action_index(self, state, eval_mode=False, episode=0):
+        return int(self.select_action_indices(np.asarray(state)[None], eval_mode=eval_mode, episodes=episode)[0])
+
+    def select_action(self, state, eval_mode=False, episode=0):
+        return self.action_set[self.select_action_index(state, eval_mode=eval_mode, episode=episode)]
+
+    def update(self, state, action, reward, next_state, alpha=0.1, gamma=0.99, done=False):
+        td = self.update_batch(np.asarray(state)[None], [self.to_action_index(action)], [reward],
+                               np.asarray(next_state)[None], dones=[done], alpha=alpha, gamma=gamma)
+        return float(td[0])
+
+    def update_batch(self, states, action_idx, rewards, next_states, dones=None,
+                     alpha=0.1, gamma=0.99, discounts=None):
+        # QAgent.update_batch と同じ引数。戻り値: 各遷移のTD誤差
+        if discounts is None:
+            done_arr = np.zeros(len(states)) if dones is None else np.asarray(dones, dtype=np.float64)
+            discounts = gamma * (1.0 - done_arr)
+        return self._update_codes(encode_states(states), action_idx, rewards, encode_states(next_states),
+                                  discounts, alpha)
+
+    def update_keys(self, keys, action_idx, rewards, next_keys, discounts, alpha=0.1):
+        # QAgent.update_keys と同じ引数（to_key のタプルで受け取る。DynaQAgent から使える）
+        return self._update_codes(encode_states(np.asarray(keys, dtype=np.float64)), action_idx, rewards,
+                                  encode_states(np.asarray(next_keys, dtype=np.float64)), discounts, alpha)
+
+    def _update_codes(self, codes, action_idx, rewards, next_codes, discounts, alpha):
+        q_next, found, _ = self.client.request(next_codes)
+        max_next = np.where(found, q_next.max(axis=1), 0.0)
+        targets = np.asarray(rewards, dtype=np.float64) + np.asarray(discounts, dtype=np.float64) * max_next
+        _, _, td = self.client.request(upd_codes=codes, upd_actions=action_idx, upd_targets=targets, alpha=alpha)
+        return td
+
+
+def sharded_worker(worker_id, client_spec, episodes, stats_queue, envs_per_worker=4, alpha=0.1, gamma=0.99,
+                   seed=0, stop_event=None, **env_kwargs):
+    """
+    - envs_per_worker 個の環境（NavVectorEnv）を進め、合計 episodes エピソードで終わる学習ワーカー
+    - 1ステップごとに request 1回で「前のステップの遷移の更新」と「次の観測・最後の観測の Q値の取得」を行う。
+      更新は1ステップ遅れて反映されるが、その間にほかのワーカーが同じ状態を更新していても Manager 版と同じく問題にしない
+    - ゴール・衝突（terminated）はブートストラップなし、打ち切り（truncated）は自動リセット前の観測でブートストラップ
+    - 記録は episode_stats の形式で stats_queue に流し、最後に終了通知を送る
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    client = ShardClient(**client_spec)
+    agent = ShardedQAgent(client)
+    envs = make_vector_env(envs_per_worker, **env_kwargs)
+    n = envs.num_envs
+    episode = np.zeros(n, dtype=np.int64)
+    ep_reward = np.zeros(n)
+    ep_steps = np.zeros(n, dtype=np.int64)
+    ep_start = np.full(n, time.time())
+    finished = 0
+    goal_count = 0
+    try:
+        obs, _ = envs.reset(seed=seed)
+        codes = encode_states(obs)
+        q, found, _ = client.request(codes)
+        pending = (None, None, None)
+        while finished < episodes and not (stop_event is not None and stop_event.is_set()):
+            actions = agent.choose(q, found, episodes=episode)
+            next_obs, rewards, terminated, truncated, infos = envs.step(actions)
+            ep_reward += rewards
+            ep_steps += 1
+
+            done_idx = np.flatnonzero(terminated | truncated)
+            next_codes = encode_states(next_obs)
+            get_codes = next_codes
+            if len(done_idx):
+                final_obs = np.stack([infos["final_obs"][i] for i in done_idx])
+                get_codes = np.concatenate([next_codes, encode_states(final_obs)])
+            q_all, found_all, _ = client.request(get_codes, *pending, alpha=alpha)
+            q, found = q_all[:n], found_all[:n]
+
+            # 次状態の最大Q値（終了した環境は自動リセット前の観測の値）
+            max_next = np.where(found_all, q_all.max(axis=1), 0.0)
+            boot = max_next[:n].copy()
+            boot[done_idx] = max_next[n:]
+            targets = rewards + gamma * (1.0 - terminated) * boot
+            pending = (codes, actions, targets)
+            codes = next_codes
+
+            if len(done_idx):
+                final_info = infos.get("final_info", infos)
+                for i in done_idx:
+                    outcome = final_info["outcome"][i]
+                    goal_count += outcome == "goal"
+                    stats_queue.put((worker_id, int(episode[i]), float(ep_reward[i]), int(ep_steps[i]), outcome,
+                                     time.time() - ep_start[i]))
+                    episode[i] += 1
+                    ep_reward[i] = 0.0
+                    ep_steps[i] = 0
+                    ep_start[i] = time.time()
+                    finished += 1
+        if pending[0] is not None:
+            client.request(None, *pending, alpha=alpha)
+    finally:
+        envs.close()
+        client.close()
+        stats_queue.put((worker_id, None, goal_count, 0, "done", 0.0))
+
+
+def train_sharded(num_shards=4, num_workers=8, envs_per_worker=4, episodes_per_worker=100, mode="Step_1",
+                  max_steps=200, reward_params=None, alpha=0.1, gamma=0.99, q_table=None, save_path=None,
+                  seed=0, batch_capacity=256, early_stop=None, report_every=10.0):
+    """
+    - ShardedQTable（num_shards 個のシャード）と num_workers 個の sharded_worker で Q学習する
+    - grid_search の Manager.dict + Lock の代わりに使える（結果は同じ形式の辞書）
+    - 戻り値: (Qテーブルの辞書, EpisodeStats)
+    """
+    reward_fn = functools.partial(improved_reward, **(reward_params or {}))
+    stats = EpisodeStats()
+    stats_queue = mp.Queue()
+    stop_event = mp.Event()
+    with ShardedQTable(len(ACTION_SET), num_shards=num_shards, num_clients=num_workers,
+                       batch_capacity=batch_capacity, q_table=q_table) as table:
+        procs = []
+        for w in range(num_workers):
+            p = mp.Process(
+                target=sharded_worker,
+                args=(w, table.client_spec(w), episodes_per_worker, stats_queue),
+                kwargs=dict(envs_per_worker=envs_per_worker, alpha=alpha, gamma=gamma, seed=seed + 1000 * w,
+                            stop_event=stop_event, mode=mode, max_steps=max_steps, reward_fn=reward_fn),
+            )
+            p.start()
+            procs.append(p)
+        collect(stats_queue, num_workers, stats, stop_event=stop_event, early_stop=early_stop,
+                report_every=report_every, procs=procs)
+        for p in procs:
+            p.join()
+        sizes = table.shard_sizes()
+        result = table.q_table()
+    print(f"[sharded] {stats.summary()} 状態数={sum(sizes)} シャードごと={sizes}")
+    if save_path:
+        save_q_table(result, save_path)
+    return result, stats
+
+
+if __name__ == "__main__":
+    from curriculum import REWARD_PARAMS
+
+    parser = argparse.ArgumentParser(description="シャード分割した Qテーブルでの並列 Q学習")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--envs", type=int, default=4, help="ワーカー1つあたりの環境数")
+    parser.add_argument("--episodes", type=int, default=100, help="ワーカー1つあたりのエピソード数")
+    parser.add_argument("--mode", default="Step_1")
+    parser.add_argument("--max-steps", type=int, default=200)
+    parser.add_argument("--save", default="q_tables/q_table_sharded.pkl")
+    args = parser.parse_args()
+
+    train_sharded(args.shards, args.workers, args.envs, args.episodes, mode=args.mode, max_steps=args.max_steps,
+                  reward_params=REWARD_PARAMS, save_path=args.save)
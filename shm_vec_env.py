@@ -0,0 +1,246 @@
+# shm_vec_env.py
+# 共有メモリで観測をやり取りするサブプロセス版のベクトル環境
+#
+# train_rl.py の worker は1ステップごとに Manager.dict のプロキシへ pickle 付きの通信を行う。
+# ここでは K 個のワーカープロセスがそれぞれ M 個の NavEnv を持ち、
+#   行動・観測・報酬・終了フラグ・最後の観測（自動リセット前）を multiprocessing.shared_memory の配列に置く。
+# 1ステップあたりのパイプ通信は「進めて」「終わった」の1バイトずつだけなので、1つの学習プロセスで全コアを使える。
+#   envs = SharedMemoryVecEnv(num_workers=12, envs_per_worker=4, mode="Step_1")
+#   obs, info = envs.reset(seed=0)
+#   obs, rewards, terminated, truncated, info = envs.step(actions)
+import contextlib
+import functools
+import multiprocessing as mp
+import random
+import time
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+from gymnasium.vector import AutoresetMode, VectorEnv
+from gymnasium.vector.utils import batch_space
+
+from episode_stats import EpisodeStats
+from nav_gym import NavEnv
+from train_rl import ACTION_SET, QAgent, improved_reward
+
+# 結果コード（outcome 配列の値）
+OUTCOME_CODES = {"goal": 1, "collision": 2, "timeout": 3, "stuck": 4}
+OUTCOME_NAMES = {code: name for name, code in OUTCOME_CODES.items()}
+
+_STEP, _RESET, _CLOSE = b"s", b"r", b"c"
+_OK, _ERROR = b"k", b"e"
+
+
+def _shared_array(shape, dtype):
+    # 共有メモリを確保して、その上の NumPy 配列を返す
+    dtype = np.dtype(dtype)
+    size = max(1, int(np.prod(shape)) * dtype.itemsize)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _shm_worker(conn, start, count, env_kwargs, blocks):
+    """
+    - envs[start:start+count] を担当するワーカー
+    - 共有配列の自分の行だけを読み書きし、パイプでは1バイトの合図だけを送受信する
+    """
+    arrays = {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf) for name, (shm, shape, dtype) in blocks.items()}
+    rows = slice(start, start + count)
+    obs, final_obs = arrays["obs"][rows], arrays["final_obs"][rows]
+    actions, seeds = arrays["actions"][rows], arrays["seeds"][rows]
+    rewards, outcomes = arrays["rewards"][rows], arrays["outcomes"][rows]
+    terminations, truncations = arrays["terminations"][rows], arrays["truncations"][rows]
+    try:
+        envs = [NavEnv(**env_kwargs) for _ in range(count)]
+        while True:
+            cmd = conn.recv_bytes()
+            if cmd == _STEP:
+                for i, env in enumerate(envs):
+                    _, reward, terminated, truncated, info = env.step_into(actions[i], obs[i])
+                    rewards[i] = reward
+                    terminations[i] = terminated
+                    truncations[i] = truncated
+                    if terminated or truncated:
+                        # 自動リセット（SAME_STEP）: 最後の観測を退避してから同じ行にリセット後の観測を書く
+                        outcomes[i] = OUTCOME_CODES[info["outcome"]]
+                        final_obs[i] = obs[i]
+                        env.reset_into(obs[i])
+                    else:
+                        outcomes[i] = 0
+            elif cmd == _RESET:
+                for i, env in enumerate(envs):
+                    env.reset_into(obs[i], None if seeds[i] < 0 else int(seeds[i]))
+                outcomes[:] = 0
+            elif cmd == _CLOSE:
+                break
+            conn.send_bytes(_OK)
+    except Exception:
+        conn.send_bytes(_ERROR + traceback.format_exc().encode())
+    finally:
+        conn.close()
+
+
+class SharedMemoryVecEnv(VectorEnv):
+    """
+    - num_workers 個のプロセス × envs_per_worker 個の NavEnv（合計 num_envs）
+    - 観測は共有メモリの (num_envs, obs_dim) float32 配列。copy=False ならそのビューを返す（次の step で上書き）
+    - 自動リセットは SAME_STEP。終了した環境は infos["final_obs"] に最後の観測、infos["outcome"] に結果が入る
+    - env_kwargs は NavEnv にそのまま渡す（reward_fn は pickle できる関数・functools.partial にする）
+    - 使い終わったら close()（pygame が SIGTERM を横取りするので terminate には頼らない）
+    """
+    def __init__(self, num_workers, envs_per_worker=1, copy=True, **env_kwargs):
+        self.num_workers = num_workers
+        self.envs_per_worker = envs_per_worker
+        self.num_envs = num_workers * envs_per_worker
+        self.copy = copy
+        self.metadata = {**NavEnv.metadata, "autoreset_mode": AutoresetMode.SAME_STEP}
+        self.render_mode = None
+        self.closed = False
+
+        # 空間の情報だけ親プロセスでも1つ作って取る
+        probe = NavEnv(**env_kwargs)
+        self.single_observation_space = probe.observation_space
+        self.single_action_space = probe.action_space
+        self.observation_space = batch_space(self.single_observation_space, self.num_envs)
+        self.action_space = batch_space(self.single_action_space, self.num_envs)
+        obs_shape = (self.num_envs,) + self.single_observation_space.shape
+        del probe
+
+        specs = {
+            "obs": (obs_shape, np.float32),
+            "final_obs": (obs_shape, np.float32),
+            "actions": ((self.num_envs,), np.int64),
+            "seeds": ((self.num_envs,), np.int64),
+            "rewards": ((self.num_envs,), np.float64),
+            "terminations": ((self.num_envs,), np.bool_),
+            "truncations": ((self.num_envs,), np.bool_),
+            "outcomes": ((self.num_envs,), np.int8),
+        }
+        self._shms = {}
+        blocks = {}
+        for name, (shape, dtype) in specs.items():
+            shm, array = _shared_array(shape, dtype)
+            self._shms[name] = shm
+            setattr(self, f"_{name}", array)
+            blocks[name] = (shm, shape, dtype)
+
+        self._conns = []
+        self._procs = []
+        for w in range(num_workers):
+            parent_conn, child_conn = mp.Pipe()
+            p = mp.Process(
+                target=_shm_worker,
+                args=(child_conn, w * envs_per_worker, envs_per_worker, env_kwargs, blocks),
+            )
+            p.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._procs.append(p)
+
+    def _broadcast(self, cmd):
+        for conn in self._conns:
+            conn.send_bytes(cmd)
+        for w, conn in enumerate(self._conns):
+            msg = conn.recv_bytes()
+            if msg != _OK:
+                raise RuntimeError(f"worker {w} でエラー:\n{msg[1:].decode()}")
+
+    def _output(self, array):
+        return array.copy() if self.copy else array
+
+    def reset(self, *, seed=None, options=None):
+        if seed is None:
+            self._seeds[:] = -1
+        elif isinstance(seed, int):
+            self._seeds[:] = seed + np.arange(self.num_envs)
+        else:
+            self._seeds[:] = [-1 if s is None else s for s in seed]
+        self._broadcast(_RESET)
+        return self._output(self._obs), {}
+
+    def step(self, actions):
+        self._actions[:] = actions
+        self._broadcast(_STEP)
+        infos = {}
+        done = self._terminations | self._truncations
+        if done.any():
+            final_obs = np.full(self.num_envs, None, dtype=object)
+            outcome = np.full(self.num_envs, None, dtype=object)
+            for i in np.flatnonzero(done):
+                final_obs[i] = self._final_obs[i].copy()
+                outcome[i] = OUTCOME_NAMES[int(self._outcomes[i])]
+            infos = {"final_obs": final_obs, "_final_obs": done.copy(), "outcome": outcome, "_outcome": done.copy()}
+        return (self._output(self._obs), self._output(self._rewards),
+                self._output(self._terminations), self._output(self._truncations), infos)
+
+    def close_extras(self, **kwargs):
+        if self.closed:
+            return
+        for conn in self._conns:
+            with contextlib.suppress(OSError):
+                conn.send_bytes(_CLOSE)
+        for p in self._procs:
+            p.join()
+        for conn in self._conns:
+            conn.close()
+        # 共有メモリ上の配列を手放してから解放する
+        for name, shm in self._shms.items():
+            setattr(self, f"_{name}", None)
+            shm.close()
+            shm.unlink()
+
+
+def train_vectorized(num_workers=4, envs_per_worker=4, total_steps=20000, q_table=None,
+                     alpha=0.1, gamma=0.99, seed=0, **env_kwargs):
+    """
+    - SharedMemoryVecEnv を1つの学習プロセスから動かす Q学習（ロック・Manager なし）
+    - 全環境の遷移を1ステップごとに QAgent.update_batch でまとめて反映する
+    - ゴール・衝突（terminated）はブートストラップなし、max_steps の打ち切り（truncated）は最後の観測でブートストラップ
+    - 戻り値: (Qテーブル, EpisodeStats)
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    agent = QAgent(ACTION_SET, {} if q_table is None else q_table, contextlib.nullcontext())
+    stats = EpisodeStats()
+    envs = SharedMemoryVecEnv(num_workers, envs_per_worker, **env_kwargs)
+    try:
+        obs, _ = envs.reset(seed=seed)
+        n = envs.num_envs
+        episode = np.zeros(n, dtype=np.int64)
+        ep_reward = np.zeros(n)
+        ep_steps = np.zeros(n, dtype=np.int64)
+        ep_start = np.full(n, time.time())
+        for _ in range(total_steps // n):
+            actions = [agent.select_action_index(obs[i], eval_mode=False, episode=int(episode[i])) for i in range(n)]
+            next_obs, rewards, terminated, truncated, infos = envs.step(actions)
+            ep_reward += rewards
+            ep_steps += 1
+
+            # 終了した環境の次状態は自動リセット前の観測を使う
+            targets = next_obs
+            if "final_obs" in infos:
+                targets = next_obs.copy()
+                for i in np.flatnonzero(infos["_final_obs"]):
+                    targets[i] = infos["final_obs"][i]
+                    stats.add((i, int(episode[i]), float(ep_reward[i]), int(ep_steps[i]),
+                               infos["outcome"][i], time.time() - ep_start[i]))
+                    episode[i] += 1
+                    ep_reward[i] = 0.0
+                    ep_steps[i] = 0
+                    ep_start[i] = time.time()
+            agent.update_batch(obs, actions, rewards, targets, dones=terminated, alpha=alpha, gamma=gamma)
+            obs = next_obs
+    finally:
+        envs.close()
+    print(f"[train_vectorized] {stats.summary()}")
+    return agent.q_table, stats
+
+
+if __name__ == "__main__":
+    reward_fn = functools.partial(
+        improved_reward, angle_bonus=30, angle_penalty=-35, step_penalty=-0.05,
+        forward_bonus=0, backward_penalty=0, obstacle_avoid_bonus=0, goal_reward=100, goal_margin=30,
+    )
+    train_vectorized(num_workers=mp.cpu_count(), envs_per_worker=2, total_steps=50000,
+                     mode="Step_1", max_steps=200, reward_fn=reward_fn)
@@ -0,0 +1,133 @@
+# stuck_detector.py
+# 進展のないエピソード（その場で止まる・回り続ける・行ったり来たり）を早めに打ち切る
+#
+# ACTION_SET には (0, 0) やその場旋回があるので、学習初期の方策はゴールにも衝突にも至らず MAX_STEPS まで居座ることが多い。
+# 直近 window ステップの姿勢と状態キーをリングバッファに持ち、次のどれかに当てはまったら「停滞」とする。
+# - 位置: window ステップの間、最初の位置から min_displacement px 以上離れていない
+# - 状態: 同じ状態キー（丸めた状態ベクトル）が window 内に repeat_limit 回以上出てきた
+# - 向き: 向きの変化の符号が window 内に oscillation_flips 回以上入れ替わり、正味の回転が小さく、
+#   oscillation_radius px の範囲から出ていない（その辺りで左右に首を振っているだけ）
+# 停滞は失敗（terminated）ではなく打ち切り（truncated）として扱う。最後の遷移は次状態でブートストラップするので、
+# max_steps の時間切れと同じく収益の推定を偏らせない。
+#   detector = StuckDetector(StuckConfig(window=40))
+#   detector.reset(env.game)
+#   reason = detector.update(env.game, state)   # None または "no_progress" / "repeated_state" / "oscillation"
+import collections
+
+import numpy as np
+
+STUCK_REASONS = ("no_progress", "repeated_state", "oscillation")
+
+
+class StuckConfig:
+    """
+    - 停滞判定の設定（LidarConfig と同じく環境間で共有してよい。状態は StuckDetector 側が持つ）
+    - window: 判定に使う直近のステップ数（これより短いエピソードの序盤は判定しない）
+    - min_displacement: window の間に最初の位置から離れるべき距離[px]（0 で無効）
+    - repeat_limit: 同じ状態キーが window 内に何回出たら停滞か（0 で無効）
+    - oscillation_flips: 向きの変化の符号の入れ替わり回数の上限（0 で無効）、max_net_turn: そのときの正味の回転[deg]の上限、
+      oscillation_radius: そのときに最初の位置から離れていてよい距離[px]（動き回っている探索は打ち切らない）
+    """
+    def __init__(self, window=40, min_displacement=15.0, repeat_limit=30, oscillation_flips=12, max_net_turn=45.0,
+                 oscillation_radius=50.0):
+        if window < 2:
+            raise ValueError("window は2以上にしてください")
+        self.window = window
+        self.min_displacement = min_displacement
+        self.repeat_limit = repeat_limit
+        self.oscillation_flips = oscillation_flips
+        self.max_net_turn = max_net_turn
+        self.oscillation_radius = oscillation_radius
+
+    def __repr__(self):
+        return (f"StuckConfig(window={self.window}, min_displacement={self.min_displacement}, "
+                f"repeat_limit={self.repeat_limit}, oscillation_flips={self.oscillation_flips}, "
+                f"max_net_turn={self.max_net_turn}, oscillation_radius={self.oscillation_radius})")
+
+
+DEFAULT_STUCK = StuckConfig()
+
+
+class StuckDetector:
+    """
+    - 1環境ぶんの停滞判定。reset(game) → 毎ステップ update(game, state)
+    - 姿勢は (window,) の配列3本のリングバッファ、状態キーは deque と Counter（1ステップ O(1)、位置の判定だけ O(window) の NumPy）
+    - triggered: 打ち切った理由の回数（集計用）
+    """
+    def __init__(self, config=None):
+        self.config = config if config is not None else DEFAULT_STUCK
+        w = self.config.window
+        self.xs = np.zeros(w)
+        self.ys = np.zeros(w)
+        self.angles = np.zeros(w)
+        self.keys = collections.deque()
+        self.key_counts = collections.Counter()
+        self.triggered = dict.fromkeys(STUCK_REASONS, 0)
+        self.n = 0
+
+    def reset(self, game=None):
+        self.n = 0
+        self.keys.clear()
+        self.key_counts.clear()
+        if game is not None:
+            self._push_pose(game.robot)
+
+    def _push_pose(self, robot):
+        i = self.n % self.config.window
+        self.xs[i] = robot.x
+        self.ys[i] = robot.y
+        self.angles[i] = robot.angle
+        self.n += 1
+
+    @staticmethod
+    def state_key(state):
+        # QAgent.to_key と同じ丸め（0.1刻み）の bytes。辞書のキーにするだけなので tuple にはしない
+        return np.round(np.asarray(state, dtype=np.float64), 1).tobytes()
+
+    def update(self, game, state=None, key=None):
+        """
+        - 1ステップ進んだ後の game（と状態ベクトル state、または計算済みの状態キー key）を記録して判定する
+        - 戻り値: 停滞なら理由の文字列、そうでなければ None
+        """
+        cfg = self.config
+        self._push_pose(game.robot)
+        reason = None
+        if cfg.repeat_limit > 0 and (state is not None or key is not None):
+            key = self.state_key(state) if key is None else key
+            self.keys.append(key)
+            self.key_counts[key] += 1
+            if len(self.keys) > cfg.window:
+                old = self.keys.popleft()
+                self.key_counts[old] -= 1
+                if self.key_counts[old] == 0:
+                    del self.key_counts[old]
+            if self.key_counts[key] >= cfg.repeat_limit:
+                reason = "repeated_state"
+        if reason is None and self.n >= cfg.window:
+            reason = self._check_window()
+        if reason is not None:
+            self.triggered[reason] += 1
+        return reason
+
+    def _check_window(self):
+        cfg = self.config
+        w = cfg.window
+        start = self.n % w  # いちばん古い記録の位置
+        order = np.r_[start:w, 0:start]
+        dx = self.xs - self.xs[start]
+        dy = self.ys - self.ys[start]
+        max_sq = (dx * dx + dy * dy).max()
+        if cfg.min_displacement > 0 and max_sq < cfg.min_displacement ** 2:
+            return "no_progress"
+        if cfg.oscillation_flips > 0 and max_sq < cfg.oscillation_radius ** 2:
+            turns = np.diff(self.angles[order])
+            signs = np.sign(turns[turns != 0])
+            flips = int(np.count_nonzero(signs[1:] != signs[:-1]))
+            if flips >= cfg.oscillation_flips and abs(turns.sum()) <= cfg.max_net_turn:
+                return "oscillation"
+        return None
+
+    def summary(self):
+        counts = ", ".join(f"{k}={v}" for k, v in self.triggered.items())
+        return f"停滞打ち切り={sum(self.triggered.values())} ({counts})"
+
@@ -0,0 +1,6 @@
+# テストはリポジトリ直下のモジュールを import する（pygame は画面なしで動かす）
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,93 @@
+# actor_learner: ラーナーの更新が差分としてアクターに届くか
+import socket
+import threading
+from multiprocessing.connection import Client
+
+import numpy as np
+import pytest
+
+from actor_learner import Learner, _apply_message, run_local, serve
+from train_rl import ACTION_SET
+
+AUTHKEY = b"test-only-key"
+
+
+def free_address():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return ("localhost", s.getsockname()[1])
+
+
+def batch(seed=0, n=6):
+    rng = np.random.default_rng(seed)
+    states = np.round(rng.uniform(0, 1, (n, 4)), 1)
+    next_states = np.round(rng.uniform(0, 1, (n, 4)), 1)
+    return states, rng.integers(0, len(ACTION_SET), n), rng.normal(size=n), next_states, np.zeros(n, dtype=bool)
+
+
+def test_delta_contains_only_rows_changed_since_last_sync():
+    learner = Learner(len(ACTION_SET), sync_every=1)
+    local_q = {}
+    _apply_message(local_q, learner.snapshot(0))
+    assert local_q == {}
+
+    states, actions, rewards, next_states, dones = batch()
+    learner.apply(states, actions, rewards, next_states, dones)
+    msg = learner.delta_for(0)
+    assert msg[0] == "delta"
+    assert set(msg[1]) == {tuple(s) for s in states}  # 更新した状態だけ（次状態は送らない）
+    _apply_message(local_q, msg)
+    for key, row in learner.q_table().items():
+        if key in local_q:
+            np.testing.assert_allclose(local_q[key], row)
+    assert learner.delta_for(0) == ("ack",)  # 新しい更新がなければ差分なし
+
+
+def test_sync_every_batches_deltas():
+    learner = Learner(len(ACTION_SET), sync_every=2)
+    learner.snapshot(0)
+    learner.apply(*batch(seed=1))
+    assert learner.delta_for(0) == ("ack",)
+    learner.apply(*batch(seed=2))
+    assert learner.delta_for(0)[0] == "delta"
+
+
+def test_serve_sends_update_back_to_actor():
+    # ラーナーを別スレッドで起動し、アクターの代わりに手で1バッチ送って差分を受け取る
+    address = free_address()
+    result = {}
+    server = threading.Thread(
+        target=lambda: result.update(q_table=serve(1, address, authkey=AUTHKEY, report_every=1e9)[0]))
+    server.start()
+    conn = None
+    for _ in range(100):
+        try:
+            conn = Client(address, authkey=AUTHKEY)
+            break
+        except ConnectionRefusedError:
+            threading.Event().wait(0.05)
+    assert conn is not None
+    local_q = {}
+    _apply_message(local_q, conn.recv())
+    states, actions, rewards, next_states, dones = batch(seed=3)
+    conn.send(("batch", states, actions, rewards, next_states, dones, (0, 0, float(rewards.sum()), len(rewards), "timeout", 0.0)))
+    _apply_message(local_q, conn.recv())
+    conn.send(("done", 0, 0))
+    conn.close()
+    server.join(timeout=30)
+
+    assert set(local_q) == {tuple(s) for s in states}
+    for key, row in local_q.items():
+        np.testing.assert_allclose(row, result["q_table"][key])
+        assert np.abs(row).sum() > 0
+
+
+def test_serve_requires_authkey():
+    with pytest.raises(ValueError):
+        serve(1, free_address(), authkey=None)
+
+
+def test_run_local_round_trip():
+    q_table, stats = run_local(n_actors=2, episodes=2, address=free_address(), max_steps=15)
+    assert stats.episodes == 4
+    assert len(q_table) > 0
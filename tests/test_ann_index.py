@@ -0,0 +1,43 @@
+# NeighborFallback: QAgent のどの更新経路でも状態が索引に入り、未知の状態で近傍の Q値が使われるか
+import threading
+
+import numpy as np
+import pytest
+
+from ann_index import NeighborFallback
+from train_rl import ACTION_SET, QAgent
+
+
+def make_agent():
+    return QAgent(ACTION_SET, {}, threading.Lock(), fallback=NeighborFallback(k=3))
+
+
+@pytest.mark.parametrize("path", ["update", "update_batch", "n_step", "lambda"])
+def test_every_update_path_adds_keys(path):
+    agent = make_agent()
+    states = np.random.default_rng(0).uniform(0, 1, (6, 93))
+    actions, rewards, dones = [1, 2, 3, 4, 5], [0.0, 0.0, 0.0, 0.0, 1.0], [False] * 4 + [True]
+    if path == "update":
+        for t in range(5):
+            agent.update(states[t], actions[t], rewards[t], states[t + 1], done=dones[t])
+    elif path == "update_batch":
+        agent.update_batch(states[:-1], actions, rewards, states[1:], dones=dones)
+    elif path == "n_step":
+        agent.update_trajectory(states, actions, rewards, dones, n_step=3)
+    else:
+        agent.update_trajectory(states, actions, rewards, dones, lam=0.9)
+    assert set(agent.fallback.ids) == {
+        np.rint(np.asarray(k) * 10).astype(np.int16).tobytes() for k in agent.q_table
+    }
+
+
+def test_unknown_state_uses_neighbour_q_values():
+    agent = make_agent()
+    rng = np.random.default_rng(1)
+    state = rng.uniform(0, 1, 93)
+    agent.update(state, 7, 5.0, rng.uniform(0, 1, 93), done=True)
+    near = state.copy()
+    near[20] += 0.1  # 丸めたキーは別だが特徴はほぼ同じ
+    assert agent.to_key(near) not in agent.q_table
+    assert agent.select_action_index(near, eval_mode=True) == 7
+    assert agent.fallback.n_hits == 1
@@ -0,0 +1,25 @@
+# DynaModel の逆リンク（predecessors）が捨てた遷移の分だけ縮むか
+import random
+
+from dyna import DynaModel
+
+
+def test_predecessors_stay_bounded_by_capacity():
+    rng = random.Random(0)
+    model = DynaModel(capacity=50)
+    for _ in range(5000):
+        model.add(rng.randrange(500), rng.randrange(3), 0.0, rng.randrange(500), False)
+    assert len(model) == 50
+    # 逆リンクは残っている遷移とちょうど1対1で、空の集合は残らない
+    links = [(next_key, sa) for next_key, preds in model.predecessors.items() for sa in preds]
+    assert len(links) == len(model)
+    assert all(preds for preds in model.predecessors.values())
+    assert all(model.transitions[sa][1] == next_key for next_key, sa in links)
+
+
+def test_readd_moves_link_to_new_next_state():
+    model = DynaModel()
+    model.add("s", 0, 1.0, "a", False)
+    model.add("s", 0, 1.0, "b", False)
+    assert "a" not in model.predecessors
+    assert model.predecessors["b"] == {("s", 0)}
@@ -0,0 +1,39 @@
+# episode_stats.collect の集計と、落ちたワーカーを待ち続けないこと
+import multiprocessing as mp
+
+from episode_stats import EpisodeStats, collect, early_stop_rule
+
+
+def finishing_worker(stats_queue, seed):
+    stats_queue.put((seed, 0, 1.0, 5, "goal", 0.1))
+    stats_queue.put((seed, None, 1, 0, "done", 0.0))
+
+
+def crashing_worker(stats_queue, seed):
+    stats_queue.put((seed, 0, -1.0, 5, "collision", 0.1))
+    raise SystemExit(1)  # 終了通知を送らずに落ちる
+
+
+def test_collect_returns_when_a_worker_crashes():
+    stats_queue = mp.Queue()
+    stats = EpisodeStats()
+    procs = [mp.Process(target=f, args=(stats_queue, i))
+             for i, f in enumerate([finishing_worker, crashing_worker, finishing_worker])]
+    for p in procs:
+        p.start()
+    goal_count_total = collect(stats_queue, len(procs), stats, procs=procs)
+    for p in procs:
+        p.join()
+    assert goal_count_total == 2
+    assert stats.episodes == 3
+    assert stats.success_rate() == 2 / 3
+
+
+def test_early_stop_rule():
+    rule = early_stop_rule(min_episodes=4, success_above=0.9, success_below=0.1)
+    stats = EpisodeStats()
+    for ep in range(3):
+        stats.add((0, ep, 1.0, 5, "goal", 0.1))
+    assert not rule(stats)  # min_episodes 未満
+    stats.add((0, 3, 1.0, 5, "goal", 0.1))
+    assert rule(stats)
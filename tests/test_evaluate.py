@@ -0,0 +1,13 @@
+# evaluate: 行動セットが環境の運動学まで届くか、モードごとの集計
+from evaluate import evaluate
+
+STAY = [(0, 0)]  # 止まるだけの行動セット（既定の ACTION_SET のインデックス0は前進）
+
+
+def test_custom_action_set_reaches_env_kinematics():
+    report = evaluate({}, modes=("Step_0", "Step_1"), n_scenarios=3, max_steps=20, n_procs=1, action_set=STAY)
+    for mode, r in report.items():
+        assert r["episodes"] == 3
+        assert r["mean_path_length"] == 0.0
+        assert r["timeout_rate"] == 1.0
+        assert r["steps_per_sec"] > 0
@@ -0,0 +1,30 @@
+# ActionTable の表引きの運動学が Robot.update と同じ軌道になるか
+import numpy as np
+
+from kinematics import ACTION_SET, ActionTable, validate_kinematics
+
+
+def test_exact_table_matches_robot_update():
+    actions = np.random.default_rng(0).integers(0, len(ACTION_SET), 500)
+    pos_err, angle_err = validate_kinematics(ActionTable(ACTION_SET), actions)
+    assert pos_err < 1e-9
+    assert angle_err < 1e-9
+
+
+def test_heading_bins_error_is_bounded():
+    actions = np.random.default_rng(1).integers(0, len(ACTION_SET), 200)
+    pos_err, angle_err = validate_kinematics(ActionTable(ACTION_SET, heading_bins=3600), actions)
+    # 向きそのものは量子化しない（sin/cos の表引きだけ）。位置のずれは1px未満
+    assert angle_err < 1e-9
+    assert pos_err < 0.5
+
+
+def test_vectorized_step_matches_scalar():
+    table = ActionTable(ACTION_SET)
+    rng = np.random.default_rng(2)
+    x, y, angle = rng.uniform(0, 800, 8), rng.uniform(0, 600, 8), rng.uniform(-180, 180, 8)
+    idx = rng.integers(0, len(ACTION_SET), 8)
+    bx, by, ba = table.step(x, y, angle, idx)
+    for i in range(8):
+        sx, sy, sa = table.step(x[i], y[i], angle[i], idx[i])
+        assert (bx[i], by[i], ba[i]) == (sx, sy, sa)
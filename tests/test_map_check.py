@@ -0,0 +1,58 @@
+# SolvabilityChecker: 通れないマップを却下し、通れるマップは通すか
+from types import SimpleNamespace
+
+import pygame
+
+from game_simulator import HEIGHT, ROBOT_RADIUS, WIDTH
+from map_check import SolvabilityChecker
+
+
+def make_game(walls, robot=(100, 100), goal=(700, 500)):
+    # SolvabilityChecker が読む属性だけを持つ Game の代わり
+    return SimpleNamespace(
+        wall_obstacles=[SimpleNamespace(rect=pygame.Rect(*w)) for w in walls],
+        obstacles=[],
+        robot=SimpleNamespace(x=robot[0], y=robot[1]),
+        goal_x=goal[0], goal_y=goal[1],
+    )
+
+
+def wall_across(gap=None):
+    # 画面の縦いっぱいの壁（x=400〜410）。gap=(上端, 幅) を渡すとそこを開ける
+    if gap is None:
+        return [(400, -100, 10, HEIGHT + 200)]
+    top, width = gap
+    return [(400, -100, 10, top + 100), (400, top + width, 10, HEIGHT + 100 - top - width)]
+
+
+def test_open_map_is_accepted():
+    checker = SolvabilityChecker()
+    assert checker.check(make_game([(300, 300, 50, 50)]))
+    assert checker.check(make_game([]))
+    assert checker.n_rejected == 0
+
+
+def test_wall_across_the_map_is_rejected():
+    checker = SolvabilityChecker()
+    assert not checker.check(make_game(wall_across()))
+    assert checker.n_checked == 1 and checker.n_rejected == 1
+
+
+def test_box_around_the_goal_is_rejected():
+    box = [(650, 450, 100, 10), (650, 540, 100, 10), (650, 450, 10, 100), (740, 450, 10, 100)]
+    assert not SolvabilityChecker().check(make_game(box))
+
+
+def test_gap_must_fit_the_robot():
+    checker = SolvabilityChecker()
+    assert checker.check(make_game(wall_across(gap=(250, 4 * ROBOT_RADIUS))))
+    assert not checker.check(make_game(wall_across(gap=(250, ROBOT_RADIUS))))
+
+
+def test_results_are_cached_per_layout():
+    checker = SolvabilityChecker()
+    game = make_game(wall_across())
+    assert not checker.check(game)
+    assert not checker.check(game)
+    assert checker.cache_hits == 1
+    assert checker.rejected_fraction == 1.0
@@ -0,0 +1,49 @@
+# MultiResQAgent: どの更新経路でも粗い段階と最も細かい段階の訪問回数が揃うか
+import threading
+
+import numpy as np
+import pytest
+
+from multires_q import MultiResQAgent
+from train_rl import ACTION_SET
+
+
+def trajectory(seed=0, T=5):
+    rng = np.random.default_rng(seed)
+    states = rng.uniform(0, 1, (T + 1, 93))
+    actions = rng.integers(0, len(ACTION_SET), T)
+    rewards = rng.normal(size=T)
+    dones = [False] * (T - 1) + [True]
+    return states, actions, rewards, dones
+
+
+@pytest.mark.parametrize("path", ["update", "update_batch", "n_step", "lambda"])
+def test_every_update_path_updates_all_levels(path):
+    agent = MultiResQAgent(ACTION_SET, {}, threading.Lock())
+    states, actions, rewards, dones = trajectory()
+    if path == "update":
+        for t in range(len(actions)):
+            agent.update(states[t], actions[t], rewards[t], states[t + 1], done=dones[t])
+    elif path == "update_batch":
+        agent.update_batch(states[:-1], actions, rewards, states[1:], dones=dones)
+    elif path == "n_step":
+        agent.update_trajectory(states, actions, rewards, dones, n_step=3)
+    else:
+        agent.update_trajectory(states, actions, rewards, dones, lam=0.9)
+    assert sum(agent.fine_visits.values()) == len(actions)
+    for table in agent.tables:
+        assert table.visits.sum() == len(actions)
+        assert np.abs(table.q).sum() > 0
+
+
+def test_lambda_levels_match_one_step_updates():
+    # Q(λ) の経路でも、粗い段階は1ステップのQ学習（update_batch と同じ値）
+    states, actions, rewards, dones = trajectory(seed=1)
+    a = MultiResQAgent(ACTION_SET, {}, threading.Lock())
+    b = MultiResQAgent(ACTION_SET, {}, threading.Lock())
+    a.update_trajectory(states, actions, rewards, dones, lam=0.9)
+    b.update_batch(states[:-1], actions, rewards, states[1:], dones=dones)
+    for ta, tb in zip(a.tables, b.tables):
+        assert ta.keys == tb.keys
+        np.testing.assert_allclose(ta.q, tb.q)
+
@@ -0,0 +1,37 @@
+# pbt の exploit / explore（Qテーブルのコピーと係数のずらし）
+import random
+
+from pbt import PBT_SPACE, exploit_explore, perturb, sample_params
+
+
+def test_perturb_stays_in_space():
+    rng = random.Random(0)
+    params = sample_params(rng)
+    for _ in range(200):
+        params = perturb(params, rng)
+        for key, (low, high) in PBT_SPACE.items():
+            assert low <= params[key] <= high
+        assert isinstance(params["goal_margin"], int)
+
+
+def test_exploit_copies_bottom_from_top():
+    rng = random.Random(0)
+    population = [sample_params(rng) for _ in range(4)]
+    tables = [{("s", m): [float(m)]} for m in range(4)]
+    scores = [0.9, 0.1, 0.5, 0.3]
+    copies = exploit_explore(scores, population, tables, rng, exploit_frac=0.25)
+    assert copies == [(1, 0)]
+    assert tables[1] == tables[0]
+    assert scores[1] == 0.9
+
+
+def test_exploit_skips_members_with_few_episodes():
+    rng = random.Random(0)
+    population = [sample_params(rng) for _ in range(4)]
+    tables = [{("s", m): [float(m)]} for m in range(4)]
+    scores = [0.9, 0.1, 0.5, 0.3]
+    episodes = [20, 5, 20, 20]  # 最下位の個体1はまだ比べない
+    copies = exploit_explore(scores, population, tables, rng, exploit_frac=0.25, episodes=episodes, min_episodes=10)
+    assert copies == [(3, 0)]
+    assert episodes == [20, 5, 20, 0]
+    assert exploit_explore(scores, population, tables, rng, episodes=[0, 0, 0, 0], min_episodes=10) == []
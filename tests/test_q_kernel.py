@@ -0,0 +1,69 @@
+# q_kernel のまとめ更新が、1件ずつ更新するループと同じ結果になるか
+import numpy as np
+
+from q_kernel import StateIndex, n_step_returns, td_update
+
+
+def sequential_td(q, s, a, rewards, s2, discounts, alpha):
+    # 1件ずつ更新する素朴な実装（目標は更新前の q から計算する点は td_update と同じ）
+    q0 = q.copy()
+    for si, ai, r, s2i, d in zip(s, a, rewards, s2, discounts):
+        target = r + d * q0[s2i].max()
+        q[si, ai] += alpha * (target - q[si, ai])
+
+
+def test_td_update_matches_loop_without_duplicates():
+    rng = np.random.default_rng(0)
+    q = rng.normal(size=(20, 5))
+    s = rng.permutation(20)[:10]
+    a = rng.integers(0, 5, 10)
+    rewards = rng.normal(size=10)
+    s2 = rng.integers(0, 20, 10)
+    discounts = rng.uniform(0, 1, 10)
+    expected = q.copy()
+    sequential_td(expected, s, a, rewards, s2, discounts, alpha=0.3)
+    td_update(q, s, a, rewards, s2, discounts, alpha=0.3)
+    np.testing.assert_allclose(q, expected)
+
+
+def test_td_update_duplicates_match_repeated_updates():
+    # 同じ遷移が k 回 → 1件ずつ k 回更新したのと同じ（次状態の行は更新されない）
+    rng = np.random.default_rng(1)
+    q = rng.normal(size=(6, 3))
+    s = [0, 0, 0, 1, 2, 2]
+    a = [1, 1, 1, 0, 2, 2]
+    rewards = [1.0, 1.0, 1.0, -1.0, 0.5, 0.5]
+    s2 = [3, 3, 3, 4, 5, 5]
+    discounts = [0.9] * 6
+    expected = q.copy()
+    sequential_td(expected, s, a, rewards, s2, discounts, alpha=0.2)
+    td_update(q, s, a, rewards, s2, discounts, alpha=0.2)
+    np.testing.assert_allclose(q, expected)
+
+
+def test_td_update_duplicates_move_toward_mean_target():
+    q = np.zeros((2, 1))
+    td = td_update(q, [0, 0], [0, 0], [1.0, 3.0], [1, 1], [0.0, 0.0], alpha=0.5)
+    np.testing.assert_allclose(td, [1.0, 3.0])
+    np.testing.assert_allclose(q[0, 0], (1 - 0.5 ** 2) * 2.0)
+
+
+def test_td_update_weights_scale_step():
+    q = np.zeros((3, 1))
+    td_update(q, [0, 1], [0, 0], [1.0, 1.0], [2, 2], [0.0, 0.0], alpha=0.5, weights=[0.5, 1.0])
+    np.testing.assert_allclose(q[:2, 0], [0.25, 0.5])
+
+
+def test_state_index_grows_and_keeps_ids():
+    index = StateIndex(2, capacity=1)
+    ids = index.lookup([("a",), ("b",), ("a",), ("c",)])
+    np.testing.assert_array_equal(ids, [0, 1, 0, 2])
+    assert index.q.shape == (3, 2)
+    np.testing.assert_array_equal(index.lookup([("d",)], add=False), [-1])
+
+
+def test_n_step_returns_stop_at_terminal():
+    G, boot, discounts = n_step_returns([1.0, 2.0, 3.0], [False, True, False], gamma=0.5, n=2)
+    np.testing.assert_allclose(G, [1.0 + 0.5 * 2.0, 2.0, 3.0])
+    np.testing.assert_array_equal(boot, [2, 2, 3])
+    np.testing.assert_allclose(discounts, [0.0, 0.0, 0.5])
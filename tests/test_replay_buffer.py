@@ -0,0 +1,87 @@
+# ReplayBuffer: 量子化した LiDAR の復元・優先度付きサンプリングの重み
+import numpy as np
+import pytest
+
+from replay_buffer import ReplayBuffer
+from train_rl import QAgent
+
+LIDAR_DIM = 91
+
+
+def random_states(n, seed=0):
+    # 実際の観測と同じ float32（ゴール距離・方向差・0〜1 の LiDAR）
+    rng = np.random.default_rng(seed)
+    states = rng.uniform(0, 1, (n, 2 + LIDAR_DIM))
+    states[:, 1] = rng.uniform(-1, 1, n)
+    return states.astype(np.float32)
+
+
+def filled(n=200, seed=0, **kwargs):
+    buf = ReplayBuffer(n, lidar_dim=LIDAR_DIM, **kwargs)
+    states = random_states(n + 1, seed)
+    rng = np.random.default_rng(seed)
+    buf.add_batch(states[:-1], rng.integers(0, 21, n), rng.normal(size=n), states[1:], rng.random(n) < 0.1)
+    return buf, states
+
+
+def test_key_grid_round_trip_keeps_q_keys():
+    buf, states = filled(lidar_scale=10)
+    idx = np.arange(len(buf))
+    for original, decoded in zip(states[:-1], buf.states(idx)):
+        assert QAgent.to_key(None, decoded) == QAgent.to_key(None, original)
+    for original, decoded in zip(states[1:], buf.next_states(idx)):
+        assert QAgent.to_key(None, decoded) == QAgent.to_key(None, original)
+
+
+def test_default_uint8_is_close_but_finer_than_key_grid():
+    buf, states = filled()
+    decoded = buf.states(np.arange(len(buf)))
+    np.testing.assert_allclose(decoded[:, 2:], states[:-1, 2:], atol=0.5 / 255 + 1e-6)
+    np.testing.assert_array_equal(decoded[:, :2], states[:-1, :2])
+
+
+def test_add_matches_add_batch():
+    a, states = filled(n=20, seed=3)
+    b = ReplayBuffer(20, lidar_dim=LIDAR_DIM)
+    for i in range(20):
+        b.add(states[i], int(a.action[i]), float(a.reward[i]), states[i + 1], bool(a.done[i]))
+    idx = np.arange(20)
+    np.testing.assert_array_equal(a.states(idx), b.states(idx))
+    np.testing.assert_array_equal(a.next_states(idx), b.next_states(idx))
+
+
+def test_invalid_lidar_scale():
+    with pytest.raises(ValueError):
+        ReplayBuffer(10, lidar_dim=LIDAR_DIM, lidar_scale=256)
+
+
+def test_uniform_weights_are_one():
+    buf, _ = filled()
+    *_, idx, weights = buf.sample(64)
+    assert np.all(weights == 1.0)
+
+
+def test_priorities_update_and_weights_are_normalized():
+    np.random.seed(0)
+    buf, _ = filled(alpha=0.6)
+    td = np.zeros(len(buf))
+    td[:10] = 5.0  # 最初の10件だけ TD誤差が大きい
+    buf.update_priorities(np.arange(len(buf)), td)
+    np.testing.assert_allclose(buf.priority[:10], (5.0 + 1e-3) ** 0.6, rtol=1e-6)
+    np.testing.assert_allclose(buf.priority[10:], 1e-3 ** 0.6, rtol=1e-6)
+    assert buf.max_priority == pytest.approx(5.0 + 1e-3)
+
+    _, _, _, _, _, idx, weights = buf.sample(500, prioritized=True, beta=0.4)
+    assert np.mean(idx < 10) > 0.8  # 優先度の高い遷移が多く選ばれる（期待値は約0.9）
+    assert weights.max() == pytest.approx(1.0)
+    assert np.all((weights > 0) & (weights <= 1.0))
+    # 重み = (N * P(i))^-beta / max。優先度の高い遷移ほど小さい
+    p = buf.priority[:len(buf)].astype(np.float64)
+    p /= p.sum()
+    expected = (len(buf) * p[idx]) ** -0.4
+    np.testing.assert_allclose(weights, expected / expected.max(), rtol=1e-5)
+    assert weights[idx < 10].max() < weights[idx >= 10].min()
+
+    # 新しく入れた遷移は最大優先度
+    buf.add(np.zeros(2 + LIDAR_DIM, np.float32), 0, 0.0, np.zeros(2 + LIDAR_DIM, np.float32), False)
+    assert buf.priority[buf.pos - 1] == pytest.approx(buf.max_priority ** 0.6)
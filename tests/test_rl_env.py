@@ -0,0 +1,19 @@
+# GameEnv の観測バッファの型
+import numpy as np
+import pytest
+
+from rl_env import GameEnv
+
+
+@pytest.mark.parametrize("dtype", [np.float16, np.float32, np.float64])
+def test_float_obs_dtype(dtype):
+    env = GameEnv(mode="Step_1", obs_dtype=dtype, check_solvable=False)
+    state = env.reset()
+    assert state.dtype == dtype
+    assert 0.0 < state[2:].max() <= 1.0
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.int16, bool])
+def test_integer_obs_dtype_is_rejected(dtype):
+    with pytest.raises(ValueError):
+        GameEnv(mode="Step_1", obs_dtype=dtype, check_solvable=False)
@@ -0,0 +1,82 @@
+# ShardedQTable（シャードに分けた Qテーブル）が、1つの辞書の QAgent と同じ更新・同じ Q値になるか
+import threading
+
+import numpy as np
+import pytest
+
+from sharded_q import ShardClient, ShardedQAgent, ShardedQTable, decode_key, encode_states
+from train_rl import ACTION_SET, QAgent
+
+OBS_DIM = 6
+
+
+def random_batches(n_batches=5, batch=40, n_states=30, seed=0):
+    # 少ない状態から引くので、バッチ内・バッチ間で同じキーが何度も出てくる
+    rng = np.random.default_rng(seed)
+    pool = np.round(rng.uniform(-1, 1, size=(n_states, OBS_DIM)), 1)
+    for _ in range(n_batches):
+        s = pool[rng.integers(0, n_states, batch)]
+        s2 = pool[rng.integers(0, n_states, batch)]
+        a = rng.integers(0, len(ACTION_SET), batch)
+        r = rng.normal(size=batch)
+        d = rng.random(batch) < 0.1
+        yield s, a, r, s2, d
+
+
+@pytest.fixture
+def sharded():
+    # batch_capacity はバッチ全体より大きく（1往復で送れば td_update と同じ更新になる）
+    with ShardedQTable(num_shards=3, num_clients=1, obs_dim=OBS_DIM, batch_capacity=64) as table:
+        yield table, ShardedQAgent(ShardClient(**table.client_spec(0)))
+
+
+def test_encode_decode_matches_to_key():
+    states = np.random.default_rng(0).uniform(-3, 3, size=(50, OBS_DIM))
+    for state, code in zip(states, encode_states(states)):
+        assert decode_key(code) == QAgent.to_key(None, state)
+        assert decode_key(code.tobytes()) == QAgent.to_key(None, state)
+
+
+def test_update_batch_matches_single_dict(sharded):
+    table, agent = sharded
+    reference = QAgent(ACTION_SET, {}, threading.Lock())
+    for s, a, r, s2, d in random_batches():
+        td_ref = reference.update_batch(s, a, r, s2, dones=d)
+        td = agent.update_batch(s, a, r, s2, dones=d)
+        np.testing.assert_allclose(td, td_ref)
+    got = table.q_table()
+    assert got.keys() == reference.q_table.keys()
+    for key, row in reference.q_table.items():
+        np.testing.assert_allclose(got[key], row)
+    assert sum(table.shard_sizes()) == len(reference.q_table)
+
+
+def test_lookup_after_load(sharded):
+    table, agent = sharded
+    rng = np.random.default_rng(2)
+    states = np.round(rng.uniform(-1, 1, size=(40, OBS_DIM)), 1)
+    q_table = {QAgent.to_key(None, st): rng.normal(size=len(ACTION_SET)).tolist() for st in states[:30]}
+    table.load(q_table)
+    q, found, _ = agent.client.request(encode_states(states))
+    expected_found = [QAgent.to_key(None, st) in q_table for st in states]
+    np.testing.assert_array_equal(found, expected_found)
+    for st, row, hit in zip(states, q, found):
+        if hit:
+            np.testing.assert_allclose(row, q_table[QAgent.to_key(None, st)])
+    # 見つかった状態の貪欲行動は辞書の argmax と同じ
+    actions = agent.choose(q, found, eval_mode=True)
+    for st, action, hit in zip(states, actions, found):
+        if hit:
+            assert action == int(np.argmax(q_table[QAgent.to_key(None, st)]))
+
+
+def test_request_split_into_rounds():
+    # 1つのシャードに batch_capacity を超える行が行っても、全部の取得結果が元の順で返る
+    with ShardedQTable(num_shards=2, num_clients=1, obs_dim=OBS_DIM, batch_capacity=4) as table:
+        agent = ShardedQAgent(ShardClient(**table.client_spec(0)))
+        states = np.round(np.random.default_rng(3).uniform(-1, 1, size=(25, OBS_DIM)), 1)
+        q_table = {QAgent.to_key(None, st): [float(i)] * len(ACTION_SET) for i, st in enumerate(states)}
+        table.load(q_table)
+        q, found, _ = agent.client.request(encode_states(states))
+        assert found.all()
+        np.testing.assert_allclose(q[:, 0], [q_table[QAgent.to_key(None, st)][0] for st in states])
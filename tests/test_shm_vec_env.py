@@ -0,0 +1,45 @@
+# SharedMemoryVecEnv: 共有メモリ越しの step・自動リセットが、同じシードの NavEnv を1つずつ動かした結果と一致するか
+import numpy as np
+import pytest
+
+from nav_gym import NavEnv
+from shm_vec_env import SharedMemoryVecEnv
+
+MAX_STEPS = 5
+
+
+@pytest.fixture
+def envs():
+    envs = SharedMemoryVecEnv(num_workers=2, envs_per_worker=2, mode="Step_1", max_steps=MAX_STEPS)
+    yield envs
+    envs.close()
+
+
+def test_step_and_autoreset_match_single_envs(envs):
+    seed = 7
+    actions = np.random.default_rng(0).integers(0, envs.single_action_space.n, (MAX_STEPS + 2, envs.num_envs))
+    obs, _ = envs.reset(seed=seed)
+
+    refs = [NavEnv(mode="Step_1", max_steps=MAX_STEPS) for _ in range(envs.num_envs)]
+    ref_obs = np.stack([ref.reset(seed=seed + i)[0] for i, ref in enumerate(refs)])
+    np.testing.assert_array_equal(obs, ref_obs)
+
+    active = np.ones(envs.num_envs, dtype=bool)  # まだ最初のエピソード中（参照と比べられる）
+    n_done = 0
+    for t in range(MAX_STEPS + 2):
+        obs, rewards, terminated, truncated, infos = envs.step(actions[t])
+        for i in np.flatnonzero(active):
+            r_obs, r_reward, r_term, r_trunc, r_info = refs[i].step(actions[t, i])
+            assert rewards[i] == r_reward
+            assert (terminated[i], truncated[i]) == (r_term, r_trunc)
+            if r_term or r_trunc:
+                # 最後の観測は final_obs に退避され、obs の行はリセット後の観測になる
+                np.testing.assert_array_equal(infos["final_obs"][i], r_obs)
+                assert infos["outcome"][i] == r_info["outcome"]
+                assert infos["_final_obs"][i]
+                active[i] = False
+                n_done += 1
+            else:
+                np.testing.assert_array_equal(obs[i], r_obs)
+    # max_steps で全環境が一度は打ち切られている
+    assert n_done == envs.num_envs
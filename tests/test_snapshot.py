@@ -0,0 +1,92 @@
+# Game / GameEnv の snapshot / restore で同じ軌道・同じ障害物の動きをやり直せるか
+import random
+
+import numpy as np
+import pytest
+
+from game_simulator import Game
+from kinematics import ACTION_SET
+from rl_env import GameEnv
+
+
+def run(env, actions):
+    states = []
+    for action in actions:
+        state, reward, done, _ = env.step(action)
+        states.append((state.copy(), reward, done))
+        if done:
+            break
+    return states
+
+
+def test_restore_with_rng_reproduces_trajectory():
+    env = GameEnv(mode="Step_1")
+    env.reset()
+    actions = np.random.default_rng(0).integers(0, 21, 60)
+    snap = env.snapshot(include_rng=True)
+    start = env.get_state().copy()
+    first = run(env, actions)
+
+    np.testing.assert_array_equal(env.restore(snap), start)
+    second = run(env, actions)
+    assert len(first) == len(second)
+    for (s1, r1, d1), (s2, r2, d2) in zip(first, second):
+        np.testing.assert_array_equal(s1, s2)
+        assert r1 == r2 and d1 == d2
+
+
+def test_restore_into_another_env():
+    env = GameEnv(mode="Step_1")
+    env.reset()
+    snap = env.snapshot(include_rng=True)
+    actions = [0, 0, 5, 6, 0]
+    expected = run(env, actions)
+
+    other = GameEnv(mode="Step_1")
+    other.reset()
+    other.restore(snap)
+    got = run(other, actions)
+    for (s1, _, _), (s2, _, _) in zip(expected, got):
+        np.testing.assert_array_equal(s1, s2)
+
+
+def world_trajectory(game, actions):
+    # 障害物を動かしながらロボットを進め、各ステップの障害物の状態（位置・表示・タイマー）と姿勢を記録
+    out = []
+    for action in actions:
+        game.robot.update(*action)
+        game.update_world()
+        snap = game.snapshot(include_rng=False)
+        out.append((snap.obstacles.copy(), snap.pose.copy()))
+    return out
+
+
+@pytest.mark.parametrize("mode", ["Step_7", "Step_8"])
+def test_restore_reproduces_dynamic_obstacles(mode):
+    random.seed(3)
+    np.random.seed(3)
+    game = Game(mode=mode)
+    for _ in range(50):
+        game.update_world()
+    snap = game.snapshot(include_rng=True)
+    # 点滅ドア（200〜500刻み）・出没する障害物（60〜150刻み）が乱数を引くまで進める
+    actions = [ACTION_SET[i] for i in np.random.default_rng(0).integers(0, len(ACTION_SET), 600)]
+    first = world_trajectory(game, actions)
+    assert not np.array_equal(first[-1][0], snap.obstacles)  # 障害物が実際に動いている
+
+    # 進めた後で乱数を使っても、restore で戻る
+    random.random()
+    np.random.random()
+    game.restore(snap)
+    np.testing.assert_array_equal(game.snapshot(include_rng=False).obstacles, snap.obstacles)
+    second = world_trajectory(game, actions)
+    for (obs1, pose1), (obs2, pose2) in zip(first, second):
+        np.testing.assert_array_equal(obs1, obs2)
+        np.testing.assert_array_equal(pose1, pose2)
+
+    # 別の Game（別のモード）に戻しても同じ
+    other = Game(mode="Step_1")
+    other.restore(snap)
+    third = world_trajectory(other, actions)
+    for (obs1, _), (obs3, _) in zip(first, third):
+        np.testing.assert_array_equal(obs1, obs3)
@@ -0,0 +1,63 @@
+# StuckDetector: 停滞の3つの理由がそれぞれ出るか、普通に進む軌道では出ないか
+from types import SimpleNamespace
+
+import numpy as np
+
+from stuck_detector import StuckConfig, StuckDetector
+
+
+def run(detector, poses, states=None):
+    # poses: (x, y, angle) の列。最初の姿勢で reset し、残りで update。戻り値: 最初に出た理由（なければ None）
+    game = SimpleNamespace(robot=SimpleNamespace(x=0.0, y=0.0, angle=0.0))
+
+    def set_pose(pose):
+        game.robot.x, game.robot.y, game.robot.angle = pose
+
+    set_pose(poses[0])
+    detector.reset(game)
+    for t, pose in enumerate(poses[1:]):
+        set_pose(pose)
+        reason = detector.update(game, None if states is None else states[t])
+        if reason is not None:
+            return reason
+    return None
+
+
+def test_standing_still_is_no_progress():
+    cfg = StuckConfig(window=20, repeat_limit=0, oscillation_flips=0)
+    poses = [(100.0, 100.0, 0.0)] * 30
+    assert run(StuckDetector(cfg), poses) == "no_progress"
+
+
+def test_repeated_state_key():
+    # 位置は動いているが、状態キー（丸めた状態）が同じものばかり
+    cfg = StuckConfig(window=20, min_displacement=0, repeat_limit=10, oscillation_flips=0)
+    poses = [(100.0 + 3 * t, 100.0, 0.0) for t in range(30)]
+    states = [np.full(5, 0.51)] * 29
+    detector = StuckDetector(cfg)
+    assert run(detector, poses, states) == "repeated_state"
+    assert detector.triggered["repeated_state"] == 1
+
+
+def test_shaking_head_is_oscillation():
+    # 少しずつ動きながら左右に首を振る（no_progress にはならない範囲）
+    cfg = StuckConfig(window=20, min_displacement=10.0, repeat_limit=0, oscillation_flips=8, max_net_turn=45.0,
+                      oscillation_radius=50.0)
+    poses = [(100.0 + t, 100.0, 10.0 * (t % 2)) for t in range(30)]
+    assert run(StuckDetector(cfg), poses) == "oscillation"
+
+
+def test_normal_trajectory_is_not_stuck():
+    # 向きを少しずつ変えながら前に進み、状態も毎回変わる
+    rng = np.random.default_rng(0)
+    poses = [(100.0 + 4 * t, 100.0 + 2 * t, 2.0 * t) for t in range(200)]
+    states = [rng.uniform(0, 1, 5) for _ in range(199)]
+    detector = StuckDetector(StuckConfig(window=40))
+    assert run(detector, poses, states) is None
+    assert sum(detector.triggered.values()) == 0
+
+
+def test_short_episode_is_not_judged():
+    # window より短い間は位置・向きの判定をしない
+    cfg = StuckConfig(window=40, repeat_limit=0)
+    assert run(StuckDetector(cfg), [(100.0, 100.0, 0.0)] * 39) is None
@@ -5,77 +5,140 @@ import itertools
 import multiprocessing as mp
 import signal
 import sys
-from rl_env import GameEnv
+from rl_env import GameEnv, FailureStarts
 
 import os
+import time
 from torch.utils.tensorboard import SummaryWriter
 from rl_env import GameEnv
+from game_simulator import ROBOT_RADIUS
+from replay_buffer import ReplayBuffer
+from q_kernel import StateIndex, td_update, n_step_returns, q_lambda_update
+from kinematics import ACTION_SET, ActionTable
+import profiler
+from profiler import profiled
+from episode_stats import EpisodeStats, collect, early_stop_rule, save_results
+from dyna import DynaQAgent
+from path_planner import PotentialShaping, collect_demonstrations, prefill_agent, prefill_replay
+from stuck_detector import StuckDetector
+from ann_index import NeighborFallback
+
+def reward_features(env):
+    """
+    報酬計算に必要な生の特徴量だけを取り出す（報酬係数には依存しない）
+    - (角度差[deg], ゴールまでの距離[px], 直前行動の左右速度和, LiDAR最短距離)
+    - 同じ特徴量から improved_reward を任意の係数で再計算できる
+    """
+    # 終了判定・状態と同じ計算済みの位置関係を使う
+    geom = env.game.geometry()
+    angle_diff = geom.heading_error
+    goal_dist = geom.distance
 
-ACTION_SET = [
-    (4, 4), (2, 2), (0, 0), (-2, -2), (-4, -4),
-    (4, 2), (2, 4), (-4, -2), (-2, -4),
-    (4, 0), (0, 4), (-4, 0), (0, -4),
-    (2, 0), (0, 2), (-2, 0), (0, -2),
-    (2, -2), (-2, 2), (4, -4), (-4, 4),
-]
+    last_action = env.last_action if hasattr(env, 'last_action') else (0, 0)
 
-def improved_reward(env, state, done,
+    # step 内では直前の get_state で計算したLiDARをそのまま使う（二重にレイを飛ばさない）
+    lidar = env.lidar if hasattr(env, 'lidar') else env.game.get_lidar_distances()
+    min_dist = float(min(lidar)) if len(lidar) else 9999
+
+    return (angle_diff, goal_dist, sum(last_action), min_dist)
+
+def reward_from_features(features,
     angle_bonus=20, angle_penalty=-20,
     step_penalty=-0.1, goal_reward=100, goal_margin=30,
     forward_bonus=2, backward_penalty=-1,
     obstacle_avoid_bonus=1):
 
-    robot_angle = int(env.game.robot.angle) % 360
-    goal_angle = int(env.game.goal_angle) % 360
-    angle_diff = abs((robot_angle - goal_angle + 180) % 360 - 180)
+    angle_diff, goal_dist, action_sum, min_dist = features
     angle_norm = angle_diff / 180
 
-    # ゴール判定
-    if hasattr(env.game, "check_goal"):
-        if env.game.check_goal(margin=goal_margin):
-            return goal_reward
-    else:
-        if angle_diff <= goal_margin:
-            return goal_reward
+    # ゴール判定（Game.check_goal(margin=goal_margin) と同じ条件）
+    if goal_dist < ROBOT_RADIUS + 10 and angle_diff <= goal_margin:
+        return goal_reward
 
     reward = step_penalty
     reward += angle_bonus * (1.0 - angle_norm)
     reward += angle_penalty * angle_norm
 
     # 1. 前進/後退アクションに応じて報酬
-    last_action = env.last_action if hasattr(env, 'last_action') else (0, 0)
-    if sum(last_action) > 0:
+    if action_sum > 0:
         reward += forward_bonus
-    elif sum(last_action) < 0:
+    elif action_sum < 0:
         reward += backward_penalty
 
     # 2. 障害物との最短距離によって報酬（例: 50px以上離れてたら加点）
-    lidar = env.game.get_lidar_distances()
-    min_dist = min(lidar) if lidar else 9999
     if min_dist > 50:
         reward += obstacle_avoid_bonus
 
     return reward
 
+@profiled("improved_reward")
+def improved_reward(env, state, done,
+    angle_bonus=20, angle_penalty=-20,
+    step_penalty=-0.1, goal_reward=100, goal_margin=30,
+    forward_bonus=2, backward_penalty=-1,
+    obstacle_avoid_bonus=1):
+
+    return reward_from_features(
+        reward_features(env),
+        angle_bonus=angle_bonus,
+        angle_penalty=angle_penalty,
+        step_penalty=step_penalty,
+        goal_reward=goal_reward,
+        goal_margin=goal_margin,
+        forward_bonus=forward_bonus,
+        backward_penalty=backward_penalty,
+        obstacle_avoid_bonus=obstacle_avoid_bonus,
+    )
+
 def worker(
-    seed, action_set, episodes, max_steps, q_table_queue,
+    seed, action_set, episodes, max_steps, stats_queue,
     lock, shared_q_table,
     angle_bonus, angle_penalty, step_penalty,
     forward_bonus, backward_penalty, obstacle_avoid_bonus,
-    goal_reward, goal_margin
+    goal_reward, goal_margin,
+    replay_capacity=0, replay_batch=32, replay_prioritized=False,
+    mode="Step_1", mode_weights=None, episode_offset=0, stop_event=None, lidar=None,
+    planning_steps=0, planning_prioritized=True, shaping_weight=0.0, demo_episodes=0, stuck=None,
+    hard_start_prob=0.0, multires=None, multires_min_visits=5, neighbor_k=0
 ):
     """
     - Qテーブル（shared_q_table）を全プロセスで共有
     - lockで排他制御しながらQ学習
     - TensorBoardに報酬・成功率も記録
+    - replay_capacity > 0 なら遷移をリプレイバッファに貯め、毎ステップ replay_batch 件を再学習
+    - mode にリストを渡すとエピソードごとにモードを混ぜる（episode_offset は探索率とログの通し番号用）
+    - エピソードごとの記録を stats_queue に流し、最後に終了通知（ゴール回数）を送る（episode_stats.collect で受け取る）
+    - stop_event がセットされたら次のエピソードに入らず終了
+    - lidar: LidarConfig（None なら既定の91本）。本数を減らすとステップが速くなるが状態の次元も変わる
+    - planning_steps > 0 なら Dyna-Q（dyna.DynaQAgent）で実ステップごとにモデルから追加で計画更新する
+    - shaping_weight > 0 なら経路計画の距離場によるポテンシャル整形を報酬に足す（path_planner.PotentialShaping）
+    - demo_episodes > 0 なら学習の前にお手本（path_planner の経路追従）のエピソードで Qテーブル・リプレイバッファを埋める
+    - stuck: StuckConfig を渡すと停滞したエピソードを max_steps を待たずに打ち切る（結果は "stuck"）
+    - hard_start_prob > 0 なら、その確率で過去に失敗したエピソードの少し手前から始める（rl_env.FailureStarts）
+    - multires: 粗い段階のリスト（multires_q.DEFAULT_LEVELS など）を渡すと、未知の状態では粗い段階の Q値で行動を選ぶ
+      （multires_q.MultiResQAgent。訪問回数が multires_min_visits 以上の最も細かい段階を使う）
+    - neighbor_k > 0 なら、Qテーブルにない状態では訪問済みの近い neighbor_k 個の状態の Q値で選ぶ（ann_index.NeighborFallback）
     """
 
     # 乱数シードを設定（再現性のため）
     random.seed(seed)
     np.random.seed(seed)
 
+    # 計測はワーカーごとに集計（fork 元の記録を引き継がない）
+    if profiler.ENABLED:
+        profiler.PROFILER.reset()
+
     # 共有Qテーブル＆ロックを使ってQAgent生成
-    agent = QAgent(action_set, shared_q_table, lock)
+    if multires is not None:
+        from multires_q import MultiResQAgent  # multires_q が QAgent を使うのでここで読み込む
+        agent = MultiResQAgent(action_set, shared_q_table, lock, levels=multires, min_visits=multires_min_visits)
+    else:
+        agent = QAgent(action_set, shared_q_table, lock)
+    multires_agent = agent if multires is not None else None
+    if neighbor_k > 0:
+        agent.fallback = NeighborFallback(k=neighbor_k)
+    if planning_steps > 0:
+        agent = DynaQAgent(agent, planning_steps=planning_steps, prioritized=planning_prioritized)
 
     # TensorBoardのログ設定
     log_dir = f"runs/seed_{seed}"
@@ -95,64 +158,150 @@ def worker(
             goal_reward=goal_reward,
             goal_margin=goal_margin,
         )
+    if shaping_weight > 0:
+        reward_fn = PotentialShaping(reward_fn, weight=shaping_weight)
 
     # 環境を初期化
-    env = GameEnv(reward_fn=reward_fn)
+    env = GameEnv(reward_fn=reward_fn, action_table=ActionTable(action_set), mode=mode, mode_weights=mode_weights, lidar=lidar)
+
+    # リプレイバッファ（遷移を使い捨てにせず何度も学習に使う）
+    # LiDAR は to_key と同じ0.1刻みで保存（取り出した状態が元の状態と同じキーになるように）
+    replay = ReplayBuffer(replay_capacity, lidar_dim=env.lidar_config.n_beams, lidar_scale=10) if replay_capacity > 0 else None
+
+    # お手本のエピソードで事前に学習（探索なしでゴールまでの価値を入れておく）
+    if demo_episodes > 0:
+        demos = collect_demonstrations(env, demo_episodes, max_steps)
+        prefill_agent(agent, demos)
+        if replay is not None:
+            prefill_replay(replay, demos)
+
+    # 停滞の検出（その場で止まる・回り続ける方策のエピソードを早めに打ち切る）
+    stuck_detector = StuckDetector(stuck) if stuck is not None else None
+
+    # 失敗の手前からの再開（マップを作り直さずスナップショットから戻す）
+    failure_starts = FailureStarts(prob=hard_start_prob) if hard_start_prob > 0 else None
 
     # ゴール成功回数の初期化
     goal_count = 0
 
     # エピソードを繰り返し実行
     for ep in range(episodes):
-        state = env.reset()
+        # 途中終了の指示（集計側の early stop）
+        if stop_event is not None and stop_event.is_set():
+            break
+        ep_start = time.time()
+        state = failure_starts.maybe_restore(env) if failure_starts is not None else None
+        if state is None:
+            state = env.reset()
+        if failure_starts is not None:
+            failure_starts.begin(env)
         episode_reward = 0  # エピソードの報酬合計
+        outcome = "timeout"
+        if stuck_detector is not None:
+            stuck_detector.reset(env.game)
 
         # ステップの繰り返し
         for step in range(max_steps):
-            action = agent.select_action(state, eval_mode=False, episode=ep)
+            # 行動はインデックスで扱う（環境側は ActionTable の表引き）
+            action = agent.select_action_index(state, eval_mode=False, episode=episode_offset + ep)
             next_state, reward, done, info = env.step(action)
 
-            # Q学習による更新
-            agent.update(state, action, reward, next_state)
+            # Q学習による更新（done はゴール・衝突による終了のみ。max_steps の打ち切りはブートストラップする）
+            agent.update(state, action, reward, next_state, done=done)
+
+            # リプレイバッファからの追加学習
+            if replay is not None:
+                replay.add(state, action, reward, next_state, done)
+                if len(replay) >= replay_batch:
+                    s, a, r, s2, d, idx, w = replay.sample(replay_batch, prioritized=replay_prioritized)
+                    td = agent.update_batch(s, a, r, s2, dones=d, weights=w)
+                    if replay_prioritized:
+                        replay.update_priorities(idx, td)
 
             # 状態を更新
             state = next_state
 
             # エピソードの報酬を加算
             episode_reward += reward
+            if failure_starts is not None:
+                failure_starts.record(env)
 
             # 終了判定（ゴール達成 or 時間切れ）
             if done:
-                if reward == goal_reward:
+                # 報酬の整形で値が変わるので、ゴールかどうかは報酬ではなく判定で見る
+                if env.game.check_goal():
                     goal_count += 1
+                    outcome = "goal"
+                else:
+                    outcome = "collision"
+                    if failure_starts is not None:
+                        failure_starts.failed()
+                break
+
+            # 停滞の打ち切り。最後の更新は done=False でブートストラップ済みなので、時間切れと同じ扱いになる
+            if stuck_detector is not None and stuck_detector.update(env.game, state) is not None:
+                outcome = "stuck"
+                if failure_starts is not None:
+                    failure_starts.failed()
                 break
 
+        # エピソードの記録を集計側へ
+        stats_queue.put((seed, episode_offset + ep, episode_reward, step + 1, outcome, time.time() - ep_start))
+
         # TensorBoardへログを書き込み
-        writer.add_scalar('Reward/Episode', episode_reward, ep)
-        writer.add_scalar('SuccessRate/Episode', goal_count / (ep + 1), ep)
-        if ep % 5 == 0:
-            print(f"ep={ep}, Qテーブル状態数={len(agent.q_table)}")
+        with profiler.section("logging"):
+            writer.add_scalar('Reward/Episode', episode_reward, episode_offset + ep)
+            writer.add_scalar('SuccessRate/Episode', goal_count / (ep + 1), episode_offset + ep)
+            if ep % 5 == 0:
+                print(f"ep={ep}, Qテーブル状態数={len(agent.q_table)}")
+        profiler.count("episodes")
+
+    # 解けないマップとして作り直した割合
+    if env.map_checker is not None:
+        writer.add_scalar('Maps/RejectedFraction', env.map_checker.rejected_fraction, episode_offset + episodes)
+        print(f"[seed={seed}] {env.map_checker.summary()}")
+    if stuck_detector is not None:
+        print(f"[seed={seed}] {stuck_detector.summary()}")
+    if multires_agent is not None:
+        print(f"[seed={seed}] {multires_agent.summary()}")
+    if agent.fallback is not None:
+        print(f"[seed={seed}] {agent.fallback.summary()}")
 
     # TensorBoardのログ書き込み終了
     writer.close()
 
-    # 最終結果をキューに保存（メインプロセスへ結果を返す）
-    q_table_queue.put(goal_count)
+    # 計測結果（NAV_PROFILE=1 のときのみ）
+    if profiler.ENABLED:
+        print(f"\n[profile seed={seed}]\n{profiler.PROFILER.summary()}")
+        profiler.PROFILER.dump_chrome_trace(os.path.join(log_dir, "profile_trace.json"))
+
+    # 終了通知（ゴール回数）をメインプロセスへ
+    stats_queue.put((seed, None, goal_count, 0, "done", 0.0))
 
 
 
 
 class QAgent:
-    def __init__(self, action_set, q_table, lock):
+    def __init__(self, action_set, q_table, lock, fallback=None):
         self.q_table = q_table  # Manager.dict()で共有
         self.action_set = action_set
-        self.lock = lock
+        # 計測が有効ならロック待ち時間も記録する
+        self.lock = profiler.TimedLock(lock, "QAgent.lock_wait") if profiler.ENABLED else lock
+        # 行動 → インデックス（毎回 list.index で線形探索しないように）
+        self.action_index = {a: i for i, a in enumerate(action_set)}
+        # Qテーブルにない状態の Q値を補うもの（ann_index.NeighborFallback など。add(key) と q_values(agent, state) を持つ）
+        self.fallback = fallback
 
     def to_key(self, state):
         # 状態の丸め方は適宜調整
-        return tuple(np.round(state, 1))
+        # float32 の状態でも従来と同じ float64 のキーになるよう、丸める前に float64 に揃える
+        return tuple(np.round(np.asarray(state, dtype=np.float64), 1))
 
     def select_action(self, state, eval_mode=False, episode=0):
+        return self.action_set[self.select_action_index(state, eval_mode=eval_mode, episode=episode)]
+
+    @profiled("QAgent.select_action")
+    def select_action_index(self, state, eval_mode=False, episode=0):
         epsilon = max(0.02, 0.5 * (0.99 ** episode))  # 探索率
         key = self.to_key(state)
         with self.lock:
@@ -160,41 +309,136 @@ class QAgent:
                 # Qテーブルに状態があれば最大値行動、なければランダム
                 if key in self.q_table:
                     q_vals = np.array(self.q_table[key])
-                    return self.action_set[int(np.argmax(q_vals))]
-                else:
-                    return random.choice(self.action_set)
+                    return int(np.argmax(q_vals))
+                elif self.fallback is None:
+                    return random.randrange(len(self.action_set))
             else:
-                return random.choice(self.action_set)
-
-    def update(self, state, action, reward, next_state, alpha=0.1, gamma=0.99):
+                return random.randrange(len(self.action_set))
+        # テーブルにない状態: fallback が近い状態の Q値を返せばそれで選ぶ（fallback が q_table を読むのでロックの外で）
+        q_vals = self.fallback.q_values(self, state)
+        if q_vals is None:
+            return random.randrange(len(self.action_set))
+        return int(np.argmax(q_vals))
+
+    def to_action_index(self, action):
+        # 行動インデックスでも (v_left, v_right) のタプルでも受け付ける
+        if isinstance(action, (int, np.integer)):
+            return int(action)
+        return self.action_index[action]
+
+    @profiled("QAgent.update")
+    def update(self, state, action, reward, next_state, alpha=0.1, gamma=0.99, done=False):
+        # done=True（ゴール・衝突で終了）なら次状態の価値を足さない。時間切れ（打ち切り）は done=False のまま
         key = self.to_key(state)
         next_key = self.to_key(next_state)
-        idx = self.action_set.index(action)
+        idx = self.to_action_index(action)
         with self.lock:
             # 必ずlistで保存・読み出し時はnp.arrayに
             if key not in self.q_table:
                 self.q_table[key] = [0.0] * len(self.action_set)
-            if next_key in self.q_table:
+            if not done and next_key in self.q_table:
                 max_next = max(self.q_table[next_key])
             else:
                 max_next = 0.0
             q_vals = list(self.q_table[key])
-            q_vals[idx] += alpha * (reward + gamma * max_next - q_vals[idx])
+            td = reward + gamma * max_next - q_vals[idx]
+            q_vals[idx] += alpha * td
             self.q_table[key] = q_vals  # listで上書き
             if random.random() < 0.001:  # あまり多すぎないようにランダム
                 print(f"Qテーブルの状態数: {len(self.q_table)}")
-
-def analyze_and_report(results):
-    # ソート
+        if self.fallback is not None:
+            self.fallback.add(key)
+        return td
+
+    @profiled("QAgent.update_batch")
+    def update_batch(self, states, action_idx, rewards, next_states, dones=None,
+                     alpha=0.1, gamma=0.99, discounts=None, weights=None):
+        """
+        - 複数の遷移をまとめて更新（q_kernel.td_update）
+        - 関係するキーの行をロック1回で読み出し → 配列で更新 → 更新した行だけ書き戻す
+        - discounts を渡すと gamma * (1 - done) の代わりに使う（nステップ収益用）
+        - weights を渡すと遷移ごとに更新幅を掛ける（優先度付きリプレイの重要度サンプリングの補正）
+        - 戻り値: 各遷移のTD誤差
+        """
+        keys = [self.to_key(st) for st in states]
+        next_keys = [self.to_key(st) for st in next_states]
+        if discounts is None:
+            done_arr = np.zeros(len(keys)) if dones is None else np.asarray(dones, dtype=np.float64)
+            discounts = gamma * (1.0 - done_arr)
+        return self.update_keys(keys, action_idx, rewards, next_keys, discounts, alpha=alpha, weights=weights)
+
+    def update_keys(self, keys, action_idx, rewards, next_keys, discounts, alpha=0.1, weights=None):
+        # update_batch の本体（状態キーで受け取る。Dyna のモデルからの計画更新でも使う）
+        index = StateIndex(len(self.action_set), capacity=2 * len(keys))
+        s = index.lookup(keys)
+        s2 = index.lookup(next_keys)
+        with self.lock:
+            rows = [self.q_table.get(key) for key in index.keys]
+            for i, row in enumerate(rows):
+                if row is not None:
+                    index.q[i] = row
+            td = td_update(index.q, s, action_idx, rewards, s2, discounts, alpha=alpha, weights=weights)
+            for sid in np.unique(s):
+                self.q_table[index.keys[sid]] = index.q[sid].tolist()
+        if self.fallback is not None:
+            for sid in np.unique(s):
+                self.fallback.add(index.keys[sid])
+        return td
+
+    @profiled("QAgent.update_trajectory")
+    def update_trajectory(self, states, action_idx, rewards, dones,
+                          alpha=0.1, gamma=0.99, n_step=1, lam=None):
+        """
+        - 1エピソード分（states は長さT+1）をまとめて更新
+        - n_step > 1 なら nステップ収益、lam を指定すると Q(λ)（適格度トレース）
+        """
+        states = list(states)
+        if lam is None:
+            G, boot, discounts = n_step_returns(rewards, dones, gamma=gamma, n=n_step)
+            return self.update_batch(
+                states[:-1], action_idx, G, [states[b] for b in boot],
+                alpha=alpha, gamma=gamma, discounts=discounts,
+            )
+        keys = [self.to_key(st) for st in states]
+        index = StateIndex(len(self.action_set), capacity=len(keys))
+        ids = index.lookup(keys)
+        with self.lock:
+            for i, key in enumerate(index.keys):
+                row = self.q_table.get(key)
+                if row is not None:
+                    index.q[i] = row
+            td = q_lambda_update(
+                index.q, ids[:-1], action_idx, rewards, ids[1:], dones,
+                alpha=alpha, gamma=gamma, lam=lam,
+            )
+            for sid in np.unique(ids[:-1]):
+                self.q_table[index.keys[sid]] = index.q[sid].tolist()
+        if self.fallback is not None:
+            for sid in np.unique(ids[:-1]):
+                self.fallback.add(index.keys[sid])
+        return td
+
+def save_q_table(q_table, path):
+    # 共有辞書（Manager.dict）でも copy() で普通の辞書にしてから保存
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        pickle.dump(q_table.copy(), f)
+
+def load_q_table(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def analyze_and_report(results, label="成功回数"):
+    # ソート（label は表示用。スコアが成功率なら "成功率"）
     results_sorted = sorted(results, key=lambda x: x[1], reverse=True)
-    print("\n==== 成功回数の多い組み合わせ TOP3 ====")
+    print(f"\n==== {label}の高い組み合わせ TOP3 ====")
     for params, score in results_sorted[:3]:
-        print(f"成功回数={score} → {params}")
-    print("\n==== 成功回数の少ない組み合わせ WORST3 ====")
+        print(f"{label}={score:.4g} → {params}")
+    print(f"\n==== {label}の低い組み合わせ WORST3 ====")
     for params, score in results_sorted[-3:]:
-        print(f"成功回数={score} → {params}")
+        print(f"{label}={score:.4g} → {params}")
     all_scores = [score for _, score in results]
-    print(f"\n全体統計: 最大={max(all_scores)}, 最小={min(all_scores)}, 平均={np.mean(all_scores):.2f}")
+    print(f"\n全体統計: 最大={max(all_scores):.4g}, 最小={min(all_scores):.4g}, 平均={np.mean(all_scores):.4g}")
 
 def grid_search():
     import multiprocessing as mp
@@ -213,13 +457,21 @@ def grid_search():
     obstacle_avoid_bonus_list = [0]
 
     N_PROCS = 13
+    Q_TABLE_DIR = "q_tables"
     EPISODES = 130  # 合計エピソード数（例: 1プロセス10回→合計130回にしたい場合は130）
     episodes_per_proc = EPISODES // N_PROCS
     MAX_STEPS = 200
+    RESULTS_PATH = "runs/grid_search_results.json"  # 途中経過の保存先
+    # 組み合わせの途中打ち切り（直近の成功率が十分高い/見込みがない場合）
+    # 打ち切った組み合わせはエピソード数が少なくなるので、組み合わせの比較は成功回数ではなく成功率で行う
+    early_stop = early_stop_rule(min_episodes=50, success_above=0.9)
+    SUCCESS_TARGET = 0.9  # 成功率がこれ以上の組み合わせが見つかったら探索を終える
 
     best_score = -1
     best_params = None
     results = []  # ログ保存用
+    current = {}  # 実行中の組み合わせ（params, stats）
+    main_pid = os.getpid()
 
     param_grid = list(itertools.product(
         angle_bonus_list, angle_penalty_list, step_penalty_list,
@@ -229,8 +481,16 @@ def grid_search():
 
     # Ctrl+Cハンドラ
     def signal_handler(sig, frame):
+        # fork したワーカーにもハンドラが引き継がれるので、集計・保存はメインプロセスだけで行う
+        if os.getpid() != main_pid:
+            sys.exit(0)
         print("\n[Ctrl+C] 中断されました。ここまでの集計を表示します。")
-        analyze_and_report(results)
+        if current:
+            print(f"実行中の組み合わせ {current['params']}: {current['stats'].summary()}")
+        save_results(RESULTS_PATH, results, current or None)
+        print(f"途中経過を {RESULTS_PATH} に保存しました。")
+        if results:
+            analyze_and_report(results, label="成功率")
         sys.exit(0)
     signal.signal(signal.SIGINT, signal_handler)
 
@@ -254,48 +514,55 @@ def grid_search():
         shared_q_table = manager.dict()
         lock = manager.Lock()
 
-        q_table_queue = mp.Queue()
+        # エピソードごとの記録を受け取るキューと途中終了の合図
+        stats_queue = mp.Queue()
+        stop_event = mp.Event()
+        stats = EpisodeStats()
+        current.update(params=params, stats=stats)
         procs = []
         for j in range(N_PROCS):
             p = mp.Process(
                 target=worker,
                 args=(
-                    j, ACTION_SET, episodes_per_proc, MAX_STEPS, q_table_queue,
+                    j, ACTION_SET, episodes_per_proc, MAX_STEPS, stats_queue,
                     lock, shared_q_table,
                     angle_bonus, angle_penalty, step_penalty,
                     forward_bonus, backward_penalty, obstacle_avoid_bonus,
                     goal_reward, goal_margin
-                )
+                ),
+                kwargs=dict(stop_event=stop_event),
             )
             procs.append(p)
             p.start()
 
-        goal_count_total = 0
-        for _ in range(N_PROCS):
-            worker_goal_count = q_table_queue.get()
-            goal_count_total += worker_goal_count
+        goal_count_total = collect(stats_queue, N_PROCS, stats, stop_event=stop_event, early_stop=early_stop, procs=procs)
         for p in procs:
             p.join()
 
-        print(f"成功回数: {goal_count_total} / {episodes_per_proc * N_PROCS}")
+        score = stats.success_rate()
+        print(f"成功回数: {goal_count_total} / {stats.episodes}（{stats.summary()}）")
+
+        # 学習済みQテーブルを保存（evaluate.py で評価できるように）
+        save_q_table(shared_q_table, os.path.join(Q_TABLE_DIR, f"combo_{i}.pkl"))
 
         # ログに追加
-        results.append((params, goal_count_total))
+        results.append((params, score))
+        current.clear()
+        save_results(RESULTS_PATH, results)
 
-        if goal_count_total > best_score:
-            best_score = goal_count_total
+        if score > best_score:
+            best_score = score
             best_params = params
 
-        if goal_count_total > 100:
-            print("\n✅ 成功回数が30を超えたため中断します。")
+        if score >= SUCCESS_TARGET:
+            print(f"\n✅ 成功率が{SUCCESS_TARGET:.0%}以上になったため中断します。")
             break
 
-    analyze_and_report(results)
+    analyze_and_report(results, label="成功率")
 
 
 import subprocess
 import webbrowser
-import time
 
 def launch_tensorboard(logdir="runs", port=6006):
     # TensorBoardをバックグラウンドで起動
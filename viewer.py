@@ -0,0 +1,271 @@
+# viewer.py
+# 学習済み方策の観察用ビューア（描画レートをシミュレーションから切り離す）と、軌跡の記録・再生
+#
+# - watch: 方策を全速で動かし、描画だけ render_fps を上限に間引く（描画のせいで方策の実行が遅くならない）
+# - record: 描画なしで1エピソード走らせ、姿勢・行動・報酬・LiDAR・動く障害物を .npz（圧縮）に保存
+# - replay: 保存した軌跡をシミュレーションなしで任意の速度で再生（スペース: 一時停止、←→: コマ送り、↑↓: 速度、Esc: 終了）
+#   python viewer.py watch q_tables/combo_0.pkl --mode Step_2
+#   python viewer.py record q_tables/combo_0.pkl --mode Step_2 --seed 3 --out runs/traj/step2_seed3.npz
+#   python viewer.py replay runs/traj/step2_seed3.npz --speed 4
+import argparse
+import contextlib
+import json
+import os
+import random
+import time
+
+import numpy as np
+import pygame
+
+from game_simulator import (
+    GAME_WIDTH, GAME_HEIGHT, FPS, RENDER_FPS, WHITE, Robot,
+    draw_goal_marker, draw_lidar_rays,
+)
+from rl_env import GameEnv
+from train_rl import ACTION_SET, QAgent, load_q_table
+
+
+class TrajectoryRecorder:
+    """
+    - Game の状態を1刻みずつ記録する（Game.run(recorder=...) や record_episode から使う）
+    - 壁・静的障害物は最初に1回だけ、点滅ドア・動的障害物は毎刻みの位置と表示状態を持つ
+    - save() で np.savez_compressed（姿勢 float32、矩形 int16、LiDAR uint16）
+    """
+    def __init__(self, game, initial_lidar=None, **meta):
+        # initial_lidar: 開始時点のLiDAR（省略時はここで計算）
+        self.meta = dict(meta, mode=game.mode)
+        static = game.wall_obstacles + game.obstacles
+        self.static_rects = np.array([tuple(o.rect) for o in static], dtype=np.int16).reshape(-1, 4)
+        self.static_colors = np.array([o.color for o in static], dtype=np.uint8).reshape(-1, 3)
+        self.static_visible = np.array([o.visible for o in static], dtype=bool)
+        dynamic = game.blinking_doors + game.dynamic_obstacles
+        self.dyn_colors = np.array([o.color for o in dynamic], dtype=np.uint8).reshape(-1, 3)
+        self.goal = np.array([game.goal_x, game.goal_y, game.goal_angle], dtype=np.float32)
+        self.beam_angles = np.array(game.lidar_config.angles, dtype=np.float32)
+        self.poses, self.actions, self.rewards, self.lidar = [], [], [], []
+        self.dyn_rects, self.dyn_visible = [], []
+        if initial_lidar is None:
+            initial_lidar = game.get_lidar_distances()
+        self._snapshot(game, initial_lidar)
+
+    def _snapshot(self, game, lidar_distances):
+        robot = game.robot
+        self.poses.append((robot.x, robot.y, robot.angle))
+        dynamic = game.blinking_doors + game.dynamic_obstacles
+        self.dyn_rects.append([tuple(o.rect) for o in dynamic])
+        self.dyn_visible.append([o.visible for o in dynamic])
+        if lidar_distances is not None:
+            self.lidar.append(np.array(lidar_distances))
+
+    def record(self, game, action, lidar_distances=None, reward=0.0):
+        # action は (v_left, v_right)。記録されるのは行動「後」の状態
+        self._snapshot(game, lidar_distances)
+        self.actions.append(action)
+        self.rewards.append(reward)
+
+    def save(self, path, **meta):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        n_dyn = len(self.dyn_colors)
+        arrays = dict(
+            poses=np.array(self.poses, dtype=np.float32),
+            actions=np.array(self.actions, dtype=np.float32).reshape(-1, 2),
+            rewards=np.array(self.rewards, dtype=np.float32),
+            static_rects=self.static_rects,
+            static_colors=self.static_colors,
+            static_visible=self.static_visible,
+            dyn_rects=np.array(self.dyn_rects, dtype=np.int16).reshape(len(self.poses), n_dyn, 4),
+            dyn_visible=np.array(self.dyn_visible, dtype=bool).reshape(len(self.poses), n_dyn),
+            dyn_colors=self.dyn_colors,
+            goal=self.goal,
+            beam_angles=self.beam_angles,
+            meta=np.array(json.dumps({**self.meta, **meta}, ensure_ascii=False)),
+        )
+        # record() でLiDARを渡さなかった刻みがある場合はLiDARを保存しない（長さを姿勢と揃えるため）
+        if len(self.lidar) == len(self.poses):
+            arrays["lidar"] = np.rint(np.array(self.lidar)).astype(np.uint16)
+        np.savez_compressed(path, **arrays)
+        return path
+
+
+def _policy(q_table, action_set):
+    if isinstance(q_table, str):
+        q_table = load_q_table(q_table)
+    return QAgent(action_set, q_table, contextlib.nullcontext())
+
+
+def record_episode(q_table, path, mode="Step_1", seed=0, max_steps=200, lidar=None, action_set=ACTION_SET):
+    """
+    - 貪欲方策で1エピソード走らせ（描画なし）、軌跡を path に保存
+    - seed の扱いは evaluate.run_scenario と同じ（同じ seed なら同じマップ・初期配置）
+    - 戻り値: (結果["goal"|"collision"|"timeout"], ステップ数)
+    """
+    agent = _policy(q_table, action_set)
+    random.seed(seed)
+    np.random.seed(seed)
+    env = GameEnv(mode=mode, lidar=lidar)
+    state = env.reset()
+    recorder = TrajectoryRecorder(env.game, env.lidar, seed=seed, max_steps=max_steps)
+    outcome, steps = "timeout", 0
+    for steps in range(1, max_steps + 1):
+        action = agent.select_action_index(state, eval_mode=True)
+        state, reward, done, info = env.step(action)
+        recorder.record(env.game, env.action_table.action_set[action], env.lidar.copy(), reward)
+        if done:
+            outcome = "goal" if env.game.check_goal() else "collision"
+            break
+    recorder.save(path, outcome=outcome, steps=steps)
+    return outcome, steps
+
+
+def watch(q_table, mode="Step_1", seed=None, max_steps=200, episodes=1, render_fps=30, sim_fps=None,
+          record_dir=None, lidar=None, action_set=ACTION_SET):
+    """
+    - 方策を動かしながら表示する。描画は render_fps を上限に間引き、シミュレーションは sim_fps（None なら全速）
+    - record_dir を渡すと各エピソードの軌跡も保存する
+    """
+    agent = _policy(q_table, action_set)
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    env = GameEnv(mode=mode, lidar=lidar)
+    clock = pygame.time.Clock()
+    render_interval = 1.0 / render_fps
+    for ep in range(episodes):
+        state = env.reset()
+        game = env.game
+        recorder = TrajectoryRecorder(game, env.lidar, seed=seed, episode=ep) if record_dir else None
+        next_render = 0.0
+        outcome = "timeout"
+        for step in range(max_steps):
+            if sim_fps:
+                clock.tick(sim_fps)
+            action = agent.select_action_index(state, eval_mode=True)
+            state, reward, done, info = env.step(action)
+            game.step_count = step + 1
+            if recorder:
+                recorder.record(game, env.action_table.action_set[action], env.lidar.copy(), reward)
+            now = time.perf_counter()
+            if now >= next_render or done:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        return
+                game.draw(env.lidar)
+                next_render = now + render_interval
+            if done:
+                outcome = "goal" if game.check_goal() else "collision"
+                break
+        print(f"[watch] ep={ep} {outcome} steps={step + 1}")
+        if recorder:
+            recorder.save(os.path.join(record_dir, f"{mode}_ep{ep}.npz"), outcome=outcome, steps=step + 1)
+    pygame.quit()
+
+
+def load_trajectory(path):
+    with np.load(path) as data:
+        traj = {key: data[key] for key in data.files}
+    traj["meta"] = json.loads(str(traj["meta"]))
+    return traj
+
+
+def replay(path, speed=1.0, steps_per_sec=FPS, render_fps=RENDER_FPS, show_lidar=True):
+    """
+    - 記録した軌跡を再生（シミュレーションはしない）
+    - speed=1 で記録時の刻み（steps_per_sec）と同じ速さ。描画は render_fps を上限にし、速いときはコマを飛ばす
+    """
+    traj = load_trajectory(path)
+    poses = traj["poses"]
+    n = len(poses)
+    pygame.init()
+    screen = pygame.display.set_mode((GAME_WIDTH, GAME_HEIGHT))
+    pygame.display.set_caption(f"replay: {os.path.basename(path)}")
+    font = pygame.font.SysFont("sans-serif", 24)
+    clock = pygame.time.Clock()
+
+    # 動かない物は背景として1回だけ描いておく
+    background = pygame.Surface((GAME_WIDTH, GAME_HEIGHT))
+    background.fill(WHITE)
+    for rect, color, visible in zip(traj["static_rects"], traj["static_colors"], traj["static_visible"]):
+        if visible:
+            pygame.draw.rect(background, tuple(int(c) for c in color), pygame.Rect(*map(int, rect)))
+    gx, gy, gangle = traj["goal"]
+    draw_goal_marker(background, int(gx), int(gy), float(gangle))
+    dyn_colors = [tuple(int(c) for c in color) for color in traj["dyn_colors"]]
+    lidar = traj.get("lidar") if show_lidar else None
+    robot = Robot(0, 0)
+
+    t = 0.0  # 再生位置（ステップ、小数）
+    paused = False
+    running = True
+    while running:
+        dt = clock.tick(render_fps) / 1000.0
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    running = False
+                elif event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_RIGHT:
+                    t = min(n - 1, int(t) + 1)
+                elif event.key == pygame.K_LEFT:
+                    t = max(0, int(t) - 1)
+                elif event.key == pygame.K_UP:
+                    speed *= 2
+                elif event.key == pygame.K_DOWN:
+                    speed /= 2
+        if not paused:
+            t = min(n - 1, t + dt * steps_per_sec * speed)
+        i = int(t)
+
+        screen.blit(background, (0, 0))
+        for rect, visible, color in zip(traj["dyn_rects"][i], traj["dyn_visible"][i], dyn_colors):
+            if visible:
+                pygame.draw.rect(screen, color, pygame.Rect(*map(int, rect)))
+        robot.x, robot.y, robot.angle = (float(v) for v in poses[i])
+        robot.draw(screen)
+        if lidar is not None:
+            draw_lidar_rays(screen, robot.x, robot.y, robot.angle, traj["beam_angles"], lidar[i])
+        meta = traj["meta"]
+        text = f"{meta.get('mode')} step {i}/{n - 1} x{speed:g} {meta.get('outcome', '')}" + (" [一時停止]" if paused else "")
+        screen.blit(font.render(text, True, (0, 0, 0)), (10, 10))
+        pygame.display.flip()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="方策の観察・軌跡の記録と再生")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("watch", help="方策を動かしながら表示")
+    p.add_argument("q_table")
+    p.add_argument("--mode", default="Step_1")
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--episodes", type=int, default=1)
+    p.add_argument("--max-steps", type=int, default=200)
+    p.add_argument("--render-fps", type=int, default=30)
+    p.add_argument("--sim-fps", type=int, default=None, help="指定しなければ全速")
+    p.add_argument("--record-dir", default=None)
+
+    p = sub.add_parser("record", help="描画なしで1エピソード記録")
+    p.add_argument("q_table")
+    p.add_argument("--mode", default="Step_1")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--max-steps", type=int, default=200)
+    p.add_argument("--out", required=True)
+
+    p = sub.add_parser("replay", help="記録した軌跡を再生")
+    p.add_argument("path")
+    p.add_argument("--speed", type=float, default=1.0)
+    p.add_argument("--steps-per-sec", type=float, default=FPS)
+    p.add_argument("--no-lidar", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "watch":
+        watch(args.q_table, mode=args.mode, seed=args.seed, max_steps=args.max_steps, episodes=args.episodes,
+              render_fps=args.render_fps, sim_fps=args.sim_fps, record_dir=args.record_dir)
+    elif args.command == "record":
+        outcome, steps = record_episode(args.q_table, args.out, mode=args.mode, seed=args.seed, max_steps=args.max_steps)
+        print(f"{args.out}: {outcome} ({steps} steps)")
+    else:
+        replay(args.path, speed=args.speed, steps_per_sec=args.steps_per_sec, show_lidar=not args.no_lidar)